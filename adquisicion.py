@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from sensor_core import SensorManager, CAMPOS
+from sensor_async import AsyncSensorManager
+from memoria_compartida import PublicadorMemoria, RUTA_MEMORIA
+from instrumentacion import INSTRUMENTOS
+
+# Demonio de adquisición: un único proceso abre el broker y /dev/ttyUSB0 y reparte
+# las muestras por un socket Unix a todos los monitores y loggers que se conecten.
+#
+# Protocolo: una línea JSON por mensaje.
+#   {"tipo": "lectura", "campos": {...}}                           al conectar (estado completo)
+#   {"tipo": "muestra", "seq": n, "origen": "mqtt", "t": ..., "campos": {...}}   por cada actualización
+SOCKET_DAEMON = "/tmp/secador_adquisicion.sock"
+COLA_CLIENTE = 1024  # Muestras pendientes por cliente antes de descartar las viejas
+RECONEXION_S = 1.0
+
+
+def _linea(mensaje):
+    return (json.dumps(mensaje, separators=(",", ":")) + "\n").encode()
+
+
+class DaemonAdquisicion:
+    """Dueño único de los dispositivos; sirve las muestras por SOCKET_DAEMON"""
+
+    def __init__(self, ruta_socket=SOCKET_DAEMON, ruta_memoria=RUTA_MEMORIA):
+        self.ruta_socket = ruta_socket
+        self.ruta_memoria = ruta_memoria  # None: no publicar el segmento compartido
+        self.manager = AsyncSensorManager()
+        self.clientes = 0
+        # Muestra -> línea ya serializada: cada muestra se codifica una vez aunque haya
+        # muchos clientes. Guarda las últimas COLA_CLIENTE (lo más que puede atrasarse uno)
+        self._codificadas = {}
+
+    def _codificar(self, muestra):
+        linea = self._codificadas.get(muestra)
+        if linea is None:
+            linea = self._codificadas[muestra] = _linea({
+                "tipo": "muestra", "seq": muestra.seq, "origen": muestra.origen,
+                "t": muestra.t, "campos": muestra.campos,
+            })
+            if len(self._codificadas) > COLA_CLIENTE:
+                del self._codificadas[next(iter(self._codificadas))]
+        return linea
+
+    async def _atender(self, reader, writer):
+        suscripcion = self.manager.subscribe_async(COLA_CLIENTE)
+        self.clientes += 1
+        try:
+            # Primero el estado completo, después solo los cambios
+            writer.write(_linea({"tipo": "lectura", "campos": self.manager.get_data().as_dict()}))
+            await writer.drain()
+            async for muestra in suscripcion:
+                writer.write(self._codificar(muestra))
+                # Un cliente lento solo se atrasa él: su cola descarta, la adquisición sigue
+                await writer.drain()
+        except (ConnectionError, BrokenPipeError):
+            pass
+        finally:
+            suscripcion.close()
+            self.clientes -= 1
+            writer.close()
+
+    async def run(self):
+        if os.path.exists(self.ruta_socket):
+            os.unlink(self.ruta_socket)  # Socket de una ejecución anterior que no se limpió
+        adquisicion = asyncio.create_task(self.manager.run())
+        publicador = None
+        if self.ruta_memoria:
+            # Además del socket, la última lectura queda en memoria compartida para lectores locales
+            publicador = PublicadorMemoria(self.manager, self.ruta_memoria)
+        server = await asyncio.start_unix_server(self._atender, path=self.ruta_socket)
+        try:
+            async with server:
+                await adquisicion
+        finally:
+            self.manager.stop()
+            if publicador is not None:
+                publicador.close()
+            if os.path.exists(self.ruta_socket):
+                os.unlink(self.ruta_socket)
+
+
+class ClienteSensores(SensorManager):
+    """SensorManager alimentado por el demonio en lugar de los dispositivos.
+
+    Tiene la misma API (get_data, subscribe, historial...), así que monitor.py y
+    logger.py lo usan sin cambios y pueden correr a la vez sin pelear por la balanza.
+    """
+
+    def __init__(self, ruta_socket=SOCKET_DAEMON, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ruta_socket = ruta_socket
+        self.conectado = False
+        self.invalidos = 0  # Mensajes del demonio que no se pudieron aplicar
+
+    def conectar(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.ruta_socket)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _recibir(self, sock):
+        while self.running:
+            try:
+                with sock, sock.makefile("rb") as entrada:
+                    self.conectado = True
+                    # Los enlaces reales los supervisa el demonio; aquí "conectado" es hacia él.
+                    # La vigencia de cada campo sigue midiéndose con los datos que llegan.
+                    for enlace in self.enlaces.enlaces.values():
+                        enlace.conectado()
+                    for linea in entrada:
+                        if not self.running:
+                            return
+                        self._procesar(linea)
+            except OSError:
+                pass
+            self.conectado = False
+            for enlace in self.enlaces.enlaces.values():
+                enlace.fallo("demonio de adquisición desconectado")
+            # El demonio se reinició o se cayó: reintentar hasta que vuelva
+            while self.running:
+                time.sleep(RECONEXION_S)
+                try:
+                    sock = self.conectar()
+                    break
+                except OSError:
+                    continue
+
+    def _procesar(self, linea):
+        # Un mensaje raro se descarta solo; nunca debe matar el hilo que recibe
+        try:
+            mensaje = json.loads(linea)
+            campos = mensaje.get("campos") if isinstance(mensaje, dict) else None
+            if not isinstance(campos, dict):
+                raise ValueError(f"mensaje sin campos: {linea[:80]!r}")
+            self._aplicar(mensaje.get("origen", "daemon"),
+                          {k: v for k, v in campos.items() if k in CAMPOS})
+        except Exception as e:
+            self.invalidos += 1
+            for enlace in self.enlaces.enlaces.values():
+                enlace.ultimo_error = f"mensaje del demonio descartado: {e!r}"
+
+    def start(self, sock=None):
+        if sock is None:
+            sock = self.conectar()
+        threading.Thread(target=self._recibir, args=(sock,), daemon=True).start()
+
+
+def crear_manager(usar_asyncio=False):
+    """Devuelve un cliente del demonio si está corriendo; si no, un manager propio con los dispositivos.
+
+    El manager devuelto ya está iniciado.
+    """
+    cliente = ClienteSensores()
+    try:
+        sock = cliente.conectar()
+    except OSError:
+        manager = AsyncSensorManager() if usar_asyncio else SensorManager()
+        manager.start()
+        return manager
+    cliente.start(sock)
+    return cliente
+
+
+if __name__ == "__main__":
+    ruta = sys.argv[1] if len(sys.argv) > 1 else SOCKET_DAEMON
+    INSTRUMENTOS.volcar_al_salir("adquisicion")
+    print(f"Demonio de adquisición escuchando en {ruta} (Ctrl+C para salir)")
+    try:
+        asyncio.run(DaemonAdquisicion(ruta).run())
+    except KeyboardInterrupt:
+        pass
+    print("Demonio detenido.")
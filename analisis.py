@@ -0,0 +1,274 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+import warnings
+import numpy as np
+from canales import CANALES, por_grupo
+import formato_binario
+import segmentos
+
+# Análisis posterior de capturas (Recolecciones/*.csv y *.secbin) con columnas NumPy.
+#
+# Cada archivo se parte en columnas una sola vez y cada columna se convierte a
+# float64 de un golpe; las métricas y el remuestreo trabajan sobre arrays, sin
+# recorrer filas en Python. Sirve para comparar cientos de corridas.
+
+# np.trapz pasó a llamarse np.trapezoid en numpy 2
+_integrar = getattr(np, "trapezoid", None) or np.trapz
+
+COLUMNA_A_CANAL = {canal.columna_csv: canal.nombre for canal in CANALES}
+TERMOPARES = tuple(canal.nombre for canal in por_grupo("proceso") if canal.nombre.startswith("termopar"))
+OBJETIVO_FRAC = 0.5  # Por defecto, "tiempo a objetivo" = tiempo hasta perder la mitad de la masa inicial
+# Las capturas segmentadas entran por su manifiesto; sus segmentos sueltos se saltan
+PATRONES = ("Recolecciones/*.csv", "Recolecciones/*" + segmentos.EXTENSION_MANIFIESTO)
+
+
+class Captura:
+    """Una corrida cargada: metadatos, tiempos y una columna float64 por canal"""
+
+    def __init__(self, ruta, muestra, recolector, t, columnas):
+        self.ruta = ruta
+        self.muestra = muestra
+        self.recolector = recolector
+        self.t = t                                   # datetime64[ms] de cada fila
+        self.t_s = (t - t[0]) / np.timedelta64(1, "s") if len(t) else np.zeros(0)
+        self.columnas = columnas                     # canal -> ndarray (NaN donde no hay dato)
+
+    def __len__(self):
+        return len(self.t)
+
+    def __getitem__(self, canal):
+        return self.columnas[canal]
+
+    def __repr__(self):
+        return f"Captura({os.path.basename(self.ruta)!r}, filas={len(self)})"
+
+
+def _vacia(ruta, muestra="", recolector=""):
+    """Captura sin filas (solo encabezado, captura abortada): todas las columnas existen, vacías"""
+    return Captura(ruta, muestra, recolector, np.zeros(0, dtype="datetime64[ms]"),
+                   {canal: np.full(0, np.nan) for canal in COLUMNA_A_CANAL.values()})
+
+
+def _a_float(valores):
+    """Convierte una columna de texto a float64; vacíos y basura quedan como NaN"""
+    arr = np.asarray(valores, dtype=object)
+    try:
+        return np.asarray(arr, dtype=np.float64)
+    except ValueError:
+        pass
+    # Columnas sucias: booleanos de los ventiladores y vacíos se resuelven con máscaras
+    texto = np.char.strip(arr.astype(str))
+    salida = np.full(len(texto), np.nan)
+    verdadero = texto == "True"
+    falso = texto == "False"
+    salida[verdadero] = 1.0
+    salida[falso] = 0.0
+    resto = np.flatnonzero(~(verdadero | falso) & (texto != ""))
+    try:
+        salida[resto] = texto[resto].astype(np.float64)
+        return salida
+    except ValueError:
+        pass
+    # Camino lento solo si queda basura: restos del buffer de la balanza
+    # (".98   0.799" -> último número, igual que common_data.jl) o comas decimales
+    for i in resto:
+        try:
+            salida[i] = float(texto[i].split()[-1].replace(",", "."))
+        except ValueError:
+            pass
+    return salida
+
+
+def cargar_csv(ruta):
+    with open(ruta, newline="") as f:
+        filas = list(csv.reader(f))
+    if len(filas) < 2:
+        return _vacia(ruta)
+    encabezado, filas = filas[0], filas[1:]
+    # Las filas cortas (captura cortada a la mitad) se rellenan para no desalinear columnas
+    ancho = len(encabezado)
+    filas = [fila if len(fila) == ancho else (fila + [""] * ancho)[:ancho] for fila in filas]
+    columnas_texto = dict(zip(encabezado, zip(*filas)))
+
+    fecha = np.char.add(np.char.add(np.asarray(columnas_texto["Fecha_Sistema"], dtype=str), "T"),
+                        np.asarray(columnas_texto["Hora_Sistema"], dtype=str))
+    t = fecha.astype("datetime64[ms]")
+    n = len(t)
+    columnas = {}
+    for columna, canal in COLUMNA_A_CANAL.items():
+        # Las capturas viejas tienen menos termopares: las columnas que faltan quedan en NaN
+        columnas[canal] = _a_float(columnas_texto[columna]) if columna in columnas_texto else np.full(n, np.nan)
+    muestra = filas[0][encabezado.index("Muestra")] if "Muestra" in encabezado else ""
+    recolector = filas[0][encabezado.index("Recolector")] if "Recolector" in encabezado else ""
+    return Captura(ruta, muestra, recolector, t, columnas)
+
+
+def cargar_secbin(ruta):
+    metadatos, registros = formato_binario.cargar(ruta)
+    columnas = {nombre: registros[nombre].astype(np.float64) for nombre in registros.dtype.names
+                if nombre in COLUMNA_A_CANAL.values()}
+    fans = registros["ventiladores"]
+    for i in range(3):
+        columnas[f"ventilador{i+1}"] = ((fans >> i) & 1).astype(np.float64)
+    t = registros["t_ms"].astype("datetime64[ms]")
+    return Captura(ruta, metadatos.get("muestra", ""), metadatos.get("recolector", ""), t, columnas)
+
+
+def cargar_segmentada(ruta):
+    """Une los segmentos de una captura con manifiesto en una sola Captura"""
+    partes = [cargar(r) for r in segmentos.rutas_segmentos(ruta) if os.path.exists(r)]
+    partes = [p for p in partes if len(p)]
+    if not partes:
+        return _vacia(ruta)
+    columnas = {canal: np.concatenate([p[canal] for p in partes]) for canal in partes[0].columnas}
+    t = np.concatenate([p.t for p in partes])
+    return Captura(ruta, partes[0].muestra, partes[0].recolector, t, columnas)
+
+
+def cargar(ruta):
+    if ruta.endswith(segmentos.EXTENSION_MANIFIESTO):
+        return cargar_segmentada(ruta)
+    if ruta.endswith(formato_binario.EXTENSION):
+        return cargar_secbin(ruta)
+    return cargar_csv(ruta)
+
+
+def cargar_varias(patrones):
+    """Carga todas las capturas que coinciden con uno o más patrones glob.
+
+    Los segmentos de una captura segmentada (y el CSV exportado junto al manifiesto)
+    no se cargan sueltos: la captura cuenta una vez, por su manifiesto.
+    """
+    if isinstance(patrones, str):
+        patrones = [patrones]
+    rutas = {os.path.normpath(ruta) for patron in patrones for ruta in glob.glob(patron)}
+    propios = set()
+    for carpeta in {os.path.dirname(ruta) for ruta in rutas}:
+        propios |= segmentos.archivos_segmentados(carpeta or ".")
+    # Un segmento pedido por nombre (sin comodines) sí se carga
+    propios -= {os.path.normpath(patron) for patron in patrones if not glob.has_magic(patron)}
+    return [cargar(ruta) for ruta in sorted(rutas - propios)]
+
+
+def _validos(t_s, valores):
+    mascara = ~np.isnan(valores)
+    return t_s[mascara], valores[mascara]
+
+
+def metricas(captura, masa_objetivo=None, objetivo_frac=OBJETIVO_FRAC):
+    """Métricas de la curva de secado de una corrida.
+
+    masa_objetivo es absoluta (misma unidad que Masa_g); si no se da, se usa
+    objetivo_frac * masa inicial.
+    """
+    t_s = captura.t_s
+    resultado = {
+        "archivo": os.path.basename(captura.ruta),
+        "muestra": captura.muestra,
+        "recolector": captura.recolector,
+        "inicio": str(captura.t[0]) if len(captura) else "",
+        "filas": len(captura),
+        "duracion_s": float(t_s[-1]) if len(captura) else 0.0,
+    }
+
+    tm, masa = _validos(t_s, captura["masa_g"])
+    if len(masa) >= 2:
+        inicial, final = masa[0], masa[-1]
+        # Pendiente por mínimos cuadrados: menos sensible al ruido de la balanza que final - inicial
+        pendiente = np.polyfit(tm, masa, 1)[0] if tm[-1] > tm[0] else 0.0
+        objetivo = masa_objetivo if masa_objetivo is not None else inicial * objetivo_frac
+        alcanzado = masa <= objetivo
+        resultado.update({
+            "masa_inicial": float(inicial),
+            "masa_final": float(final),
+            "perdida_masa": float(inicial - final),
+            "perdida_pct": float((inicial - final) / inicial * 100) if inicial else np.nan,
+            "tasa_perdida_por_min": float(-pendiente * 60),
+            "tiempo_a_objetivo_s": float(tm[np.argmax(alcanzado)]) if alcanzado.any() else np.nan,
+        })
+    else:
+        resultado.update({k: np.nan for k in ("masa_inicial", "masa_final", "perdida_masa", "perdida_pct",
+                                               "tasa_perdida_por_min", "tiempo_a_objetivo_s")})
+
+    if len(captura):
+        bloque = np.vstack([captura[nombre] for nombre in TERMOPARES])
+        with warnings.catch_warnings():
+            # nanmean/nanmax avisan si un termopar no existe en la captura (columna toda NaN)
+            warnings.simplefilter("ignore", RuntimeWarning)
+            medias = np.nanmean(bloque, axis=1)
+            maximos = np.nanmax(bloque, axis=1)
+        for nombre, media, maximo in zip(TERMOPARES, medias, maximos):
+            resultado[f"{nombre}_media"] = float(media)
+            resultado[f"{nombre}_max"] = float(maximo)
+
+    tr, rad = _validos(t_s, captura["radiacion_W_m2"])
+    energia = float(_integrar(rad, tr)) if len(rad) >= 2 else 0.0  # W/m² * s = J/m²
+    resultado["energia_J_m2"] = energia
+    resultado["energia_kWh_m2"] = energia / 3.6e6
+    return resultado
+
+
+def metricas_lote(capturas, **kwargs):
+    return [metricas(captura, **kwargs) for captura in capturas]
+
+
+def remuestrear(captura, canal, paso_s=1.0, duracion_s=None):
+    """Valores del canal sobre una grilla regular desde el inicio de la corrida.
+
+    Interpolación lineal; fuera del rango medido queda NaN.
+    """
+    if duracion_s is None:
+        duracion_s = captura.t_s[-1] if len(captura) else 0.0
+    grilla = np.arange(0.0, duracion_s + paso_s / 2, paso_s)
+    t, valores = _validos(captura.t_s, captura[canal])
+    if len(valores) == 0:
+        return grilla, np.full(len(grilla), np.nan)
+    return grilla, np.interp(grilla, t, valores, left=np.nan, right=np.nan)
+
+
+def remuestrear_lote(capturas, canal, paso_s=1.0, duracion_s=None):
+    """Matriz (corridas x instantes) del canal en una grilla común, para comparar curvas"""
+    if duracion_s is None:
+        duracion_s = max((c.t_s[-1] for c in capturas if len(c)), default=0.0)
+    grilla = np.arange(0.0, duracion_s + paso_s / 2, paso_s)
+    matriz = np.full((len(capturas), len(grilla)), np.nan)
+    for i, captura in enumerate(capturas):
+        t, valores = _validos(captura.t_s, captura[canal])
+        if len(valores):
+            matriz[i] = np.interp(grilla, t, valores, left=np.nan, right=np.nan)
+    return grilla, matriz
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Métricas de secado por corrida")
+    parser.add_argument("archivos", nargs="*", default=list(PATRONES),
+                        help="Archivos o patrones glob (por defecto los CSV y manifiestos de Recolecciones)")
+    parser.add_argument("--objetivo", type=float, help="Masa objetivo absoluta")
+    parser.add_argument("--frac", type=float, default=OBJETIVO_FRAC,
+                        help="Masa objetivo como fracción de la inicial (si no se da --objetivo)")
+    parser.add_argument("--csv", help="Guardar las métricas en este CSV")
+    args = parser.parse_args(argv)
+
+    capturas = cargar_varias(args.archivos)
+    filas = metricas_lote(capturas, masa_objetivo=args.objetivo, objetivo_frac=args.frac)
+    if not filas:
+        print("No se encontraron capturas.")
+        return
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(filas[0]))
+            writer.writeheader()
+            writer.writerows(filas)
+        print(f"Métricas guardadas en {args.csv}")
+    print(f"{'Archivo':45} {'min':>7} {'Δmasa':>8} {'pérd/min':>9} {'T3 max':>7} {'kWh/m²':>7}")
+    for fila in filas:
+        print(f"{fila['archivo'][:45]:45} {fila['duracion_s'] / 60:7.1f} {fila['perdida_masa']:8.3f} "
+              f"{fila['tasa_perdida_por_min']:9.4f} {fila.get('termopar3_C_max', np.nan):7.2f} "
+              f"{fila['energia_kWh_m2']:7.4f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
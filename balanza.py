@@ -0,0 +1,69 @@
+import re
+
+# Tramas que acepta la balanza, con o sin el prefijo de estado que mandan
+# muchos indicadores (ST=estable, US=inestable, OL=sobrecarga; GS=bruto, NT=neto):
+#   "  812.50 g"    "+0.807kg"    "ST,GS,+  812.50 g"    "US,NT,-   1,25 kg"
+# Todo se hace sobre bytes con un patrón precompilado: nada de decode/lower por línea.
+_TRAMA = re.compile(
+    rb"\s*(?:(?P<estado>ST|US|OL)\s*,\s*(?:(?P<tipo>GS|NT|TR)\s*,\s*)?)?"
+    rb"(?P<signo>[+-]?)\s*(?P<valor>\d+(?:[.,]\d+)?|[.,]\d+)"
+    rb"\s*(?P<unidad>kg|g|lb|oz)?\s*",
+    re.IGNORECASE,
+)
+MAX_TRAMA = 64  # Una línea más larga que esto es basura (p. ej. se perdió el fin de línea)
+# El valor numérico (masa_g) siempre va en gramos; sin unidad en la trama se asume gramos.
+# El texto exacto de la balanza (masa_str) no se toca.
+GRAMOS_POR_UNIDAD = {b"g": 1.0, b"kg": 1000.0, b"lb": 453.592, b"oz": 28.3495}
+
+
+class LecturaBalanza:
+    """Trama válida de la balanza ya interpretada"""
+    __slots__ = ("texto", "valor", "estable", "unidad")
+
+    def __init__(self, texto, valor, estable, unidad):
+        self.texto = texto        # Número tal cual lo mandó la balanza (para el CSV)
+        self.valor = valor        # float, en gramos
+        self.estable = estable    # False si la balanza marcó la pesada como inestable/sobrecarga
+        self.unidad = unidad      # "g", "kg"... o "" si la trama no la trae
+
+    def __repr__(self):
+        return f"LecturaBalanza({self.texto!r}, estable={self.estable}, unidad={self.unidad!r})"
+
+
+class ParserBalanza:
+    """Valida y decodifica líneas crudas del puerto serie.
+
+    Las líneas que no son exactamente una trama (p. ej. ".98   0.799", dos
+    lecturas pegadas por una lectura parcial del buffer) se rechazan y se
+    cuentan en lugar de guardarse.
+    """
+
+    def __init__(self):
+        self.tramas = 0
+        self.rechazadas = 0
+        self.inestables = 0
+
+    def parsear(self, raw):
+        """Devuelve una LecturaBalanza, o None si la línea está vacía o es inválida"""
+        if len(raw) > MAX_TRAMA:
+            self.rechazadas += 1
+            return None
+        m = _TRAMA.fullmatch(raw)
+        if m is None:
+            if raw.strip():
+                self.rechazadas += 1
+            return None
+        texto = (m.group("signo") + m.group("valor")).decode("ascii")
+        estado = m.group("estado")
+        estable = estado is None or estado.upper() == b"ST"
+        unidad = (m.group("unidad") or b"").lower()
+        self.tramas += 1
+        if not estable:
+            self.inestables += 1
+        return LecturaBalanza(
+            texto,
+            # Reemplazamos coma por punto por si la balanza envía comas; kg/lb/oz pasan a gramos
+            float(texto.replace(",", ".")) * GRAMOS_POR_UNIDAD.get(unidad, 1.0),
+            estable,
+            unidad.decode("ascii"),
+        )
@@ -0,0 +1,121 @@
+# Registro único de canales del secador.
+#
+# Todo lo que antes estaba repetido (claves de la Lectura, encabezados y filas del
+# CSV, filas del monitor, columnas del historial) sale de CANALES. Agregar un sensor
+# es agregar una línea aquí.
+
+N_TERMOPARES = 6
+N_VENTILADORES = 3
+
+
+class Canal:
+    """Descripción de un canal escalar"""
+    __slots__ = ("nombre", "etiqueta", "unidad", "tipo", "minimo", "maximo", "columna_csv",
+                 "fuente", "clave", "indice", "clave_csv", "grupo", "color", "banda")
+
+    def __init__(self, nombre, etiqueta, unidad, tipo, minimo, maximo, columna_csv,
+                 fuente="mqtt", clave=None, indice=None, clave_csv=None,
+                 grupo="", color="green", banda=None):
+        self.nombre = nombre              # Nombre del canal (historial, memoria compartida)
+        self.etiqueta = etiqueta          # Texto en el monitor
+        self.unidad = unidad
+        self.tipo = tipo                  # float o bool
+        self.minimo = minimo              # Rango esperado (escala de las barras)
+        self.maximo = maximo
+        self.columna_csv = columna_csv
+        self.fuente = fuente              # "mqtt" o "serial"
+        self.clave = clave or nombre      # Campo de la Lectura / clave del JSON del ESP
+        self.indice = indice              # Posición dentro del campo si es una lista (termopares_C...)
+        self.clave_csv = clave_csv or self.clave  # Campo que se escribe en el CSV
+        self.grupo = grupo                # "ambiente", "proceso" o "ventiladores"
+        self.color = color
+        self.banda = banda                # Cambio mínimo para el modo banda del logger
+
+    def __repr__(self):
+        return f"Canal({self.nombre!r})"
+
+
+# Rangos para las barras visuales (ajusta según tu proceso)
+MAX_TEMP = 100.0
+MAX_HUM = 100.0
+MAX_RAD = 1000.0
+MAX_MASA = 5000.0 # Ejemplo: 5kg max
+
+CANALES = (
+    Canal("temp1_C", "Temp 1", "°C", float, 0.0, MAX_TEMP, "Temp1_C", grupo="ambiente", color="red", banda=0.1),
+    Canal("humedad1_RH", "Hum 1", "%", float, 0.0, MAX_HUM, "Hum1_RH", grupo="ambiente", color="blue", banda=0.2),
+    Canal("temperatura2_C", "Temp 2", "°C", float, 0.0, MAX_TEMP, "Temp2_C", grupo="ambiente", color="red", banda=0.1),
+    Canal("humedad2_RH", "Hum 2", "%", float, 0.0, MAX_HUM, "Hum2_RH", grupo="ambiente", color="blue", banda=0.2),
+    Canal("radiacion_W_m2", "Radiación", "W/m²", float, 0.0, MAX_RAD, "Radiacion_W_m2", grupo="ambiente", color="yellow", banda=2.0),
+    *(Canal(f"termopar{i+1}_C", f"Termopar {i+1}", "°C", float, 0.0, MAX_TEMP, f"Termopar{i+1}_C",
+            clave="termopares_C", indice=i, grupo="proceso", color="magenta", banda=0.25)
+      for i in range(N_TERMOPARES)),
+    *(Canal(f"ventilador{i+1}", f"V{i+1}", "", bool, 0, 1, f"Fan{i+1}",
+            clave="ventiladores", indice=i, grupo="ventiladores")
+      for i in range(N_VENTILADORES)),
+    # El CSV guarda el texto EXACTO de la balanza; el resto usa el valor numérico
+    Canal("masa_g", "MASA (Balanza)", "g", float, 0.0, MAX_MASA, "Masa_g",
+          fuente="serial", clave_csv="masa_str", grupo="proceso", banda=0.001),
+)
+
+# Campos de la Lectura que no son canales
+OTROS_CAMPOS = (
+    # (clave, valor inicial, fuente)
+    ("timestamp_ms", 0, "mqtt"),
+    ("masa_str", "0.00", "serial"),
+    ("masa_estable", True, "serial"),   # False si la balanza marcó la última pesada como inestable
+    ("masa_unidad", "", "serial"),      # Unidad que mandó la balanza ("g", "kg"...), "" si no la manda
+)
+
+
+def _valores_iniciales():
+    valores = {"timestamp_ms": 0}
+    for canal in CANALES:
+        if canal.indice is None:
+            valores[canal.clave] = canal.tipo()
+        else:
+            # Los campos tipo lista se guardan como tupla para que nadie los mute
+            valores[canal.clave] = valores.get(canal.clave, ()) + (canal.tipo(),)
+    for clave, inicial, _ in OTROS_CAMPOS:
+        valores.setdefault(clave, inicial)
+    return valores
+
+
+VALORES_INICIALES = _valores_iniciales()
+FUENTE_CAMPO = {canal.clave: canal.fuente for canal in CANALES}
+FUENTE_CAMPO.update({clave: fuente for clave, _, fuente in OTROS_CAMPOS})
+CAMPOS_SERIAL = tuple(clave for clave, fuente in FUENTE_CAMPO.items() if fuente == "serial")
+
+COLUMNAS_NUMERICAS = tuple(canal.nombre for canal in CANALES)
+ENCABEZADOS_CSV = [
+    "Fecha_Sistema", "Hora_Sistema", "Timestamp_MS", "Muestra", "Recolector",
+    *(canal.columna_csv for canal in CANALES),
+]
+CLAVES_CSV = tuple(canal.clave_csv for canal in CANALES)  # Campo de origen de cada columna de canal
+
+
+def _acceso(canal, clave, numerico):
+    if canal.indice is None:
+        expr = f"d.{clave}"
+    else:
+        # Si el ESP manda menos elementos, se rellena con el valor nulo del tipo
+        expr = f"(d.{clave}[{canal.indice}] if len(d.{clave}) > {canal.indice} else {canal.tipo()!r})"
+    return f"float({expr})" if numerico else expr
+
+
+def compilar_extractor(canales=CANALES, csv=False, numerico=False):
+    """Función Lectura -> tupla con un valor por canal, generada una sola vez.
+
+    Con csv=True usa el campo que va al CSV (p. ej. masa_str); con numerico=True
+    convierte todo a float (los ventiladores quedan en 0.0/1.0). Se genera el
+    código de la tupla, como hace namedtuple, para que cada fila sea un solo
+    acceso por canal sin búsquedas en diccionarios ni relleno de listas.
+    """
+    cuerpo = ", ".join(
+        _acceso(canal, canal.clave_csv if csv else canal.clave, numerico) for canal in canales
+    )
+    return eval(f"lambda d: ({cuerpo},)", {})
+
+
+def por_grupo(grupo):
+    return tuple(canal for canal in CANALES if canal.grupo == grupo)
@@ -0,0 +1,425 @@
+import argparse
+import csv
+import math
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from canales import CANALES
+import formato_binario
+from segmentos import EXTENSION_MANIFIESTO, archivos_segmentados, leer_manifiesto, rutas_segmentos
+
+# Catálogo persistente de capturas (SQLite).
+#
+# Una fila por captura de Recolecciones con muestra, recolector, inicio/fin, filas,
+# intervalo y min/max/media de cada canal, para buscar corridas sin abrir ningún
+# CSV. Una captura segmentada (segmentos.py) es una sola fila con la ruta de su
+# manifiesto y las estadísticas de todos sus segmentos. logger.py registra cada
+# captura al terminar; `escanear` recorre también las subcarpetas (una por secador,
+# secadores.py), agrega las que se copiaron a mano y quita las que ya no existen.
+CARPETA_CAPTURAS = "Recolecciones"
+RUTA_CATALOGO = os.path.join(CARPETA_CAPTURAS, "catalogo.sqlite")
+EXTENSIONES = (".csv", formato_binario.EXTENSION, EXTENSION_MANIFIESTO)
+CARPETAS_EXCLUIDAS = ("normalizado", "estadisticas")  # Salidas de convertir_lote e instrumentación
+
+# Columnas de estadísticas: <canal>_min, <canal>_max, <canal>_media (ventiladores: fracción encendido)
+COLUMNAS_ESTADISTICAS = tuple(
+    f"{canal.nombre}_{sufijo}" for canal in CANALES for sufijo in ("min", "max", "media")
+)
+COLUMNAS_FIJAS = (
+    ("ruta", "TEXT PRIMARY KEY"),
+    ("muestra", "TEXT"),
+    ("recolector", "TEXT"),
+    ("inicio", "TEXT"),        # "YYYY-MM-DD HH:MM:SS", hora del sistema
+    ("fin", "TEXT"),
+    ("filas", "INTEGER"),
+    ("intervalo_s", "REAL"),
+    ("formato", "TEXT"),       # "csv" o "secbin" (el de los segmentos si es una captura segmentada)
+    ("tamano", "INTEGER"),     # Tamaño y mtime del archivo al indexarlo: si cambian, se reindexa
+    ("mtime", "REAL"),
+)
+COLUMNAS = tuple(nombre for nombre, _ in COLUMNAS_FIJAS) + COLUMNAS_ESTADISTICAS
+
+_COLUMNA_A_INDICE = {canal.columna_csv: i for i, canal in enumerate(CANALES)}
+_CONDICION = re.compile(r"\s*(\w+)\s*(<=|>=|!=|<|>|=)\s*(\S+)\s*")
+
+
+def _numero(celda):
+    """Texto de una celda -> float, o None si está vacía o no es un número"""
+    celda = celda.strip()
+    if not celda:
+        return None
+    if celda == "True":
+        return 1.0
+    if celda == "False":
+        return 0.0
+    try:
+        # Restos del buffer de la balanza (".98   0.799"): vale el último número
+        return float(celda.split()[-1].replace(",", "."))
+    except ValueError:
+        return None
+
+
+class ResumenCanales:
+    """Acumula min/max/media de cada canal recorriendo las filas una vez"""
+
+    def __init__(self):
+        n = len(CANALES)
+        self.minimos = [math.inf] * n
+        self.maximos = [-math.inf] * n
+        self.sumas = [0.0] * n
+        self.cuentas = [0] * n
+
+    def agregar(self, valores):
+        for i, v in enumerate(valores):
+            if v is None or v != v:  # None o NaN: sin dato
+                continue
+            if v < self.minimos[i]:
+                self.minimos[i] = v
+            if v > self.maximos[i]:
+                self.maximos[i] = v
+            self.sumas[i] += v
+            self.cuentas[i] += 1
+
+    def columnas(self):
+        salida = []
+        for i in range(len(CANALES)):
+            if self.cuentas[i]:
+                salida += [self.minimos[i], self.maximos[i], self.sumas[i] / self.cuentas[i]]
+            else:
+                salida += [None, None, None]
+        return salida
+
+
+def _leer_csv(ruta, resumen=None):
+    with open(ruta, newline="") as f:
+        lector = csv.reader(f)
+        encabezado = next(lector, None)
+        if not encabezado:
+            return None
+        # Capturas viejas con menos termopares: los canales que faltan quedan sin estadísticas
+        indices = [(j, _COLUMNA_A_INDICE[col]) for j, col in enumerate(encabezado) if col in _COLUMNA_A_INDICE]
+        vacia = [None] * len(CANALES)
+        resumen = resumen or ResumenCanales()
+        filas = 0
+        primera = ultima = None
+        for fila in lector:
+            if len(fila) < len(encabezado):
+                continue  # Fila cortada (la captura se interrumpió a mitad de una escritura)
+            valores = list(vacia)
+            for j, i in indices:
+                valores[i] = _numero(fila[j])
+            resumen.agregar(valores)
+            if primera is None:
+                primera = fila
+            ultima = fila
+            filas += 1
+    if primera is None:
+        return None
+    inicio = f"{primera[0]} {primera[1]}"
+    fin = f"{ultima[0]} {ultima[1]}"
+    return {
+        "muestra": primera[encabezado.index("Muestra")],
+        "recolector": primera[encabezado.index("Recolector")],
+        "inicio": inicio,
+        "fin": fin,
+        "filas": filas,
+        "intervalo_s": _intervalo(inicio, fin, filas),
+        "formato": "csv",
+    }, resumen
+
+
+def _leer_secbin(ruta, resumen=None):
+    with open(ruta, "rb") as f:
+        metadatos, _ = formato_binario.leer_encabezado(f)
+    nombres = [nombre for nombre, _ in formato_binario.COLUMNAS]
+    posiciones = [nombres.index(canal.nombre) if canal.nombre in nombres else None for canal in CANALES]
+    bits = [canal.indice if canal.clave == "ventiladores" else None for canal in CANALES]
+    fans = nombres.index("ventiladores")
+    resumen = resumen or ResumenCanales()
+    filas = 0
+    primero = ultimo = None
+    for registro in formato_binario.iterar_registros(ruta):
+        resumen.agregar([
+            registro[p] if p is not None else (float(registro[fans] >> b & 1) if b is not None else None)
+            for p, b in zip(posiciones, bits)
+        ])
+        if primero is None:
+            primero = registro[0]
+        ultimo = registro[0]
+        filas += 1
+    if primero is None:
+        return None
+    inicio = datetime.fromtimestamp(primero / 1000).strftime("%Y-%m-%d %H:%M:%S")
+    fin = datetime.fromtimestamp(ultimo / 1000).strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "muestra": metadatos.get("muestra", ""),
+        "recolector": metadatos.get("recolector", ""),
+        "inicio": inicio,
+        "fin": fin,
+        "filas": filas,
+        "intervalo_s": metadatos.get("intervalo_s") or _intervalo(inicio, fin, filas),
+        "formato": "secbin",
+    }, resumen
+
+
+def _leer_archivo(ruta, resumen=None):
+    if ruta.endswith(formato_binario.EXTENSION):
+        return _leer_secbin(ruta, resumen)
+    return _leer_csv(ruta, resumen)
+
+
+def _leer_segmentada(ruta):
+    """Una captura segmentada como si fuera un solo archivo: estadísticas de todos los segmentos"""
+    manifiesto = leer_manifiesto(ruta)
+    resumen = ResumenCanales()
+    datos = None
+    for segmento in rutas_segmentos(ruta):
+        if not os.path.exists(segmento):
+            continue
+        leido = _leer_archivo(segmento, resumen)
+        if leido is None:
+            continue
+        if datos is None:
+            datos = dict(leido[0])
+        else:
+            datos["fin"] = leido[0]["fin"]
+            datos["filas"] += leido[0]["filas"]
+    if datos is None:
+        return None
+    datos["muestra"] = manifiesto.get("muestra", datos["muestra"])
+    datos["recolector"] = manifiesto.get("recolector", datos["recolector"])
+    datos["intervalo_s"] = (manifiesto.get("intervalo_s")
+                            or _intervalo(datos["inicio"], datos["fin"], datos["filas"]))
+    return datos, resumen
+
+
+def _firma(ruta):
+    """(tamaño, mtime) para saber si hay que reindexar; en una segmentada cuentan también los segmentos"""
+    stat = os.stat(ruta)
+    if not ruta.endswith(EXTENSION_MANIFIESTO):
+        return stat.st_size, stat.st_mtime
+    tamano, mtime = stat.st_size, stat.st_mtime
+    try:
+        segmentos = rutas_segmentos(ruta)
+    except (OSError, ValueError, KeyError):
+        segmentos = []
+    for segmento in segmentos:
+        if os.path.exists(segmento):
+            stat = os.stat(segmento)
+            tamano += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return tamano, mtime
+
+
+def _capturas(carpeta):
+    """Rutas a indexar bajo carpeta (recursivo): archivos sueltos y manifiestos, no sus segmentos"""
+    for directorio, subcarpetas, archivos in os.walk(carpeta):
+        subcarpetas[:] = sorted(d for d in subcarpetas if d not in CARPETAS_EXCLUIDAS)
+        propios = archivos_segmentados(directorio, archivos)
+        for nombre in sorted(archivos):
+            ruta = os.path.normpath(os.path.join(directorio, nombre))
+            if nombre.endswith(EXTENSIONES) and ruta not in propios:
+                yield ruta
+
+
+def _intervalo(inicio, fin, filas):
+    if filas < 2:
+        return None
+    formato = "%Y-%m-%d %H:%M:%S"
+    try:
+        duracion = (datetime.strptime(fin, formato) - datetime.strptime(inicio, formato)).total_seconds()
+    except ValueError:
+        return None
+    return duracion / (filas - 1)
+
+
+class Catalogo:
+    """Conexión al catálogo; crea la tabla y agrega columnas de canales nuevos si hace falta"""
+
+    def __init__(self, ruta=RUTA_CATALOGO):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.db = sqlite3.connect(ruta)
+        self.db.row_factory = sqlite3.Row
+        self._preparar()
+
+    def _preparar(self):
+        definicion = ", ".join(f"{nombre} {tipo}" for nombre, tipo in COLUMNAS_FIJAS)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS capturas ({definicion})")
+        existentes = {fila["name"] for fila in self.db.execute("PRAGMA table_info(capturas)")}
+        # Si el registro de canales creció, las capturas viejas quedan en NULL para los canales nuevos
+        for columna in COLUMNAS_ESTADISTICAS:
+            if columna not in existentes:
+                self.db.execute(f"ALTER TABLE capturas ADD COLUMN {columna} REAL")
+        self.db.execute("CREATE INDEX IF NOT EXISTS capturas_muestra ON capturas (muestra COLLATE NOCASE)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS capturas_inicio ON capturas (inicio)")
+        self.db.commit()
+
+    def registrar(self, ruta):
+        """Indexa (o reindexa) un archivo o el manifiesto de una captura segmentada.
+
+        Devuelve False si está vacío o no se pudo leer.
+        """
+        ruta = os.path.normpath(ruta)
+        tamano, mtime = _firma(ruta)
+        try:
+            if ruta.endswith(EXTENSION_MANIFIESTO):
+                leido = _leer_segmentada(ruta)
+            else:
+                leido = _leer_archivo(ruta)
+        except (ValueError, KeyError, UnicodeDecodeError, csv.Error):
+            leido = None
+        if leido is None:
+            self.db.execute("DELETE FROM capturas WHERE ruta = ?", (ruta,))
+            self.db.commit()
+            return False
+        datos, resumen = leido
+        fila = [ruta, datos["muestra"], datos["recolector"], datos["inicio"], datos["fin"],
+                datos["filas"], datos["intervalo_s"], datos["formato"], tamano, mtime,
+                *resumen.columnas()]
+        marcas = ", ".join("?" * len(COLUMNAS))
+        self.db.execute(f"INSERT OR REPLACE INTO capturas ({', '.join(COLUMNAS)}) VALUES ({marcas})", fila)
+        self.db.commit()
+        return True
+
+    def escanear(self, carpeta=CARPETA_CAPTURAS):
+        """Rescaneo incremental de carpeta y sus subcarpetas: solo lee capturas nuevas o modificadas.
+
+        Devuelve (agregados, sin_cambios, quitados).
+        """
+        conocidos = {fila["ruta"]: (fila["tamano"], fila["mtime"])
+                     for fila in self.db.execute("SELECT ruta, tamano, mtime FROM capturas")}
+        agregados = sin_cambios = 0
+        vistos = set()
+        for ruta in _capturas(carpeta):
+            vistos.add(ruta)
+            if conocidos.get(ruta) == _firma(ruta):
+                sin_cambios += 1
+            elif self.registrar(ruta):
+                agregados += 1
+        # Solo se olvidan las capturas de esta carpeta que desaparecieron (o que ahora son
+        # segmentos de una captura segmentada, indexada por su manifiesto)
+        raiz = os.path.join(os.path.normpath(carpeta), "")
+        quitados = [ruta for ruta in conocidos if ruta not in vistos and ruta.startswith(raiz)]
+        self.db.executemany("DELETE FROM capturas WHERE ruta = ?", [(r,) for r in quitados])
+        self.db.commit()
+        return agregados, sin_cambios, len(quitados)
+
+    def buscar(self, muestra=None, recolector=None, desde=None, hasta=None, condiciones=()):
+        """Capturas que cumplen todos los filtros, ordenadas por inicio.
+
+        muestra/recolector son subcadenas sin distinguir mayúsculas; desde/hasta son
+        fechas "YYYY-MM-DD" inclusivas; condiciones son textos como "termopar3_C_max>60".
+        """
+        donde, parametros = [], []
+        if muestra:
+            donde.append("muestra LIKE ?")
+            parametros.append(f"%{muestra}%")
+        if recolector:
+            donde.append("recolector LIKE ?")
+            parametros.append(f"%{recolector}%")
+        if desde:
+            donde.append("date(inicio) >= date(?)")
+            parametros.append(desde)
+        if hasta:
+            donde.append("date(inicio) <= date(?)")
+            parametros.append(hasta)
+        for condicion in condiciones:
+            columna, operador, valor = _parsear_condicion(condicion)
+            donde.append(f"{columna} {operador} ?")
+            parametros.append(valor)
+        sql = "SELECT * FROM capturas"
+        if donde:
+            sql += " WHERE " + " AND ".join(donde)
+        return self.db.execute(sql + " ORDER BY inicio", parametros).fetchall()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _parsear_condicion(texto):
+    m = _CONDICION.fullmatch(texto)
+    if m is None:
+        raise ValueError(f"Condición inválida: {texto!r} (ej. termopar3_C_max>60)")
+    columna, operador, valor = m.groups()
+    # Solo columnas conocidas: el nombre va directo al SQL
+    if columna not in COLUMNAS:
+        raise ValueError(f"Columna desconocida: {columna!r}")
+    try:
+        return columna, operador, float(valor)
+    except ValueError:
+        return columna, operador, valor
+
+
+def registrar_captura(ruta, ruta_catalogo=RUTA_CATALOGO):
+    """Atajo para el logger: indexa una captura recién cerrada"""
+    with Catalogo(ruta_catalogo) as catalogo:
+        return catalogo.registrar(ruta)
+
+
+def _formato(valor):
+    if valor is None:
+        return "-"
+    if isinstance(valor, float):
+        return f"{valor:.2f}"
+    return str(valor)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Catálogo de capturas de Recolecciones")
+    parser.add_argument("--catalogo", default=RUTA_CATALOGO, help="Archivo SQLite del catálogo")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    escanear = sub.add_parser("escanear", help="Indexar archivos nuevos o modificados")
+    escanear.add_argument("carpeta", nargs="?", default=CARPETA_CAPTURAS)
+
+    buscar = sub.add_parser("buscar", help="Listar capturas que cumplen los filtros")
+    buscar.add_argument("--muestra")
+    buscar.add_argument("--recolector")
+    buscar.add_argument("--desde", help="Fecha inicial YYYY-MM-DD (inclusive)")
+    buscar.add_argument("--hasta", help="Fecha final YYYY-MM-DD (inclusive)")
+    buscar.add_argument("--donde", action="append", default=[], metavar="COND",
+                        help="Condición sobre una columna, ej. 'termopar3_C_max>60' (repetible)")
+    buscar.add_argument("--columnas", default="",
+                        help="Columnas extra a mostrar separadas por coma, ej. masa_g_min,masa_g_max")
+
+    sub.add_parser("columnas", help="Listar las columnas consultables")
+    args = parser.parse_args(argv)
+
+    if args.comando == "columnas":
+        print("\n".join(COLUMNAS))
+        return
+
+    with Catalogo(args.catalogo) as catalogo:
+        if args.comando == "escanear":
+            agregados, sin_cambios, quitados = catalogo.escanear(args.carpeta)
+            print(f"Indexados: {agregados} | Sin cambios: {sin_cambios} | Quitados: {quitados}")
+            return
+        try:
+            filas = catalogo.buscar(args.muestra, args.recolector, args.desde, args.hasta, args.donde)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        extra = [c for c in args.columnas.split(",") if c]
+        for c in extra:
+            if c not in COLUMNAS:
+                print(f"Columna desconocida: {c!r}")
+                sys.exit(1)
+        print(f"{'Inicio':19}  {'Muestra':15} {'Recolector':12} {'Filas':>6}  " + "  ".join(f"{c:>14}" for c in extra) + "  Archivo")
+        for fila in filas:
+            print(f"{fila['inicio']:19}  {fila['muestra'][:15]:15} {fila['recolector'][:12]:12} {fila['filas']:6}  "
+                  + "  ".join(f"{_formato(fila[c]):>14}" for c in extra) + f"  {fila['ruta']}")
+        print(f"{len(filas)} captura(s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,350 @@
+import argparse
+import collections
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from adquisicion import crear_manager
+from instrumentacion import INSTRUMENTOS
+from logger import SesionCaptura, RelojMuestreo, ensure_directory_exists, MODO_CONTINUO, MODOS
+
+# Logger sin consola: capturas por argumentos o archivo de trabajos, en cola y sin
+# huecos entre una y otra, controlables por un socket Unix.
+#
+# Todas las sesiones comparten un único bucle de muestreo: cuando una termina, la
+# siguiente se abre y recibe la fila de ese mismo tick, así que no se pierde ninguna
+# muestra en el cambio. Si el intervalo es el mismo, el reloj de ticks continúa.
+#
+# Control (una línea JSON por comando, una línea JSON de respuesta):
+#   {"cmd": "estado"}            incluye los instrumentos (instrumentacion.py) en "estadisticas"
+#   {"cmd": "encolar", "muestra": "manzana", "recolector": "kal", "duracion": "1h", ...}
+#   {"cmd": "iniciar", ...}      como encolar, pero va primero y corta la captura actual
+#   {"cmd": "detener"}           termina la captura actual; empieza la siguiente de la cola
+#   {"cmd": "vaciar"}            descarta las capturas en cola
+#   {"cmd": "salir"}             termina la captura actual y sale
+SOCKET_CONTROL = "/tmp/secador_logger.sock"
+ESPERA_RESPUESTA_S = 5.0
+
+
+def parsear_duracion(valor):
+    """Segundos a partir de 90, "90s", "5m", "1h" o "indefinido"/-1"""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = str(valor).strip().lower()
+    if texto in ("-1", "indefinido", "inf"):
+        return -1
+    factores = {"s": 1, "m": 60, "h": 3600}
+    if texto and texto[-1] in factores:
+        return float(texto[:-1]) * factores[texto[-1]]
+    return float(texto)
+
+
+def normalizar_trabajo(datos):
+    """Completa un trabajo con los valores por defecto del logger; ValueError si es inválido"""
+    if not datos.get("muestra"):
+        raise ValueError("Falta 'muestra'")
+    modo = str(datos.get("modo", MODO_CONTINUO)).lower()
+    if modo not in MODOS:
+        raise ValueError(f"Modo desconocido: {modo!r}")
+    formato = str(datos.get("formato", "csv")).lower()
+    if formato not in ("csv", "bin"):
+        raise ValueError(f"Formato desconocido: {formato!r}")
+    intervalo = float(datos.get("intervalo", 1.0))
+    if intervalo <= 0:
+        raise ValueError("El intervalo debe ser positivo")
+    return {
+        "muestra": str(datos["muestra"]).replace(" ", "_"),
+        "recolector": str(datos.get("recolector", "Operador")).replace(" ", "_"),
+        "intervalo": intervalo,
+        "duracion": parsear_duracion(datos.get("duracion", 60)),
+        "formato": formato,
+        "modo": modo,
+        "serie": bool(datos.get("serie", False)),
+    }
+
+
+def leer_trabajos(ruta):
+    """Archivo JSON con una lista de trabajos (o un objeto {"trabajos": [...]})"""
+    with open(ruta, encoding="utf-8") as f:
+        datos = json.load(f)
+    if isinstance(datos, dict):
+        datos = datos.get("trabajos", [])
+    return [normalizar_trabajo(t) for t in datos]
+
+
+class ColaCapturas:
+    """Ejecuta trabajos uno tras otro sobre un manager ya iniciado"""
+
+    def __init__(self, manager, trabajos=(), ruta_control=None):
+        self.manager = manager
+        self.pendientes = collections.deque(trabajos)
+        self.ruta_control = ruta_control
+        self.actual = None
+        self.terminadas = 0
+        self._comandos = queue.Queue()
+        self._detener = False    # Terminar la captura actual en el próximo tick
+        self._salir = False
+        self._servidor = None
+        self._clientes = []
+        self._indexando = []
+
+    # --- Control por socket -------------------------------------------------
+
+    def _iniciar_control(self):
+        if os.path.exists(self.ruta_control):
+            os.unlink(self.ruta_control)  # Socket de una ejecución anterior que no se limpió
+        self._servidor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._servidor.bind(self.ruta_control)
+        self._servidor.listen()
+        threading.Thread(target=self._aceptar, daemon=True).start()
+
+    def _aceptar(self):
+        while True:
+            try:
+                conexion, _ = self._servidor.accept()
+            except OSError:
+                return  # Socket cerrado al salir
+            hilo = threading.Thread(target=self._cliente, args=(conexion,), daemon=True)
+            hilo.start()
+            self._clientes.append(hilo)
+
+    def _cliente(self, conexion):
+        # Los comandos se ejecutan en el hilo de muestreo; este hilo solo los pasa y espera la respuesta
+        with conexion, conexion.makefile("rb") as entrada:
+            for linea in entrada:
+                try:
+                    mensaje = json.loads(linea)
+                except ValueError:
+                    respuesta = {"ok": False, "error": "JSON inválido"}
+                else:
+                    buzon = queue.Queue(maxsize=1)
+                    self._comandos.put((mensaje, buzon))
+                    try:
+                        respuesta = buzon.get(timeout=ESPERA_RESPUESTA_S)
+                    except queue.Empty:
+                        respuesta = {"ok": False, "error": "El logger no respondió"}
+                try:
+                    conexion.sendall((json.dumps(respuesta, ensure_ascii=False) + "\n").encode())
+                except OSError:
+                    return
+
+    def _atender(self, mensaje):
+        cmd = mensaje.get("cmd")
+        if cmd == "estado":
+            return {"ok": True, **self.estado(), "estadisticas": INSTRUMENTOS.resumen()}
+        if cmd in ("encolar", "iniciar"):
+            try:
+                trabajo = normalizar_trabajo({k: v for k, v in mensaje.items() if k != "cmd"})
+            except (ValueError, TypeError) as e:
+                return {"ok": False, "error": str(e)}
+            if cmd == "iniciar":
+                self.pendientes.appendleft(trabajo)
+                if self.actual is not None:
+                    self._detener = True
+            else:
+                self.pendientes.append(trabajo)
+            return {"ok": True, "en_cola": len(self.pendientes)}
+        if cmd == "detener":
+            self._detener = self.actual is not None
+            return {"ok": True, "detenida": self._detener}
+        if cmd == "vaciar":
+            descartadas = len(self.pendientes)
+            self.pendientes.clear()
+            return {"ok": True, "descartadas": descartadas}
+        if cmd == "salir":
+            self._salir = True
+            self._detener = self.actual is not None
+            return {"ok": True}
+        return {"ok": False, "error": f"Comando desconocido: {cmd!r}"}
+
+    def _procesar_comandos(self, espera=0.0):
+        """Atiende comandos hasta que pase `espera` o uno pida cortar la captura actual"""
+        limite = time.monotonic() + espera
+        while not (self._detener or self._salir):
+            resto = limite - time.monotonic()
+            try:
+                if resto > 0:
+                    mensaje, buzon = self._comandos.get(timeout=resto)
+                else:
+                    mensaje, buzon = self._comandos.get_nowait()
+            except queue.Empty:
+                return
+            buzon.put(self._atender(mensaje))
+
+    def estado(self):
+        actual = None
+        if self.actual is not None:
+            actual = {
+                "muestra": self.actual.nombre_muestra,
+                "recolector": self.actual.recolector,
+                "archivo": self.actual.filepath,
+                "registros": self.actual.registros,
+                "transcurrido_s": round(self.actual.transcurrido(), 1),
+                "duracion_s": self.actual.duracion_s,
+            }
+        return {"actual": actual, "pendientes": list(self.pendientes), "terminadas": self.terminadas}
+
+    # --- Sesiones -----------------------------------------------------------
+
+    def _abrir(self, trabajo):
+        sesion = SesionCaptura(
+            self.manager, trabajo["muestra"], trabajo["recolector"], trabajo["intervalo"],
+            trabajo["duracion"], trabajo["formato"] == "bin", trabajo["modo"], trabajo["serie"],
+        )
+        sesion.abrir()
+        print(f"[{sesion.inicio:%H:%M:%S}] Iniciando captura en: {sesion.filepath}", flush=True)
+        return sesion
+
+    def _cerrar(self, sesion, terminada=True):
+        sesion.cerrar(terminada)
+        self.terminadas += 1
+        print(f"[{time.strftime('%H:%M:%S')}] Captura terminada: {sesion.filepath} | "
+              f"Registros: {sesion.registros} | Sin cambios: {sesion.filtro.omitidos}", flush=True)
+        # El catálogo relee los archivos: fuera del hilo de muestreo para no atrasar el tick
+        hilo = threading.Thread(target=sesion.indexar, daemon=True)
+        hilo.start()
+        self._indexando.append(hilo)
+
+    def _cambiar(self, reloj):
+        """Cierra la sesión actual y abre la siguiente; devuelve el reloj a usar"""
+        anterior = self.actual
+        siguiente = self.pendientes.popleft() if self.pendientes and not self._salir else None
+        # Primero se abre la nueva: la fila de este tick ya va a su archivo
+        self.actual = self._abrir(siguiente) if siguiente else None
+        if anterior is not None:
+            self._cerrar(anterior)
+        if self.actual is None:
+            return None
+        if reloj is not None and not self._detener and reloj.intervalo == self.actual.intervalo:
+            return reloj  # Mismo intervalo y cambio por tiempo cumplido: los ticks siguen alineados
+        return RelojMuestreo(self.actual.intervalo, dormir=self._procesar_comandos)
+
+    def run(self):
+        ensure_directory_exists()
+        if self.ruta_control:
+            self._iniciar_control()
+            print(f"Control en {self.ruta_control}", flush=True)
+        reloj = None
+        terminada = True
+        try:
+            while True:
+                self._procesar_comandos()
+                if self.actual is None or self._detener or self.actual.vencida():
+                    reloj = self._cambiar(reloj)
+                    self._detener = False
+                if self.actual is None:
+                    if self._salir or not self.ruta_control:
+                        break
+                    # Sin capturas: esperar comandos
+                    self._procesar_comandos(0.5)
+                    continue
+                self.actual.registrar(self.manager.get_data())
+                reloj.esperar()
+        except KeyboardInterrupt:
+            print("\nDetenido (Ctrl+C).")
+        except BaseException:
+            # Un error deja la captura segmentada reanudable desde el logger
+            terminada = False
+            raise
+        finally:
+            if self.actual is not None:
+                self._cerrar(self.actual, terminada)
+                self.actual = None
+            if self._servidor is not None:
+                self._servidor.close()
+                if os.path.exists(self.ruta_control):
+                    os.unlink(self.ruta_control)
+                # Dar tiempo a que la respuesta de "salir" llegue al cliente
+                for hilo in self._clientes:
+                    hilo.join(timeout=1.0)
+            for hilo in self._indexando:
+                hilo.join()
+
+
+def enviar(comando, ruta=SOCKET_CONTROL):
+    """Manda un comando a un logger sin consola y devuelve su respuesta"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(ruta)
+        sock.sendall((json.dumps(comando) + "\n").encode())
+        with sock.makefile("rb") as entrada:
+            return json.loads(entrada.readline())
+
+
+def _agregar_opciones_trabajo(parser):
+    parser.add_argument("--muestra")
+    parser.add_argument("--recolector", default="Operador")
+    parser.add_argument("--intervalo", type=float, default=1.0)
+    parser.add_argument("--duracion", default="60", help="Segundos, o 5m / 1h / indefinido")
+    parser.add_argument("--formato", choices=("csv", "bin"), default="csv")
+    parser.add_argument("--modo", choices=MODOS, default=MODO_CONTINUO)
+    parser.add_argument("--serie", action="store_true", help="Guardar también la serie con resúmenes")
+
+
+def _trabajo_de_args(args):
+    return normalizar_trabajo({
+        "muestra": args.muestra, "recolector": args.recolector, "intervalo": args.intervalo,
+        "duracion": args.duracion, "formato": args.formato, "modo": args.modo, "serie": args.serie,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Logger sin consola con cola de capturas")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    correr = sub.add_parser("correr", help="Ejecutar capturas")
+    _agregar_opciones_trabajo(correr)
+    correr.add_argument("--repetir", type=int, default=1, help="Encolar la captura de --muestra N veces seguidas")
+    correr.add_argument("--trabajos", help="Archivo JSON con la lista de capturas")
+    correr.add_argument("--control", nargs="?", const=SOCKET_CONTROL,
+                        help=f"Aceptar comandos por socket (por defecto {SOCKET_CONTROL}) y no salir al vaciarse la cola")
+    correr.add_argument("--asyncio", action="store_true", help="Manager propio con asyncio")
+
+    mandar = sub.add_parser("enviar", help="Mandar un comando a un logger en marcha")
+    mandar.add_argument("cmd", choices=("estado", "encolar", "iniciar", "detener", "vaciar", "salir"))
+    _agregar_opciones_trabajo(mandar)
+    mandar.add_argument("--socket", default=SOCKET_CONTROL)
+    args = parser.parse_args(argv)
+
+    if args.comando == "enviar":
+        comando = {"cmd": args.cmd}
+        if args.cmd in ("encolar", "iniciar"):
+            try:
+                comando.update(_trabajo_de_args(args))
+            except ValueError as e:
+                print(e)
+                sys.exit(1)
+        try:
+            respuesta = enviar(comando, args.socket)
+        except OSError as e:
+            print(f"No hay un logger escuchando en {args.socket}: {e}")
+            sys.exit(1)
+        print(json.dumps(respuesta, ensure_ascii=False, indent=1))
+        sys.exit(0 if respuesta.get("ok") else 1)
+
+    try:
+        trabajos = leer_trabajos(args.trabajos) if args.trabajos else []
+        if args.muestra:
+            trabajos += [_trabajo_de_args(args)] * args.repetir
+    except (OSError, ValueError) as e:
+        print(f"Trabajos inválidos: {e}")
+        sys.exit(1)
+    if not trabajos and not args.control:
+        print("Nada que capturar: use --muestra, --trabajos o --control")
+        sys.exit(1)
+
+    INSTRUMENTOS.volcar_al_salir("cola_capturas")
+    print("Iniciando conexión con sensores...")
+    manager = crear_manager(args.asyncio)
+    time.sleep(1)
+    try:
+        ColaCapturas(manager, trabajos, args.control).run()
+    finally:
+        manager.stop()
+    print("Fin.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,316 @@
+import argparse
+import collections
+import csv
+import glob
+import hashlib
+import itertools
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from balanza import ParserBalanza
+from canales import CANALES
+import formato_binario
+
+# Conversión por lotes de capturas CSV históricas a .secbin normalizado.
+#
+# Cada archivo se valida y limpia fila por fila (memoria constante) en un proceso
+# del pool:
+#   - celdas vacías (Termopar6_C en capturas viejas) y columnas que faltan -> NaN
+#   - masa corrupta (".98   0.799"): se recupera la última trama válida de la celda, si no NaN
+#   - masa sin separador decimal ("0817", el punto se perdió en el puerto serie) -> NaN
+#   - valores fuera del rango del canal (canales.py, con TOLERANCIA_RANGO de margen) -> NaN
+#   - lecturas repetidas (mismo Timestamp_MS y mismos valores que una de las últimas
+#     VENTANA_DUPLICADOS filas, aunque cambie la hora del sistema) se descartan
+#   - filas cortadas o con fecha/hora inválida se descartan
+# El hash SHA-256 del CSV de origen queda en el encabezado del .secbin: si se vuelve
+# a correr sobre la misma carpeta, los archivos cuyo hash no cambió se saltan.
+CARPETA_ENTRADA = "Recolecciones"
+CARPETA_SALIDA = os.path.join(CARPETA_ENTRADA, "normalizado")
+REPORTE = "reporte.csv"
+VENTANA_DUPLICADOS = 256
+# Los rangos del registro son la escala de las barras del monitor: se acepta un margen de
+# esta fracción del rango a cada lado (tara levemente negativa, picos de radiación de 1100 W/m²)
+TOLERANCIA_RANGO = 0.1
+BLOQUE_HASH = 1 << 20
+
+CONVERTIDO = "convertido"
+VALIDADO = "validado"
+OMITIDO = "omitido"
+ERROR = "error"
+
+CAMPOS_REPORTE = (
+    "archivo", "estado", "filas_leidas", "filas_escritas", "duplicadas", "filas_invalidas",
+    "celdas_vacias", "celdas_invalidas", "fuera_de_rango", "masa_recuperada", "masa_invalida", "saltos_atras",
+    "columnas_faltantes", "sha256", "salida", "error",
+)
+
+_CANAL_POR_NOMBRE = {canal.nombre: canal for canal in CANALES}
+# Columnas float del registro .secbin (entre timestamp_ms y ventiladores) en orden
+_COLUMNAS_FLOAT = tuple(nombre for nombre, _ in formato_binario.COLUMNAS[3:-1])
+_FANS = tuple(canal.columna_csv for canal in CANALES if canal.clave == "ventiladores")
+# Columnas que identifican una lectura: una repetición del sondeo solo cambia Fecha/Hora_Sistema
+_COLUMNAS_LECTURA = ("Timestamp_MS", *(canal.columna_csv for canal in CANALES))
+_MASA_SIN_SEPARADOR = re.compile(r"[+-]?0\d+")
+NAN = float("nan")
+
+
+def _limites(canal):
+    margen = (canal.maximo - canal.minimo) * TOLERANCIA_RANGO
+    return canal.minimo - margen, canal.maximo + margen
+
+
+_LIMITES_MASA = _limites(_CANAL_POR_NOMBRE["masa_g"])
+
+
+def hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE_HASH), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def ruta_salida(ruta, carpeta_salida):
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    return os.path.join(carpeta_salida, base + formato_binario.EXTENSION)
+
+
+def _hash_convertido(salida):
+    """Hash del origen guardado en un .secbin ya convertido, o None"""
+    try:
+        with open(salida, "rb") as f:
+            metadatos, _ = formato_binario.leer_encabezado(f)
+    except (OSError, ValueError):
+        return None
+    return metadatos.get("sha256_origen")
+
+
+class _Limpieza:
+    """Contadores y conversión de celdas de un archivo"""
+
+    def __init__(self):
+        self.parser = ParserBalanza()
+        self.contadores = collections.Counter()
+
+    def en_rango(self, valor, limites):
+        minimo, maximo = limites
+        if minimo <= valor <= maximo:
+            return valor
+        self.contadores["fuera_de_rango"] += 1
+        return NAN
+
+    def numero(self, celda, limites):
+        celda = celda.strip()
+        if not celda:
+            self.contadores["celdas_vacias"] += 1
+            return NAN
+        try:
+            valor = float(celda.replace(",", "."))
+        except ValueError:
+            self.contadores["celdas_invalidas"] += 1
+            return NAN
+        return self.en_rango(valor, limites)
+
+    def masa(self, celda):
+        if not celda.strip():
+            self.contadores["celdas_vacias"] += 1
+            return NAN
+        if _MASA_SIN_SEPARADOR.fullmatch(celda.strip()):
+            self.contadores["masa_invalida"] += 1
+            return NAN
+        lectura = self.parser.parsear(celda.encode("ascii", "replace"))
+        if lectura is None:
+            # Dos lecturas pegadas por una lectura parcial del buffer: vale la última trama
+            lectura = self.parser.parsear(celda.split()[-1].encode("ascii", "replace"))
+            if lectura is None:
+                self.contadores["masa_invalida"] += 1
+                return NAN
+            self.contadores["masa_recuperada"] += 1
+        return self.en_rango(lectura.valor, _LIMITES_MASA)
+
+    def ventilador(self, celda):
+        celda = celda.strip()
+        if celda in ("True", "1"):
+            return True
+        if celda not in ("False", "0", ""):
+            self.contadores["celdas_invalidas"] += 1
+        return False
+
+
+def _filas_limpias(ruta, limpieza, metadatos):
+    """Genera (t_ms, masa, timestamp_ms, floats, fans) por fila válida y no repetida"""
+    with open(ruta, newline="") as f:
+        lector = csv.reader(f)
+        encabezado = next(lector, None)
+        if not encabezado:
+            return
+        indice = {nombre: i for i, nombre in enumerate(encabezado)}
+        faltantes = [
+            _CANAL_POR_NOMBRE[nombre].columna_csv for nombre in _COLUMNAS_FLOAT
+            if _CANAL_POR_NOMBRE[nombre].columna_csv not in indice
+        ]
+        limpieza.contadores["columnas_faltantes"] = len(faltantes)
+        posiciones = [indice.get(_CANAL_POR_NOMBRE[nombre].columna_csv) for nombre in _COLUMNAS_FLOAT]
+        limites = [_limites(_CANAL_POR_NOMBRE[nombre]) for nombre in _COLUMNAS_FLOAT]
+        pos_lectura = [indice[columna] for columna in _COLUMNAS_LECTURA if columna in indice]
+        pos_fans = [indice.get(columna) for columna in _FANS]
+        pos_masa = indice.get("Masa_g")
+        pos_ts = indice.get("Timestamp_MS")
+        recientes = collections.deque(maxlen=VENTANA_DUPLICADOS)
+        vistos = set()
+        anterior = None
+        for fila in lector:
+            limpieza.contadores["filas_leidas"] += 1
+            if len(fila) != len(encabezado):
+                limpieza.contadores["filas_invalidas"] += 1
+                continue
+            clave = tuple(fila[p] for p in pos_lectura)
+            if clave in vistos:
+                limpieza.contadores["duplicadas"] += 1
+                continue
+            if len(recientes) == recientes.maxlen:
+                vistos.discard(recientes[0])
+            recientes.append(clave)
+            vistos.add(clave)
+            try:
+                t = datetime.strptime(f"{fila[0]} {fila[1]}", "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                limpieza.contadores["filas_invalidas"] += 1
+                continue
+            if anterior is not None and t < anterior:
+                limpieza.contadores["saltos_atras"] += 1
+            anterior = t
+            if not metadatos:
+                metadatos.update(muestra=fila[indice["Muestra"]] if "Muestra" in indice else "",
+                                 recolector=fila[indice["Recolector"]] if "Recolector" in indice else "",
+                                 inicio=t.isoformat(timespec="seconds"))
+            try:
+                ts = int(fila[pos_ts]) if pos_ts is not None and fila[pos_ts].strip() else 0
+            except ValueError:
+                limpieza.contadores["celdas_invalidas"] += 1
+                ts = 0
+            valores = [limpieza.numero(fila[p], lim) if p is not None else NAN
+                       for p, lim in zip(posiciones, limites)]
+            fans = 0
+            for i, p in enumerate(pos_fans):
+                if p is not None and limpieza.ventilador(fila[p]):
+                    fans |= 1 << i
+            masa = limpieza.masa(fila[pos_masa]) if pos_masa is not None else NAN
+            yield int(t.timestamp() * 1000), masa, ts, valores, fans
+
+
+def procesar(ruta, carpeta_salida=CARPETA_SALIDA, forzar=False, solo_validar=False):
+    """Valida/limpia/convierte un CSV; devuelve la fila del reporte. Corre en un proceso del pool."""
+    reporte = dict.fromkeys(CAMPOS_REPORTE, "")
+    reporte["archivo"] = ruta
+    try:
+        sha = hash_archivo(ruta)
+        reporte["sha256"] = sha
+        salida = ruta_salida(ruta, carpeta_salida)
+        if not solo_validar and not forzar and _hash_convertido(salida) == sha:
+            reporte.update(estado=OMITIDO, salida=salida)
+            return reporte
+        limpieza = _Limpieza()
+        metadatos = {}
+        filas = _filas_limpias(ruta, limpieza, metadatos)
+        escritas = 0
+        if solo_validar:
+            for _ in filas:
+                escritas += 1
+        else:
+            temporal = salida + ".tmp"
+            with open(temporal, "wb", buffering=1 << 16) as out:
+                # El encabezado necesita muestra/recolector/inicio, que salen de la primera fila
+                primera = next(filas, None)
+                metadatos.update(origen=os.path.basename(ruta), sha256_origen=sha)
+                out.write(formato_binario.empaquetar_encabezado(metadatos))
+                pack = formato_binario.FORMATO_REGISTRO.pack
+                for t_ms, masa, ts, valores, fans in itertools.chain([primera] if primera else [], filas):
+                    out.write(pack(t_ms, masa, ts, *valores, fans))
+                    escritas += 1
+                out.flush()
+                os.fsync(out.fileno())
+            # Nunca queda un .secbin a medias con el hash correcto
+            os.replace(temporal, salida)
+            reporte["salida"] = salida
+        reporte.update(limpieza.contadores)
+        reporte.update(estado=VALIDADO if solo_validar else CONVERTIDO, filas_escritas=escritas)
+    except (OSError, csv.Error, UnicodeDecodeError, KeyError) as e:
+        reporte.update(estado=ERROR, error=f"{type(e).__name__}: {e}")
+    return reporte
+
+
+def _trabajo(args):
+    return procesar(*args)
+
+
+def listar(entradas, patron="*.csv"):
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            rutas += glob.glob(os.path.join(entrada, patron))
+        else:
+            rutas += glob.glob(entrada)
+    return sorted(set(rutas))
+
+
+def convertir(entradas, carpeta_salida=CARPETA_SALIDA, procesos=None, forzar=False, solo_validar=False):
+    """Procesa todos los archivos en paralelo; devuelve las filas del reporte en el orden de entrada"""
+    rutas = listar(entradas)
+    if not solo_validar:
+        os.makedirs(carpeta_salida, exist_ok=True)
+    trabajos = [(ruta, carpeta_salida, forzar, solo_validar) for ruta in rutas]
+    if procesos == 1 or len(trabajos) <= 1:
+        return [_trabajo(t) for t in trabajos]
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        return list(pool.map(_trabajo, trabajos))
+
+
+def _leer_reporte(ruta):
+    try:
+        with open(ruta, newline="") as f:
+            return {fila["archivo"]: fila for fila in csv.DictReader(f)}
+    except OSError:
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida, limpia y convierte capturas CSV a .secbin normalizado")
+    parser.add_argument("entradas", nargs="*", default=[CARPETA_ENTRADA], help="Carpetas, archivos o patrones glob")
+    parser.add_argument("--salida", default=CARPETA_SALIDA, help="Carpeta de los .secbin y del reporte")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto todos los núcleos)")
+    parser.add_argument("--forzar", action="store_true", help="Reconvertir aunque el hash no haya cambiado")
+    parser.add_argument("--solo-validar", action="store_true", help="Solo revisar y reportar, sin escribir .secbin")
+    args = parser.parse_args(argv)
+
+    reportes = convertir(args.entradas, args.salida, args.procesos, args.forzar, args.solo_validar)
+    if not reportes:
+        print("No se encontraron archivos CSV.")
+        return
+    ruta_reporte = os.path.join(args.salida, REPORTE)
+    # Los omitidos conservan los contadores de la corrida en que se convirtieron
+    anteriores = _leer_reporte(ruta_reporte)
+    for r in reportes:
+        if r["estado"] == OMITIDO and r["archivo"] in anteriores:
+            r.update(anteriores[r["archivo"]], estado=OMITIDO)
+    print(f"{'Archivo':45} {'Estado':11} {'Filas':>6} {'Dup':>4} {'Inv':>4} {'Vacías':>6} {'Rango':>5} {'Masa rec/inv':>12}")
+    for r in reportes:
+        print(f"{os.path.basename(r['archivo'])[:45]:45} {r['estado']:11} {r['filas_escritas'] or 0:>6} "
+              f"{r['duplicadas'] or 0:>4} {r['filas_invalidas'] or 0:>4} {r['celdas_vacias'] or 0:>6} {r['fuera_de_rango'] or 0:>5} "
+              f"{r['masa_recuperada'] or 0:>5}/{r['masa_invalida'] or 0:<6}" + (f"  {r['error']}" if r["error"] else ""))
+    if not args.solo_validar:
+        with open(ruta_reporte, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CAMPOS_REPORTE)
+            writer.writeheader()
+            writer.writerows(reportes)
+        print(f"Reporte en {ruta_reporte}")
+    estados = collections.Counter(r["estado"] for r in reportes)
+    print(" | ".join(f"{estado}: {n}" for estado, n in sorted(estados.items())))
+    if estados[ERROR]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,203 @@
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+from canales import ENCABEZADOS_CSV
+from instrumentacion import histograma
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se lee registro por registro
+    np = None
+
+NAN = float("nan")
+_FLUSH = histograma("logger.flush")  # El mismo instrumento que el EscritorCSV
+
+# Formato binario de captura (.secbin)
+#
+#   MAGIC (8 bytes) | largo del encabezado (uint32 LE) | encabezado JSON | relleno a 8 bytes
+#   registros de ancho fijo (FORMATO_REGISTRO), uno por fila capturada
+#
+# Los metadatos (muestra, recolector, inicio, intervalo) van una sola vez en el
+# encabezado. Los registros son little-endian y alineados a 8 bytes, así el
+# archivo se puede mapear directo con numpy.memmap sin parsear nada.
+EXTENSION = ".secbin"
+MAGIC = b"SECBIN01"
+FORMATO_REGISTRO = struct.Struct("<qdq11fI")
+COLUMNAS = (
+    ("t_ms", "<i8"),            # Hora del sistema en ms desde epoch
+    ("masa_g", "<f8"),
+    ("timestamp_ms", "<i8"),    # Marca del ESP
+    ("temp1_C", "<f4"),
+    ("humedad1_RH", "<f4"),
+    ("temperatura2_C", "<f4"),
+    ("humedad2_RH", "<f4"),
+    ("radiacion_W_m2", "<f4"),
+    ("termopar1_C", "<f4"),
+    ("termopar2_C", "<f4"),
+    ("termopar3_C", "<f4"),
+    ("termopar4_C", "<f4"),
+    ("termopar5_C", "<f4"),
+    ("termopar6_C", "<f4"),
+    ("ventiladores", "<u4"),    # Bit i encendido = ventilador i+1 encendido
+)
+
+def empaquetar_encabezado(metadatos):
+    """Bloque de encabezado de un .secbin (MAGIC, largo, JSON y relleno); los registros van a continuación"""
+    encabezado = dict(metadatos)
+    encabezado["formato"] = FORMATO_REGISTRO.format
+    encabezado["columnas"] = [list(c) for c in COLUMNAS]
+    texto = json.dumps(encabezado, ensure_ascii=False).encode("utf-8")
+    bloque = MAGIC + struct.pack("<I", len(texto)) + texto
+    return bloque + b" " * (-len(bloque) % 8)
+
+
+def leer_encabezado(f):
+    """Lee el encabezado de un .secbin abierto; devuelve (metadatos, offset de datos)"""
+    if f.read(8) != MAGIC:
+        raise ValueError("No es un archivo .secbin")
+    (largo,) = struct.unpack("<I", f.read(4))
+    metadatos = json.loads(f.read(largo).decode("utf-8"))
+    if metadatos.get("formato") != FORMATO_REGISTRO.format:
+        raise ValueError(f"Formato de registro no soportado: {metadatos.get('formato')}")
+    offset = 12 + largo
+    return metadatos, offset + (-offset % 8)
+
+
+class EscritorBinario:
+    """Escribe registros .secbin con la misma política de checkpoint que EscritorCSV"""
+
+    def __init__(self, filepath, metadatos, flush_cada_s=2.0, flush_cada_filas=100, fsync=False):
+        self.flush_cada_s = flush_cada_s
+        self.flush_cada_filas = flush_cada_filas
+        self.fsync = fsync
+        self.file = open(filepath, mode='wb', buffering=1 << 16)
+        self.file.write(empaquetar_encabezado(metadatos))
+        self.pendientes = 0
+        self.checkpoints = 0
+        self._ultimo_checkpoint = time.monotonic()
+
+    def escribir(self, now, d, vencidos=frozenset()):
+        # Campos de un enlace caído se guardan como NaN (vacíos al exportar a CSV)
+        def v(key):
+            return NAN if key in vencidos else d[key]
+
+        termopares = tuple(d['termopares_C'][:6])
+        if len(termopares) < 6:
+            termopares += (0.0,) * (6 - len(termopares))
+        if 'termopares_C' in vencidos:
+            termopares = (NAN,) * 6
+        fans = 0
+        for i, f in enumerate(d['ventiladores']):
+            if f:
+                fans |= 1 << i
+        self.file.write(FORMATO_REGISTRO.pack(
+            int(now.timestamp() * 1000), v('masa_g'), int(d['timestamp_ms']),
+            v('temp1_C'), v('humedad1_RH'), v('temperatura2_C'), v('humedad2_RH'),
+            v('radiacion_W_m2'), *termopares, fans
+        ))
+        self.pendientes += 1
+        self.checkpoint_si_vence()
+
+    def checkpoint_si_vence(self):
+        """Checkpoint si hay registros pendientes y se cumplió la política; se llama en cada tick"""
+        if self.pendientes and (self.pendientes >= self.flush_cada_filas
+                                or time.monotonic() - self._ultimo_checkpoint >= self.flush_cada_s):
+            self.checkpoint()
+
+    def checkpoint(self):
+        t0 = time.perf_counter_ns()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        _FLUSH.registrar_ns(time.perf_counter_ns() - t0)
+        self.pendientes = 0
+        self.checkpoints += 1
+        self._ultimo_checkpoint = time.monotonic()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.checkpoint()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cargar(filepath):
+    """Mapea un .secbin con numpy sin copiar; devuelve (metadatos, array estructurado)"""
+    if np is None:
+        raise RuntimeError("cargar() necesita numpy; usa iterar_registros() en su lugar")
+    with open(filepath, 'rb') as f:
+        metadatos, offset = leer_encabezado(f)
+    dtype = np.dtype(list(COLUMNAS))
+    n = (os.path.getsize(filepath) - offset) // dtype.itemsize
+    if n == 0:
+        return metadatos, np.zeros(0, dtype=dtype)
+    return metadatos, np.memmap(filepath, dtype=dtype, mode='r', offset=offset, shape=(n,))
+
+
+def iterar_registros(filepath):
+    """Recorre los registros como tuplas (orden de COLUMNAS) sin numpy"""
+    with open(filepath, 'rb') as f:
+        _, offset = leer_encabezado(f)
+        if os.path.getsize(filepath) <= offset:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+            # Si la captura se cortó a medio registro, se ignora el trozo final
+            fin = offset + (len(datos) - offset) // FORMATO_REGISTRO.size * FORMATO_REGISTRO.size
+            yield from FORMATO_REGISTRO.iter_unpack(datos[offset:fin])
+
+
+def _num(v):
+    # float32 -> texto corto (27.75, no 27.75000047...); NaN -> celda vacía
+    return "" if math.isnan(v) else f"{v:.7g}"
+
+
+def filas_csv(filepath):
+    """Recorre los registros ya convertidos a filas del CSV clásico (sin encabezado)"""
+    with open(filepath, 'rb') as f:
+        metadatos, _ = leer_encabezado(f)
+    muestra = metadatos.get("muestra", "")
+    recolector = metadatos.get("recolector", "")
+    for t_ms, masa, ts, *resto in iterar_registros(filepath):
+        valores, fans = resto[:-1], resto[-1]
+        now = datetime.fromtimestamp(t_ms / 1000)
+        yield [
+            now.strftime("%Y-%m-%d"),
+            now.strftime("%H:%M:%S"),
+            ts,
+            muestra,
+            recolector,
+            *[_num(v) for v in valores],
+            bool(fans & 1), bool(fans & 2), bool(fans & 4),
+            "" if math.isnan(masa) else repr(masa),
+        ]
+
+
+def exportar_csv(filepath, destino=None):
+    """Convierte un .secbin al CSV clásico de Recolecciones; devuelve la ruta creada"""
+    if destino is None:
+        destino = os.path.splitext(filepath)[0] + ".csv"
+    with open(destino, mode='w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(ENCABEZADOS_CSV)
+        writer.writerows(filas_csv(filepath))
+    return destino
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Uso: python formato_binario.py archivo{EXTENSION} [...]")
+        sys.exit(1)
+    for ruta in sys.argv[1:]:
+        print(f"{ruta} -> {exportar_csv(ruta)}")
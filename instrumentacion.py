@@ -0,0 +1,188 @@
+import atexit
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+# Contadores e histogramas de latencia baratos para dejar siempre prendidos.
+#
+# Cada punto caliente (callback MQTT, hilo de la balanza, logger, monitor) toma su
+# instrumento una vez al importar el módulo y en cada evento solo suma enteros:
+#   _DECODIFICAR = histograma("mqtt.decodificar")
+#   t0 = time.perf_counter_ns(); ...; _DECODIFICAR.registrar_ns(time.perf_counter_ns() - t0)
+# No hay locks: con varios hilos sumando a la vez se puede perder alguna cuenta, lo que
+# para estadísticas da igual. SECADOR_INSTRUMENTOS=0 los reemplaza por instrumentos nulos.
+ACTIVO = os.environ.get("SECADOR_INSTRUMENTOS", "1") != "0"
+CARPETA_ESTADISTICAS = "Recolecciones/estadisticas"
+VENTANA_TASA_S = 10.0
+_CUBETAS = 160  # Con 4 cubetas por potencia de 2 alcanza hasta ~10^11 µs
+
+
+def _limite_superior(i):
+    """Mayor valor en µs que cae en la cubeta i"""
+    if i < 8:
+        return i
+    bits = i // 4 + 2
+    return ((5 + i % 4) << (bits - 3)) - 1
+
+
+class _Tasa:
+    """Eventos por segundo en una ventana que se renueva cada VENTANA_TASA_S"""
+
+    def tasa(self):
+        ahora = time.monotonic()
+        dt = ahora - self._t_ventana
+        tasa = (self.n - self._n_ventana) / dt if dt > 0 else 0.0
+        if dt >= VENTANA_TASA_S:
+            self._t_ventana, self._n_ventana = ahora, self.n
+        return tasa
+
+
+class Contador(_Tasa):
+    __slots__ = ("nombre", "n", "_t_ventana", "_n_ventana")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.n = 0
+        self._t_ventana = time.monotonic()
+        self._n_ventana = 0
+
+    def sumar(self, k=1):
+        self.n += k
+
+    def resumen(self):
+        return {"n": self.n, "por_s": round(self.tasa(), 2)}
+
+
+class Histograma(_Tasa):
+    """Histograma de duraciones con cubetas logarítmicas fijas: registrar es O(1) y sin memoria nueva"""
+    __slots__ = ("nombre", "n", "total_ns", "maximo_ns", "_cubetas", "_t_ventana", "_n_ventana")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.n = 0
+        self.total_ns = 0
+        self.maximo_ns = 0
+        self._cubetas = [0] * _CUBETAS
+        self._t_ventana = time.monotonic()
+        self._n_ventana = 0
+
+    def registrar_ns(self, ns):
+        self.n += 1
+        self.total_ns += ns
+        if ns > self.maximo_ns:
+            self.maximo_ns = ns
+        # Cubetas logarítmicas con 4 subdivisiones por potencia de 2 (error < 25 %):
+        # 0..7 µs exactos, después [8,10) [10,12) [12,14) [14,16) [16,20) ...
+        us = ns // 1000
+        if us < 8:
+            self._cubetas[us] += 1
+        else:
+            bits = us.bit_length()
+            self._cubetas[min((bits - 2) * 4 + ((us >> (bits - 3)) & 3), _CUBETAS - 1)] += 1
+
+    def registrar(self, segundos):
+        self.registrar_ns(int(segundos * 1e9))
+
+    def percentil(self, q):
+        """Cota superior en µs del percentil q (0..1)"""
+        if not self.n:
+            return 0
+        objetivo = q * self.n
+        acumulado = 0
+        for i, cuenta in enumerate(self._cubetas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return min(_limite_superior(i), self.maximo_ns // 1000)
+        return self.maximo_ns // 1000
+
+    def resumen(self):
+        return {
+            "n": self.n,
+            "por_s": round(self.tasa(), 2),
+            "media_us": round(self.total_ns / self.n / 1000, 2) if self.n else 0,
+            "p50_us": self.percentil(0.50),
+            "p95_us": self.percentil(0.95),
+            "p99_us": self.percentil(0.99),
+            "max_us": round(self.maximo_ns / 1000, 1),
+        }
+
+
+class _Nulo:
+    """Instrumento que no hace nada (SECADOR_INSTRUMENTOS=0)"""
+    n = 0
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def sumar(self, k=1):
+        pass
+
+    def registrar_ns(self, ns):
+        pass
+
+    def registrar(self, segundos):
+        pass
+
+
+class Instrumentos:
+    """Registro de instrumentos por nombre; uno por proceso (INSTRUMENTOS)"""
+
+    def __init__(self, activo=ACTIVO):
+        self.activo = activo
+        self.contadores = {}
+        self.histogramas = {}
+        self.inicio = datetime.now()
+
+    def contador(self, nombre):
+        if nombre not in self.contadores:
+            self.contadores[nombre] = Contador(nombre) if self.activo else _Nulo(nombre)
+        return self.contadores[nombre]
+
+    def histograma(self, nombre):
+        if nombre not in self.histogramas:
+            self.histogramas[nombre] = Histograma(nombre) if self.activo else _Nulo(nombre)
+        return self.histogramas[nombre]
+
+    def resumen(self, solo_usados=True):
+        """{nombre: dict} de todos los instrumentos, ordenado por nombre"""
+        if not self.activo:
+            return {}
+        todos = {**self.contadores, **self.histogramas}
+        return {nombre: todos[nombre].resumen() for nombre in sorted(todos)
+                if not solo_usados or todos[nombre].n}
+
+    def volcar(self, ruta):
+        datos = {
+            "programa": os.path.basename(sys.argv[0]),
+            "pid": os.getpid(),
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "fin": datetime.now().isoformat(timespec="seconds"),
+            "instrumentos": self.resumen(),
+        }
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=1)
+        return ruta
+
+    def volcar_al_salir(self, programa, carpeta=CARPETA_ESTADISTICAS):
+        """Guarda el resumen en carpeta/<programa>_<fecha>.json cuando termine el proceso"""
+        if not self.activo:
+            return
+
+        def volcar():
+            if not any(i.n for i in (*self.contadores.values(), *self.histogramas.values())):
+                return
+            try:
+                os.makedirs(carpeta, exist_ok=True)
+                ruta = os.path.join(carpeta, f"{programa}_{self.inicio:%Y-%m-%d_%H-%M-%S}.json")
+                print(f"Estadísticas en {self.volcar(ruta)}")
+            except OSError as e:
+                print(f"No se pudieron guardar las estadísticas: {e}")
+
+        atexit.register(volcar)
+
+
+INSTRUMENTOS = Instrumentos()
+contador = INSTRUMENTOS.contador
+histograma = INSTRUMENTOS.histograma
@@ -0,0 +1,16 @@
+#!/bin/bash
+
+# 1. Moverse al directorio del proyecto (CRUCIAL para que encuentre los archivos)
+cd /home/alternas/Proyectos/monitor-cli
+
+# 2. Activar el entorno virtual
+source .venv/bin/activate
+
+# 3. Ejecutar con uv
+# El demonio abre el broker y la balanza una sola vez; monitor.py y logger.py
+# se conectan a él automáticamente y pueden correr al mismo tiempo.
+uv run adquisicion.py
+
+# 4. Pausa al final (Opcional)
+echo "El demonio ha finalizado."
+read -p "Presiona Enter para cerrar esta ventana..."
@@ -1,135 +1,5 @@
-import csv
-import time
-import os
-from datetime import datetime
-from sensor_core import SensorManager
-
-CARPETA_SALIDA = "Recolecciones"
-
-def get_input(prompt, default=None):
-    text = f"{prompt}"
-    if default:
-        text += f" [{default}]"
-    text += ": "
-    val = input(text).strip()
-    return val if val else default
-
-def get_duration_seconds():
-    print("\nSeleccione tiempo de captura:")
-    print("1. 1 minuto")
-    print("2. 5 minutos")
-    print("3. 1 hora")
-    print("4. 3 horas")
-    print("5. Indefinido (Detener manualmente)")
-    opcion = input("Opción (1-5): ").strip()
-    mapping = {"1": 60, "2": 300, "3": 3600, "4": 10800, "5": -1}
-    return mapping.get(opcion, 60)
-
-def ensure_directory_exists():
-    if not os.path.exists(CARPETA_SALIDA):
-        try:
-            os.makedirs(CARPETA_SALIDA)
-        except OSError:
-            pass
-
-def run_logger():
-    ensure_directory_exists()
-    print("Iniciando conexión con sensores...")
-    manager = SensorManager()
-    manager.start()
-    time.sleep(1)
-
-    while True:
-        print("\n" + "="*50)
-        print("   CONFIGURACIÓN DE NUEVA CAPTURA")
-        print("="*50)
-        
-        nombre_muestra = get_input("Nombre de la muestra", "Muestra_Test").replace(" ", "_")
-        recolector = get_input("Nombre del recolector", "Operador").replace(" ", "_")
-        try:
-            intervalo = float(get_input("Intervalo (seg)", "1.0"))
-        except ValueError:
-            intervalo = 1.0
-        
-        duration_sec = get_duration_seconds()
-        
-        fecha_archivo = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"{nombre_muestra}_{recolector}_{fecha_archivo}.csv"
-        filepath = os.path.join(CARPETA_SALIDA, filename)
-        
-        # ACTUALIZADO: Headers para incluir los 6 termopares
-        headers = [
-            "Fecha_Sistema", "Hora_Sistema", "Timestamp_MS", "Muestra", "Recolector",
-            "Temp1_C", "Hum1_RH", "Temp2_C", "Hum2_RH", "Radiacion_W_m2", 
-            "Termopar1_C", "Termopar2_C", "Termopar3_C", "Termopar4_C", "Termopar5_C", "Termopar6_C",
-            "Fan1", "Fan2", "Fan3", 
-            "Masa_g" 
-        ]
-
-        print(f"\nIniciando captura en: {filepath}")
-        if duration_sec == -1: print("MODO INDEFINIDO: Ctrl+C para parar.")
-        
-        start_time = time.time()
-        
-        try:
-            with open(filepath, mode='w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(headers)
-                
-                while True:
-                    elapsed = time.time() - start_time
-                    if duration_sec != -1 and elapsed >= duration_sec:
-                        print("\nTiempo finalizado.")
-                        break
-
-                    d = manager.get_data()
-                    now = datetime.now()
-                    
-                    # Obtenemos la lista de termopares con seguridad
-                    # (rellenamos con ceros si por alguna razón la lista es menor a 6)
-                    termopares = d.get('termopares_C', [0.0]*6)
-                    if len(termopares) < 6: 
-                        termopares += [0.0] * (6 - len(termopares))
-
-                    row = [
-                        now.strftime("%Y-%m-%d"),
-                        now.strftime("%H:%M:%S"),
-                        d['timestamp_ms'],
-                        nombre_muestra,
-                        recolector,
-                        # CAMBIO: Key actualizada a 'temp1_C'
-                        d['temp1_C'], 
-                        d['humedad1_RH'],
-                        d['temperatura2_C'], 
-                        d['humedad2_RH'],
-                        d['radiacion_W_m2'], 
-                        # CAMBIO: Desglose de la lista de termopares
-                        termopares[0], termopares[1], termopares[2], 
-                        termopares[3], termopares[4], termopares[5],
-                        d['ventiladores'][0], d['ventiladores'][1], d['ventiladores'][2],
-                        d['masa_str'] 
-                    ]
-                    
-                    writer.writerow(row)
-                    file.flush()
-                    
-                    if duration_sec == -1:
-                        print(f"\rCapturando... {int(elapsed)}s | Masa: {d['masa_str']}  ", end="")
-                    else:
-                        pct = (elapsed / duration_sec) * 100
-                        print(f"\rProgreso: {pct:.1f}% | Registros: {int(elapsed/intervalo)}", end="")
-
-                    time.sleep(intervalo)
-
-        except KeyboardInterrupt:
-            print("\nCaptura detenida (Ctrl+C).")
-        
-        print(f"\nGuardado en: {filepath}")
-        if input("\n¿Nueva captura? (s/n): ").lower() != 's':
-            break
-
-    manager.stop()
-    print("Fin.")
+# Alias de logger.py (antes era una copia completa); toda la lógica vive allí
+from logger import run_logger
 
 if __name__ == "__main__":
-    run_logger()
\ No newline at end of file
+    run_logger()
@@ -1,11 +1,44 @@
 import csv
 import time
 import os
+import sys
+import sqlite3
 from datetime import datetime
-from sensor_core import SensorManager
+from adquisicion import crear_manager
+from catalogo import registrar_captura
+from instrumentacion import INSTRUMENTOS, histograma
+from canales import CANALES, CLAVES_CSV, ENCABEZADOS_CSV, compilar_extractor
+from formato_binario import EscritorBinario, EXTENSION as EXTENSION_BINARIA
+from serie_tiempo import AlmacenSerie, EXTENSION as EXTENSION_SERIE
+from segmentos import (EscritorSegmentado, EXTENSION_MANIFIESTO, SEGMENTO_MAX_S, abandonar,
+                       capturado_s, interrumpidas, leer_manifiesto, recuperar_segmentos,
+                       ruta_manifiesto)
 
 CARPETA_SALIDA = "Recolecciones"
 
+# Política de escritura: las filas se acumulan en memoria y se bajan a disco
+# cada FLUSH_CADA_S segundos o cada FLUSH_CADA_FILAS filas, lo que ocurra primero.
+# Es lo máximo que se pierde si se corta la luz.
+FLUSH_CADA_S = 2.0
+FLUSH_CADA_FILAS = 100
+FSYNC_EN_CHECKPOINT = False  # True: además fuerza la escritura física en la SD/eMMC
+
+# Instrumentos (instrumentacion.py): cuánto tarda una fila, un checkpoint y cuánto se atrasa cada tick
+_ESCRITURA = histograma("logger.escritura")
+_FLUSH = histograma("logger.flush")
+_ATRASO_TICK = histograma("logger.atraso_tick")
+
+# Modos de registro
+MODO_CONTINUO = "continuo"  # Una fila por tick, aunque los datos no hayan cambiado
+MODO_CAMBIOS = "cambios"    # Solo si el ESP publicó un timestamp_ms nuevo o llegó una lectura de la balanza
+MODO_BANDA = "banda"        # Como "cambios", pero además algún canal debe moverse más que su banda muerta
+MODOS = (MODO_CONTINUO, MODO_CAMBIOS, MODO_BANDA)
+
+# Encabezados, orden de columnas y bandas muertas salen del registro de canales
+_fila_csv = compilar_extractor(csv=True)
+_valores_banda = compilar_extractor(numerico=True)
+_BANDAS = tuple(canal.banda for canal in CANALES)  # None: cualquier cambio cuenta (ventiladores)
+
 def get_input(prompt, default=None):
     text = f"{prompt}"
     if default:
@@ -25,6 +58,282 @@ def get_duration_seconds():
     mapping = {"1": 60, "2": 300, "3": 3600, "4": 10800, "5": -1}
     return mapping.get(opcion, 60)
 
+class RelojMuestreo:
+    """Marca ticks absolutos cada `intervalo` segundos sobre time.monotonic().
+
+    El tiempo que tarda escribir una fila no se acumula: cada espera apunta al
+    siguiente tick, no a "ahora + intervalo". Si una fila se atrasa más de un
+    intervalo, los ticks que ya pasaron se cuentan como perdidos y se salta al
+    actual en vez de disparar varias filas seguidas.
+    """
+
+    def __init__(self, intervalo, tolerancia=None, dormir=time.sleep):
+        if not intervalo > 0:
+            raise ValueError("El intervalo debe ser positivo")
+        self.intervalo = intervalo
+        self.dormir = dormir  # Reemplazable para poder despertar antes (comandos del modo sin consola)
+        # Atraso a partir del cual un tick se cuenta como tardío
+        self.tolerancia = intervalo * 0.5 if tolerancia is None else tolerancia
+        self.inicio = time.monotonic()
+        self.tick = 0
+        self.perdidos = 0
+        self.tardios = 0
+
+    def transcurrido(self):
+        return time.monotonic() - self.inicio
+
+    def esperar(self):
+        """Duerme hasta el próximo tick"""
+        self.tick += 1
+        objetivo = self.inicio + self.tick * self.intervalo
+        ahora = time.monotonic()
+        if ahora < objetivo:
+            self.dormir(objetivo - ahora)
+            # Lo que el sistema operativo se pasó al despertar (negativo si un comando lo despertó antes)
+            _ATRASO_TICK.registrar(max(0.0, time.monotonic() - objetivo))
+            return
+        atraso = ahora - objetivo
+        _ATRASO_TICK.registrar(atraso)
+        saltados = int(atraso // self.intervalo)
+        if saltados:
+            self.perdidos += saltados
+            self.tick += saltados
+            atraso -= saltados * self.intervalo
+        if atraso > self.tolerancia:
+            self.tardios += 1
+
+class EscritorCSV:
+    """Escritor CSV con buffer que solo hace flush en cada checkpoint"""
+
+    def __init__(self, filepath, nombre_muestra, recolector, flush_cada_s=FLUSH_CADA_S,
+                 flush_cada_filas=FLUSH_CADA_FILAS, fsync=FSYNC_EN_CHECKPOINT):
+        self.nombre_muestra = nombre_muestra
+        self.recolector = recolector
+        self.flush_cada_s = flush_cada_s
+        self.flush_cada_filas = flush_cada_filas
+        self.fsync = fsync
+        # Buffer grande para que el sistema operativo no vea nada hasta el checkpoint
+        self.file = open(filepath, mode='w', newline='', buffering=1 << 16)
+        self._writer = csv.writer(self.file)
+        self._writer.writerow(ENCABEZADOS_CSV)
+        self.pendientes = 0
+        self.checkpoints = 0
+        self._ultimo_checkpoint = time.monotonic()
+
+    def escribir(self, now, d, vencidos=frozenset()):
+        fila = _fila_csv(d)
+        if vencidos:
+            # Los campos cuyo enlace dejó de mandar datos se escriben vacíos (NaN al analizar)
+            # en lugar de repetir el último valor congelado
+            fila = ["" if clave in vencidos else valor for clave, valor in zip(CLAVES_CSV, fila)]
+        self.writerow((
+            now.strftime("%Y-%m-%d"),
+            now.strftime("%H:%M:%S"),
+            d.timestamp_ms,
+            self.nombre_muestra,
+            self.recolector,
+            *fila,
+        ))
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+        self.pendientes += 1
+        self.checkpoint_si_vence()
+
+    def checkpoint_si_vence(self):
+        """Checkpoint si hay filas pendientes y se cumplió la política.
+
+        Se llama en cada tick, también en los que no escriben (modos cambios/banda):
+        si no, las filas en el buffer podrían quedar ahí mucho más que FLUSH_CADA_S.
+        """
+        if self.pendientes and (self.pendientes >= self.flush_cada_filas
+                                or time.monotonic() - self._ultimo_checkpoint >= self.flush_cada_s):
+            self.checkpoint()
+
+    def checkpoint(self):
+        t0 = time.perf_counter_ns()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        _FLUSH.registrar_ns(time.perf_counter_ns() - t0)
+        self.pendientes = 0
+        self.checkpoints += 1
+        self._ultimo_checkpoint = time.monotonic()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.checkpoint()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # También se ejecuta con Ctrl+C: las filas pendientes nunca se pierden
+        self.close()
+
+class FiltroCambios:
+    """Decide en cada tick si la lectura merece una fila según el modo de registro"""
+
+    def __init__(self, manager, modo=MODO_CONTINUO):
+        self.modo = modo
+        self.omitidos = 0
+        # La suscripción solo se usa para saber si la balanza mandó algo entre ticks
+        self._sub = manager.subscribe() if modo != MODO_CONTINUO else None
+        self._ultimo_ts = None
+        self._ultima = None  # Última lectura escrita
+
+    def hay_cambio(self, d):
+        if self._sub is None:
+            return True
+        nueva_balanza = any(m.origen == "serial" for m in self._sub.drain())
+        nuevo_esp = d['timestamp_ms'] != self._ultimo_ts
+        if not (nueva_balanza or nuevo_esp):
+            self.omitidos += 1
+            return False
+        if self.modo == MODO_BANDA and self._ultima is not None and not self._supera_banda(d):
+            self.omitidos += 1
+            return False
+        self._ultimo_ts = d['timestamp_ms']
+        self._ultima = d
+        return True
+
+    def _supera_banda(self, d):
+        for actual, anterior, banda in zip(_valores_banda(d), _valores_banda(self._ultima), _BANDAS):
+            if banda is None:
+                if actual != anterior:
+                    return True
+            elif abs(actual - anterior) > banda:
+                return True
+        return False
+
+    def close(self):
+        if self._sub is not None:
+            self._sub.close()
+
+class SesionCaptura:
+    """Una captura: nombres de archivo, escritores, filtro y contadores.
+
+    La usan el logger interactivo y el modo sin consola (cola_capturas.py). El
+    bucle de muestreo es del llamador: en cada tick llama a registrar().
+    `reanudar` es la ruta del manifiesto de una captura interrumpida.
+    """
+
+    def __init__(self, manager, nombre_muestra, recolector, intervalo=1.0, duracion_s=60,
+                 binario=False, modo=MODO_CONTINUO, serie=False, inicio=None, reanudar=None, carpeta=None):
+        self.manager = manager
+        self.carpeta = carpeta or CARPETA_SALIDA  # secadores.py: una carpeta por secador
+        self.nombre_muestra = nombre_muestra
+        self.recolector = recolector
+        self.intervalo = intervalo
+        self.duracion_s = duracion_s
+        self.binario = binario
+        self.modo = modo if modo in MODOS else MODO_CONTINUO
+        self.serie = serie
+        self.inicio = inicio or datetime.now()
+        if reanudar:
+            base = os.path.basename(reanudar)[:-len(EXTENSION_MANIFIESTO)]
+        else:
+            base = f"{nombre_muestra}_{recolector}_{self.inicio.strftime('%Y-%m-%d_%H-%M-%S')}"
+        self.extension = EXTENSION_BINARIA if binario else ".csv"
+        if not reanudar:
+            base = self._base_libre(base)
+        self.ruta_serie = os.path.join(self.carpeta, base + EXTENSION_SERIE)
+        # Las capturas largas van en segmentos con manifiesto (segmentos.py) para poder
+        # reanudarlas tras un corte; las cortas siguen siendo un único archivo
+        self.segmentada = reanudar is not None or duracion_s == -1 or duracion_s > SEGMENTO_MAX_S
+        if self.segmentada:
+            self.filepath = ruta_manifiesto(self.carpeta, base)
+        else:
+            self.filepath = os.path.join(self.carpeta, base + self.extension)
+        self.metadatos = {"muestra": nombre_muestra, "recolector": recolector,
+                          "inicio": self.inicio.isoformat(timespec="seconds"), "intervalo_s": intervalo}
+        self.writer = None
+        self.almacen = None
+        self.filtro = None
+        self.registros = 0
+        self._inicio_mono = None
+
+    def _base_libre(self, base):
+        # Dos capturas seguidas de la misma muestra pueden empezar en el mismo segundo
+        candidata, n = base, 1
+        while any(os.path.exists(os.path.join(self.carpeta, candidata + ext))
+                  for ext in (self.extension, EXTENSION_MANIFIESTO, EXTENSION_SERIE)):
+            n += 1
+            candidata = f"{base}_{n}"
+        return candidata
+
+    def _abrir_archivo(self, ruta):
+        if self.binario:
+            # Metadatos una sola vez en el encabezado; exportable con formato_binario.exportar_csv
+            return EscritorBinario(ruta, self.metadatos, FLUSH_CADA_S, FLUSH_CADA_FILAS, FSYNC_EN_CHECKPOINT)
+        return EscritorCSV(ruta, self.nombre_muestra, self.recolector)
+
+    def abrir(self):
+        self.filtro = FiltroCambios(self.manager, self.modo)
+        if self.segmentada:
+            self.writer = EscritorSegmentado(
+                self.filepath, self._abrir_archivo, self.extension,
+                dict(self.metadatos, formato="bin" if self.binario else "csv", modo=self.modo,
+                     duracion_s=self.duracion_s, serie=self.ruta_serie if self.serie else None)
+            )
+        else:
+            self.writer = self._abrir_archivo(self.filepath)
+        if self.serie:
+            self.almacen = AlmacenSerie(self.ruta_serie, self.metadatos, FLUSH_CADA_S, FLUSH_CADA_FILAS)
+        self._inicio_mono = time.monotonic()
+
+    def transcurrido(self):
+        return time.monotonic() - self._inicio_mono
+
+    def vencida(self):
+        return self.duracion_s != -1 and self.transcurrido() >= self.duracion_s
+
+    def registrar(self, d, now=None):
+        """Escribe la lectura si el modo de registro lo pide; devuelve True si escribió"""
+        if not self.filtro.hay_cambio(d):
+            # Tick sin fila: igual se baja a disco lo pendiente cuando vence el plazo
+            self.writer.checkpoint_si_vence()
+            if self.almacen is not None:
+                self.almacen.checkpoint_si_vence()
+            return False
+        now = now or datetime.now()
+        vencidos = self.manager.campos_vencidos()
+        t0 = time.perf_counter_ns()
+        self.writer.escribir(now, d, vencidos)
+        if self.almacen is not None:
+            self.almacen.escribir(now, d, vencidos)
+        _ESCRITURA.registrar_ns(time.perf_counter_ns() - t0)
+        self.registros += 1
+        return True
+
+    def cerrar(self, terminada=True):
+        """terminada=False deja una captura segmentada reanudable"""
+        if self.filtro is not None:
+            self.filtro.close()
+        if self.almacen is not None:
+            self.almacen.close()
+        if self.writer is not None:
+            if self.segmentada:
+                self.writer.close(terminada)
+            else:
+                self.writer.close()
+
+    def archivos(self):
+        if self.writer is None:
+            return []
+        return self.writer.segmentos() if self.segmentada else [self.filepath]
+
+    def indexar(self):
+        try:
+            # Indexar la captura para poder buscarla después sin abrir el archivo (catalogo.py);
+            # una segmentada se indexa una sola vez por su manifiesto
+            if self.writer is not None:
+                registrar_captura(self.filepath)
+        except (OSError, sqlite3.Error) as e:
+            print(f"No se pudo actualizar el catálogo: {e}")
+
 def ensure_directory_exists():
     if not os.path.exists(CARPETA_SALIDA):
         try:
@@ -32,99 +341,103 @@ def ensure_directory_exists():
         except OSError:
             pass
 
-def run_logger():
+def run_logger(usar_asyncio=False):
     ensure_directory_exists()
     print("Iniciando conexión con sensores...")
-    manager = SensorManager()
-    manager.start()
+    # Si el demonio de adquisición (adquisicion.py) está corriendo nos colgamos de él;
+    # si no, abrimos los dispositivos nosotros. Con usar_asyncio el manager propio
+    # corre en un event loop en vez de hilos de paho/serial.
+    manager = crear_manager(usar_asyncio)
     time.sleep(1)
 
     while True:
         print("\n" + "="*50)
         print("   CONFIGURACIÓN DE NUEVA CAPTURA")
         print("="*50)
-        
-        nombre_muestra = get_input("Nombre de la muestra", "Muestra_Test").replace(" ", "_")
-        recolector = get_input("Nombre del recolector", "Operador").replace(" ", "_")
-        try:
-            intervalo = float(get_input("Intervalo (seg)", "1.0"))
-        except ValueError:
-            intervalo = 1.0
-        
-        duration_sec = get_duration_seconds()
-        
-        fecha_archivo = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"{nombre_muestra}_{recolector}_{fecha_archivo}.csv"
-        filepath = os.path.join(CARPETA_SALIDA, filename)
-        
-        # ACTUALIZADO: Headers para incluir los 6 termopares
-        headers = [
-            "Fecha_Sistema", "Hora_Sistema", "Timestamp_MS", "Muestra", "Recolector",
-            "Temp1_C", "Hum1_RH", "Temp2_C", "Hum2_RH", "Radiacion_W_m2", 
-            "Termopar1_C", "Termopar2_C", "Termopar3_C", "Termopar4_C", "Termopar5_C", "Termopar6_C",
-            "Fan1", "Fan2", "Fan3", 
-            "Masa_g" 
-        ]
-
-        print(f"\nIniciando captura en: {filepath}")
+
+        reanudar = None
+        for pendiente in reversed(interrumpidas(CARPETA_SALIDA)):
+            # El segmento que quedó abierto no tiene fin en el manifiesto: sacarlo del archivo
+            # antes de calcular cuánto se capturó y cuánto falta
+            anterior = recuperar_segmentos(leer_manifiesto(pendiente), os.path.dirname(pendiente))
+            print(f"Captura interrumpida: {anterior['muestra']} / {anterior['recolector']} "
+                  f"({len(anterior['segmentos'])} segmento(s), {capturado_s(anterior) / 60:.1f} min)")
+            if get_input("¿Reanudarla? (s/n)", "s").lower().startswith("s"):
+                reanudar = pendiente
+                break
+            # Rechazada: no volver a preguntar antes de cada captura
+            abandonar(pendiente)
+
+        if reanudar:
+            # Misma configuración que la captura original; solo falta el tiempo que no se capturó
+            duration_sec = anterior["duracion_s"]
+            if duration_sec != -1:
+                duration_sec = max(duration_sec - capturado_s(anterior), 0)
+            sesion = SesionCaptura(
+                manager, anterior["muestra"], anterior["recolector"], anterior["intervalo_s"],
+                duration_sec, anterior["formato"] == "bin", anterior["modo"],
+                anterior.get("serie") is not None, datetime.fromisoformat(anterior["inicio"]), reanudar
+            )
+        else:
+            nombre_muestra = get_input("Nombre de la muestra", "Muestra_Test").replace(" ", "_")
+            recolector = get_input("Nombre del recolector", "Operador").replace(" ", "_")
+            while True:
+                try:
+                    intervalo = float(get_input("Intervalo (seg)", "1.0"))
+                except ValueError:
+                    intervalo = 1.0
+                if intervalo > 0:
+                    break
+                print("El intervalo debe ser positivo.")
+
+            duration_sec = get_duration_seconds()
+            binario = get_input("Formato (csv/bin)", "csv").lower().startswith("b")
+            modo = get_input("Modo de registro (continuo/cambios/banda)", MODO_CONTINUO).lower()
+            # En capturas largas conviene guardar también la serie con resúmenes (serie_tiempo.py)
+            # para graficar rangos grandes sin leer todas las filas crudas
+            serie = get_input("Guardar también serie con resúmenes (s/n)",
+                              "s" if duration_sec == -1 else "n").lower().startswith("s")
+            sesion = SesionCaptura(manager, nombre_muestra, recolector, intervalo, duration_sec,
+                                   binario, modo, serie)
+
+        print(f"\nIniciando captura en: {sesion.filepath}")
         if duration_sec == -1: print("MODO INDEFINIDO: Ctrl+C para parar.")
         
-        start_time = time.time()
+        reloj = RelojMuestreo(sesion.intervalo)
+        terminada = True
         
         try:
-            with open(filepath, mode='w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(headers)
-                
-                while True:
-                    elapsed = time.time() - start_time
-                    if duration_sec != -1 and elapsed >= duration_sec:
-                        print("\nTiempo finalizado.")
-                        break
-
-                    d = manager.get_data()
-                    now = datetime.now()
-                    
-                    # Obtenemos la lista de termopares con seguridad
-                    # (rellenamos con ceros si por alguna razón la lista es menor a 6)
-                    termopares = d.get('termopares_C', [0.0]*6)
-                    if len(termopares) < 6: 
-                        termopares += [0.0] * (6 - len(termopares))
-
-                    row = [
-                        now.strftime("%Y-%m-%d"),
-                        now.strftime("%H:%M:%S"),
-                        d['timestamp_ms'],
-                        nombre_muestra,
-                        recolector,
-                        # CAMBIO: Key actualizada a 'temp1_C'
-                        d['temp1_C'], 
-                        d['humedad1_RH'],
-                        d['temperatura2_C'], 
-                        d['humedad2_RH'],
-                        d['radiacion_W_m2'], 
-                        # CAMBIO: Desglose de la lista de termopares
-                        termopares[0], termopares[1], termopares[2], 
-                        termopares[3], termopares[4], termopares[5],
-                        d['ventiladores'][0], d['ventiladores'][1], d['ventiladores'][2],
-                        d['masa_str'] 
-                    ]
-                    
-                    writer.writerow(row)
-                    file.flush()
-                    
+            sesion.abrir()
+            while True:
+                elapsed = sesion.transcurrido()
+                if sesion.vencida():
+                    print("\nTiempo finalizado.")
+                    break
+
+                d = manager.get_data()
+                if sesion.registrar(d):
                     if duration_sec == -1:
-                        print(f"\rCapturando... {int(elapsed)}s | Masa: {d['masa_str']}  ", end="")
+                        print(f"\rCapturando... {int(elapsed)}s | Registros: {sesion.registros} | Masa: {d['masa_str']}  ", end="")
                     else:
                         pct = (elapsed / duration_sec) * 100
-                        print(f"\rProgreso: {pct:.1f}% | Registros: {int(elapsed/intervalo)}", end="")
+                        print(f"\rProgreso: {pct:.1f}% | Registros: {sesion.registros}", end="")
 
-                    time.sleep(intervalo)
+                reloj.esperar()
 
         except KeyboardInterrupt:
             print("\nCaptura detenida (Ctrl+C).")
+        except BaseException:
+            # Cualquier otro error deja la captura segmentada reanudable
+            terminada = False
+            raise
+        finally:
+            sesion.cerrar(terminada)
         
-        print(f"\nGuardado en: {filepath}")
+        print(f"\nRegistros: {sesion.registros} | Sin cambios: {sesion.filtro.omitidos} | Ticks perdidos: {reloj.perdidos} | Tardíos: {reloj.tardios}")
+        print(f"Guardado en: {sesion.filepath}")
+        if sesion.almacen is not None:
+            print(f"Serie con resúmenes en: {sesion.ruta_serie}")
+        sesion.indexar()
         if input("\n¿Nueva captura? (s/n): ").lower() != 's':
             break
 
@@ -132,4 +445,5 @@ def run_logger():
     print("Fin.")
 
 if __name__ == "__main__":
-    run_logger()
\ No newline at end of file
+    INSTRUMENTOS.volcar_al_salir("logger")
+    run_logger(usar_asyncio="--asyncio" in sys.argv)
\ No newline at end of file
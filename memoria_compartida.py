@@ -0,0 +1,182 @@
+import mmap
+import os
+import struct
+import sys
+import time
+from sensor_core import COLUMNAS_HISTORIAL, valores_canales
+
+# Segmento de memoria compartida con la última lectura y una ventana corta de historial.
+#
+# Es un archivo en /dev/shm con layout fijo, little-endian, para que cualquier
+# proceso (Python, Julia con Mmap.mmap, C...) lo mapee y lea sin sockets ni JSON:
+#
+#   offset  tipo        campo
+#   0       char[8]     MAGIC "SECSHM01"
+#   8       uint64      seq: contador del seqlock (impar = escritura en curso)
+#   16      uint32      n_canales (orden de COLUMNAS_HISTORIAL)
+#   20      uint32      capacidad: filas del historial
+#   24      uint64      total: filas de historial escritas desde el inicio
+#   32      uint64      version de la Lectura publicada
+#   40      float64     t de la última actualización (time.time())
+#   48      8 bytes     reservado
+#   64      float64[n_canales]                 valores actuales
+#   ...     float64[capacidad][1 + n_canales]  historial circular: t, canales...
+#                                              (la fila más nueva es (total - 1) % capacidad)
+#
+# Las filas del historial se espacian con time.monotonic(); t es solo la etiqueta de
+# pared, así un ajuste del reloj (NTP, cambio manual) no deja huecos ni filas pisadas.
+#
+# Al arrancar, un segmento viejo se borra y se crea uno nuevo en lugar de truncarlo:
+# un lector que todavía lo tenga mapeado recibiría SIGBUS al tocar páginas que ya no
+# existen. Así conserva el archivo viejo (sin cambios) hasta que vuelva a abrir la ruta.
+#
+# Lectura: leer seq (si es impar, reintentar), copiar lo necesario, volver a leer
+# seq; si cambió, reintentar. Si después de ESPERA_SEQLOCK_S sigue sin haber una copia
+# consistente (el escritor murió a mitad de una escritura y seq quedó impar), se
+# lanza TimeoutError en vez de girar para siempre.
+RUTA_MEMORIA = "/dev/shm/secador_vivo"
+MAGIC = b"SECSHM01"
+FILAS_MEMORIA = 600           # Ventana corta: 10 min a 1 s
+RESOLUCION_MEMORIA_S = 1.0
+ESPERA_SEQLOCK_S = 0.5
+ENCABEZADO = struct.Struct("<8sQIIQQd8x")
+_SEQ = struct.Struct("<Q")
+OFFSET_VALORES = ENCABEZADO.size
+
+
+class PublicadorMemoria:
+    """Escribe la última Lectura de un SensorManager en el segmento compartido.
+
+    Se alimenta con una suscripción con callback, así la escritura ocurre en su
+    propio hilo y nunca frena a MQTT ni a la balanza. Es el único escritor.
+    """
+
+    def __init__(self, manager, ruta=RUTA_MEMORIA, filas=FILAS_MEMORIA,
+                 resolucion_s=RESOLUCION_MEMORIA_S):
+        self.ruta = ruta
+        self.n = len(COLUMNAS_HISTORIAL)
+        self.capacidad = filas
+        self.resolucion_s = resolucion_s
+        self._valores = struct.Struct(f"<{self.n}d")
+        self._fila = struct.Struct(f"<{self.n + 1}d")
+        self._offset_historial = OFFSET_VALORES + self._valores.size
+        tamano = self._offset_historial + self._fila.size * filas
+
+        try:
+            os.unlink(ruta)
+        except FileNotFoundError:
+            pass
+        fd = os.open(ruta, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            os.ftruncate(fd, tamano)
+            self._mm = mmap.mmap(fd, tamano)
+        finally:
+            os.close(fd)
+        self._seq = 0
+        self._total = 0
+        self._ultimo_mono = None
+        self._escribir(manager.get_data(), time.time())
+        self._manager = manager
+        self._suscripcion = manager.subscribe(callback=self._on_muestra)
+
+    def _on_muestra(self, muestra):
+        self._escribir(self._manager.get_data(), muestra.t)
+
+    def _escribir(self, lectura, t):
+        valores = valores_canales(lectura)
+        mono = time.monotonic()
+        if self._ultimo_mono is None or mono - self._ultimo_mono >= self.resolucion_s:
+            fila = self._total % self.capacidad
+            self._total += 1
+            self._ultimo_mono = mono
+        else:
+            fila = (self._total - 1) % self.capacidad  # Dentro de la resolución: pisa la última fila
+
+        mm = self._mm
+        self._seq += 1  # Impar: los lectores esperan
+        _SEQ.pack_into(mm, 8, self._seq)
+        self._valores.pack_into(mm, OFFSET_VALORES, *valores)
+        self._fila.pack_into(mm, self._offset_historial + fila * self._fila.size, t, *valores)
+        ENCABEZADO.pack_into(mm, 0, MAGIC, self._seq, self.n, self.capacidad,
+                             self._total, lectura.version, t)
+        self._seq += 1  # Par: snapshot consistente
+        _SEQ.pack_into(mm, 8, self._seq)
+
+    def close(self, borrar=True):
+        self._suscripcion.close()
+        self._mm.close()
+        if borrar and os.path.exists(self.ruta):
+            os.unlink(self.ruta)
+
+
+class LectorMemoria:
+    """Lee el segmento publicado por PublicadorMemoria desde cualquier proceso"""
+
+    def __init__(self, ruta=RUTA_MEMORIA):
+        with open(ruta, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, self.n, self.capacidad, _, _, _ = ENCABEZADO.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{ruta} no es un segmento del secador")
+        self._valores = struct.Struct(f"<{self.n}d")
+        self._fila = struct.Struct(f"<{self.n + 1}d")
+        self._offset_historial = OFFSET_VALORES + self._valores.size
+
+    def _consistente(self, copiar, espera_s=ESPERA_SEQLOCK_S):
+        # Seqlock: reintentar mientras haya una escritura en curso o haya cambiado durante la copia,
+        # cediendo el procesador entre intentos para que el escritor pueda terminar
+        limite = None
+        while True:
+            (s1,) = _SEQ.unpack_from(self._mm, 8)
+            if not s1 & 1:
+                resultado = copiar()
+                (s2,) = _SEQ.unpack_from(self._mm, 8)
+                if s1 == s2:
+                    return resultado
+            ahora = time.monotonic()
+            if limite is None:
+                limite = ahora + espera_s
+            elif ahora >= limite:
+                raise TimeoutError(f"sin copia consistente en {espera_s} s (seq={s1}): "
+                                   "¿el publicador murió a mitad de una escritura?")
+            time.sleep(0)
+
+    def leer(self):
+        """Devuelve (version, t, {canal: valor}) de la última lectura"""
+        def copiar():
+            _, _, _, _, _, version, t = ENCABEZADO.unpack_from(self._mm, 0)
+            return version, t, self._valores.unpack_from(self._mm, OFFSET_VALORES)
+        version, t, valores = self._consistente(copiar)
+        return version, t, dict(zip(COLUMNAS_HISTORIAL[:self.n], valores))
+
+    def version(self):
+        """Solo la versión; sirve para no copiar nada si no hubo cambios"""
+        return self._consistente(lambda: ENCABEZADO.unpack_from(self._mm, 0)[5])
+
+    def historial(self):
+        """Filas (t, canales...) de la ventana en orden cronológico"""
+        def copiar():
+            total = ENCABEZADO.unpack_from(self._mm, 0)[4]
+            n = min(total, self.capacidad)
+            base = total - n
+            return [
+                self._fila.unpack_from(self._mm, self._offset_historial + ((base + i) % self.capacidad) * self._fila.size)
+                for i in range(n)
+            ]
+        return self._consistente(copiar)
+
+    def close(self):
+        self._mm.close()
+
+
+if __name__ == "__main__":
+    # Vista rápida del segmento desde otra terminal
+    lector = LectorMemoria(sys.argv[1] if len(sys.argv) > 1 else RUTA_MEMORIA)
+    try:
+        version, t, valores = lector.leer()
+    except TimeoutError as e:
+        print(e)
+        sys.exit(1)
+    print(f"Versión {version} - {time.strftime('%H:%M:%S', time.localtime(t))}")
+    for canal, valor in valores.items():
+        print(f"  {canal:16} {valor:10.2f}")
@@ -1,18 +1,26 @@
+import argparse
+import asyncio
 import time
 from rich.live import Live
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.align import Align
 from rich.table import Table
+from rich.text import Text
 from rich.console import Console
 from rich import box
-from sensor_core import SensorManager
+from sensor_async import AsyncSensorManager
+from canales import por_grupo
+from adquisicion import crear_manager
+from secadores import crear_multi
+from instrumentacion import INSTRUMENTOS, histograma
+from terminal import RitmoDibujo, TerminalDiferencial, Visibilidad, MAX_FPS, MAX_FPS_SSH, ESPERA_MAX_S, en_ssh
 
-# Configuración de rangos para las barras visuales (ajusta según tu proceso)
-MAX_TEMP = 100.0
-MAX_HUM = 100.0
-MAX_RAD = 1000.0
-MAX_MASA = 5000.0 # Ejemplo: 5kg max
+COLOR_VENCIDO = "bright_black"  # Valores de un enlace que dejó de mandar datos
+ESTADISTICAS_CADA_S = 1.0  # Refresco del panel de estadísticas (--stats)
+
+_UPDATE = histograma("monitor.update")
+_CUADRO = histograma("monitor.cuadro")  # Render + escritura a la terminal de un cuadro
 
 def make_bar(value, max_val, color="green"):
     """Crea una barra de progreso textual"""
@@ -24,96 +32,487 @@ def make_bar(value, max_val, color="green"):
     bar = "█" * filled + "░" * (width - filled)
     return f"[{color}]{bar}[/{color}] {value:.2f}"
 
-def generate_layout():
+def generate_layout(estadisticas=False, columnas=True):
     layout = Layout()
     layout.split(
         Layout(name="header", size=3),
         Layout(name="main", ratio=1),
+        *([Layout(name="stats", size=5)] if estadisticas else []),
         Layout(name="footer", size=3)
     )
+    if not columnas:
+        return layout
     layout["main"].split_row(
         Layout(name="left"),
         Layout(name="right")
     )
     return layout
 
+# Filas de la tabla ambiental: (etiqueta, clave, unidad, máximo de la barra, color)
+# Salen del registro de canales; los rangos de las barras se ajustan allí
+FILAS_AMBIENTALES = tuple(
+    (canal.etiqueta, canal.clave, canal.unidad, canal.maximo, canal.color)
+    for canal in por_grupo("ambiente")
+)
+
+def set_markup(celda, markup):
+    """Reemplaza en su lugar el contenido de un Text que ya está dentro de una tabla"""
+    nuevo = Text.from_markup(markup)
+    celda.plain = nuevo.plain
+    celda.spans = nuevo.spans
+
+def _us(valor):
+    return f"{valor / 1000:.1f} ms" if valor >= 1000 else f"{valor:.0f} µs"
+
+class PanelEstadisticas:
+    """Tabla con los instrumentos del proceso (instrumentacion.py); una fila por instrumento"""
+
+    def __init__(self):
+        self.table = None
+        self.panel = Panel(Text("Sin datos todavía", style="dim"), title="Estadísticas", border_style="dim")
+        self._celdas = {}
+        self._ultima = 0.0
+
+    def _build_table(self, nombres):
+        self.table = Table(box=box.SIMPLE, expand=True, padding=(0, 1))
+        for columna, justify in (("Instrumento", "left"), ("Cuenta", "right"), ("/s", "right"),
+                                 ("p50", "right"), ("p95", "right"), ("p99", "right"), ("máx", "right")):
+            self.table.add_column(columna, justify=justify, style="cyan" if justify == "left" else None)
+        self._celdas = {}
+        for nombre in nombres:
+            celdas = [Text() for _ in range(6)]
+            self.table.add_row(nombre, *celdas)
+            self._celdas[nombre] = celdas
+        self.panel.renderable = self.table
+
+    def filas(self):
+        """Alto que ocupa el panel en el layout"""
+        return len(self._celdas) + 5
+
+    def actualizar(self, ahora, layout=None):
+        """Refresca los valores como mucho una vez por ESTADISTICAS_CADA_S; devuelve True si cambió algo.
+
+        Con `layout` ajusta el alto de su sección "stats" cuando aparecen instrumentos nuevos.
+        """
+        if ahora - self._ultima < ESTADISTICAS_CADA_S:
+            return False
+        self._ultima = ahora
+        resumen = INSTRUMENTOS.resumen()
+        if not resumen:
+            return False
+        if self.table is None or list(resumen) != list(self._celdas):
+            self._build_table(resumen)
+            if layout is not None:
+                layout["stats"].size = self.filas()
+        for nombre, valores in resumen.items():
+            if "p50_us" in valores:
+                textos = (str(valores["n"]), f"{valores['por_s']:.1f}", _us(valores["p50_us"]),
+                          _us(valores["p95_us"]), _us(valores["p99_us"]), _us(valores["max_us"]))
+            else:
+                textos = (str(valores["n"]), f"{valores['por_s']:.1f}", "", "", "", "")
+            for celda, texto in zip(self._celdas[nombre], textos):
+                celda.plain = texto
+        return True
+
+class Dashboard:
+    """Arma el layout una sola vez y en cada dato nuevo solo reescribe las celdas que cambiaron"""
+
+    def __init__(self, estadisticas=False):
+        self.layout = generate_layout(estadisticas)
+        self.layout["header"].update(Panel(Align.center("[bold gold1]SISTEMA DE MONITOREO SECADOR IOT[/]"), style="bold white"))
+        self.estadisticas = PanelEstadisticas() if estadisticas else None
+        if estadisticas:
+            self.layout["stats"].update(self.estadisticas.panel)
+        self.footer_text = Text.from_markup("Presiona [bold red]Ctrl+C[/] para salir")
+        self.layout["footer"].update(Panel(Align.center(self.footer_text), style="dim"))
+        self.version = None
+        self._vencidos = frozenset()
+        self._cache = {}  # clave -> último valor dibujado
+
+        # Tabla de Sensores Ambientales
+        self.table_env = Table(box=box.ROUNDED, title="Sensores Ambientales", expand=True)
+        self.table_env.add_column("Sensor", style="cyan")
+        self.table_env.add_column("Valor", justify="right")
+        self.table_env.add_column("Gráfica", justify="left")
+        self._celdas_env = {}
+        for etiqueta, key, _, _, _ in FILAS_AMBIENTALES:
+            valor, barra = Text(), Text()
+            self.table_env.add_row(etiqueta, valor, barra)
+            self._celdas_env[key] = (valor, barra)
+        self.layout["left"].update(Panel(self.table_env))
+
+        # Estado de Ventiladores
+        self.fans_text = Text()
+        self.panel_fans = Panel(
+            Align.center(self.fans_text),
+            title="Estado Ventiladores",
+            border_style="green"
+        )
+
+        self.table_proc = None
+        self._termopares = []
+        self._masa = Text()
+
+    def _build_process_table(self, n_termopares):
+        # Tabla de Proceso (Termopares y Masa); solo se rehace si cambia la cantidad de termopares
+        self.table_proc = Table(box=box.ROUNDED, title="Variables de Proceso", expand=True)
+        self.table_proc.add_column("Variable", style="magenta")
+        self.table_proc.add_column("Valor", justify="right")
+        self._termopares = [Text() for _ in range(n_termopares)]
+        for i, celda in enumerate(self._termopares):
+            self.table_proc.add_row(f"Termopar {i+1}", celda)
+        self.table_proc.add_row("MASA (Balanza)", self._masa)
+        for i in range(n_termopares):
+            self._cache.pop(f"termopar{i}", None)
+        self.layout["right"].split(
+            Layout(Panel(self.table_proc), ratio=2),
+            Layout(self.panel_fans, ratio=1)
+        )
+
+    def _changed(self, key, value):
+        if key in self._cache and self._cache[key] == value:
+            return False
+        self._cache[key] = value
+        return True
+
+    def update(self, data, vencidos=frozenset(), enlaces=None):
+        """Aplica una lectura; devuelve False si no hubo nada que redibujar.
+
+        `vencidos` son los campos cuyo enlace dejó de mandar datos (se muestran en gris)
+        y `enlaces` el SupervisorEnlaces del manager, para el estado en el pie.
+        """
+        version = getattr(data, "version", None)
+        if version is not None and version == self.version and vencidos == self._vencidos:
+            return False
+        self.version = version
+        self._vencidos = vencidos
+        cambio = False
+
+        for _, key, unidad, max_val, color in FILAS_AMBIENTALES:
+            value = data[key]
+            viejo = key in vencidos
+            if self._changed(key, (value, viejo)):
+                valor, barra = self._celdas_env[key]
+                if viejo:
+                    set_markup(valor, f"[{COLOR_VENCIDO}]{value} {unidad}[/]")
+                    set_markup(barra, make_bar(value, max_val, COLOR_VENCIDO))
+                else:
+                    valor.plain = f"{value} {unidad}"
+                    valor.spans = []
+                    set_markup(barra, make_bar(value, max_val, color))
+                cambio = True
+
+        # CAMBIO 2: Iterar sobre la lista de termopares en lugar de buscar claves fijas
+        termopares = data.get('termopares_C', ())
+        if self.table_proc is None or len(termopares) != len(self._termopares):
+            self._build_process_table(len(termopares))
+            cambio = True
+        viejo = 'termopares_C' in vencidos
+        for i, temp_val in enumerate(termopares):
+            if self._changed(f"termopar{i}", (temp_val, viejo)):
+                celda = self._termopares[i]
+                celda.plain = f"{temp_val} °C"
+                celda.spans = []
+                if viejo:
+                    celda.stylize(COLOR_VENCIDO)
+                cambio = True
+
+        estable = data.get('masa_estable', True)
+        viejo = 'masa_g' in vencidos
+        if self._changed("masa_g", (data['masa_g'], estable, viejo)):
+            if viejo:
+                set_markup(self._masa, f"[{COLOR_VENCIDO}]{data['masa_g']:.2f} g[/]")
+            elif estable:
+                set_markup(self._masa, f"[bold green]{data['masa_g']:.2f} g[/]")
+            else:
+                # La balanza todavía no se asentó
+                set_markup(self._masa, f"[bold yellow]~{data['masa_g']:.2f} g[/]")
+            cambio = True
+
+        # Generar visualización para N ventiladores dinámicamente
+        fans = tuple(data['ventiladores'])
+        viejo = 'ventiladores' in vencidos
+        if self._changed("ventiladores", (fans, viejo)):
+            fondo_on, fondo_off = (COLOR_VENCIDO, COLOR_VENCIDO) if viejo else ("green", "red")
+            fan_display_text = []
+            fan_status_icons = []
+            for i, f in enumerate(fans):
+                status_text = f"[bold white on {fondo_on}] ON [/]" if f else f"[bold white on {fondo_off}] OFF [/]"
+                fan_display_text.append(f"V{i+1}: {str(f).upper()}")
+                fan_status_icons.append(status_text)
+            fan_info_str = "   ".join(fan_display_text)
+            fan_status_str = "  ".join(fan_status_icons)
+            set_markup(self.fans_text, f"{fan_info_str}\n\n{fan_status_str}")
+            cambio = True
+
+        if enlaces is not None:
+            estados = tuple((e.estado, e.vencido()) for e in (enlaces["mqtt"], enlaces["serial"]))
+            if self._changed("enlaces", estados):
+                partes = []
+                for nombre, (estado, vencido) in zip(("MQTT", "Balanza"), estados):
+                    color = "green" if estado == "conectado" and not vencido else "red"
+                    detalle = " (sin datos)" if estado == "conectado" and vencido else ""
+                    partes.append(f"{nombre}: [{color}]{estado}{detalle}[/]")
+                set_markup(self.footer_text, "   ".join(partes) + "   |   Presiona [bold red]Ctrl+C[/] para salir")
+                cambio = True
+
+        return cambio
+
 def create_dashboard(data):
-    # Tabla de Sensores Ambientales
-    table_env = Table(box=box.ROUNDED, title="Sensores Ambientales", expand=True)
-    table_env.add_column("Sensor", style="cyan")
-    table_env.add_column("Valor", justify="right")
-    table_env.add_column("Gráfica", justify="left")
-
-    # CAMBIO 1: La clave ahora es 'temp1_C' en lugar de 'temperatura1_C'
-    table_env.add_row("Temp 1", f"{data['temp1_C']} °C", make_bar(data['temp1_C'], MAX_TEMP, "red"))
-    table_env.add_row("Hum 1", f"{data['humedad1_RH']} %", make_bar(data['humedad1_RH'], MAX_HUM, "blue"))
-    table_env.add_row("Temp 2", f"{data['temperatura2_C']} °C", make_bar(data['temperatura2_C'], MAX_TEMP, "red"))
-    table_env.add_row("Hum 2", f"{data['humedad2_RH']} %", make_bar(data['humedad2_RH'], MAX_HUM, "blue"))
-    table_env.add_row("Radiación", f"{data['radiacion_W_m2']} W/m²", make_bar(data['radiacion_W_m2'], MAX_RAD, "yellow"))
-
-    # Tabla de Proceso (Termopares y Masa)
-    table_proc = Table(box=box.ROUNDED, title="Variables de Proceso", expand=True)
-    table_proc.add_column("Variable", style="magenta")
-    table_proc.add_column("Valor", justify="right")
-    
-    # CAMBIO 2: Iterar sobre la lista de termopares en lugar de buscar claves fijas
-    termopares = data.get('termopares_C', [])
-    for i, temp_val in enumerate(termopares):
-        table_proc.add_row(f"Termopar {i+1}", f"{temp_val} °C")
+    """Versión sin estado: arma un Dashboard nuevo con los datos y devuelve sus partes"""
+    dashboard = Dashboard()
+    dashboard.update(data)
+    return dashboard.table_env, dashboard.table_proc, dashboard.panel_fans
 
-    table_proc.add_row("MASA (Balanza)", f"[bold green]{data['masa_g']:.2f} g[/]")
+def dibujar(dashboard, live, cambio):
+    """Redibuja si cambiaron los datos o el panel de estadísticas, midiendo cuánto tarda el cuadro"""
+    if dashboard.estadisticas is not None:
+        cambio |= dashboard.estadisticas.actualizar(time.monotonic(), dashboard.layout)
+    if cambio:
+        t0 = time.perf_counter_ns()
+        live.refresh()
+        _CUADRO.registrar_ns(time.perf_counter_ns() - t0)
+    return cambio
 
-    # Estado de Ventiladores
-    fans = data['ventiladores']
-    
-    # Generar visualización para N ventiladores dinámicamente
-    fan_display_text = []
-    fan_status_icons = []
-    
-    for i, f in enumerate(fans):
-        status_text = f"[bold white on green] ON [/]" if f else "[bold white on red] OFF [/]" 
-        fan_display_text.append(f"V{i+1}: {str(f).upper()}")
-        fan_status_icons.append(status_text)
-        
-    fan_info_str = "   ".join(fan_display_text)
-    fan_status_str = "  ".join(fan_status_icons)
-    
-    panel_fans = Panel(
-        Align.center(f"{fan_info_str}\n\n{fan_status_str}"),
-        title="Estado Ventiladores",
-        border_style="green"
-    )
+def actualizar(dashboard, *args):
+    t0 = time.perf_counter_ns()
+    cambio = dashboard.update(*args)
+    _UPDATE.registrar_ns(time.perf_counter_ns() - t0)
+    return cambio
+
+def abrir_pantalla(layout, ssh=False):
+    """Live de Rich, o con ssh=True la terminal que solo manda las líneas que cambiaron"""
+    if ssh:
+        return TerminalDiferencial(layout)
+    # Sin refresco automático: solo se redibuja cuando alguna celda cambió
+    return Live(layout, auto_refresh=False, screen=True)
 
-    return table_env, table_proc, panel_fans
+def crear_ritmo(max_fps, estadisticas):
+    # Con el panel de estadísticas hay que despertar al menos una vez por segundo para refrescarlo
+    return RitmoDibujo(max_fps, espera_max=ESTADISTICAS_CADA_S if estadisticas else ESPERA_MAX_S)
 
-def run_monitor():
-    manager = SensorManager()
-    manager.start()
+def bucle_monitor(dashboard, live, suscripcion, leer, ritmo, visible):
+    """Espera datos, junta los que lleguen hasta el próximo cuadro permitido y dibuja si alguien mira.
+
+    Sin datos el bucle despierta cada vez menos (RitmoDibujo); con datos, como mucho
+    max_fps veces por segundo. Así CPU y ancho de banda siguen a la tasa de datos.
+    """
+    oculto = False
+    while True:
+        if not visible():
+            # En segundo plano o en un tmux sin nadie: ni update ni render, solo vaciar la cola
+            oculto = True
+            time.sleep(ritmo.espera())
+            ritmo.inactivo()
+            suscripcion.drain()
+            continue
+        if suscripcion.get(timeout=ritmo.espera()) is None:
+            ritmo.inactivo()
+        else:
+            ritmo.dato()
+            time.sleep(ritmo.hasta_proximo_cuadro())
+            suscripcion.drain()  # Las muestras acumuladas ya están reflejadas en los datos
+        cambio = actualizar(dashboard, *leer())
+        if oculto:
+            # Al volver a primer plano la pantalla pudo quedar pisada: cuadro completo
+            oculto = False
+            cambio = True
+            if isinstance(live, TerminalDiferencial):
+                live.invalidar()
+        if dibujar(dashboard, live, cambio):
+            ritmo.dibujado()
+
+def run_monitor(usar_asyncio=False, estadisticas=False, max_fps=MAX_FPS, ssh=False):
+    # Si el demonio de adquisición (adquisicion.py) está corriendo nos colgamos de él;
+    # si no, abrimos los dispositivos nosotros. Con usar_asyncio el manager propio
+    # corre en un event loop en vez de hilos de paho/serial.
+    manager = crear_manager(usar_asyncio)
+    suscripcion = manager.subscribe()
     
     # console = Console() # No es estrictamente necesario instanciarlo fuera, pero ok
-    layout = generate_layout()
-    
-    layout["header"].update(Panel(Align.center("[bold gold1]SISTEMA DE MONITOREO SECADOR IOT[/]"), style="bold white"))
-    layout["footer"].update(Panel(Align.center("Presiona [bold red]Ctrl+C[/] para salir"), style="dim"))
+    dashboard = Dashboard(estadisticas)
+
+    try:
+        with abrir_pantalla(dashboard.layout, ssh) as live:
+            dashboard.update(manager.get_data(), manager.campos_vencidos(), manager.enlaces)
+            live.refresh()
+            bucle_monitor(dashboard, live, suscripcion,
+                          lambda: (manager.get_data(), manager.campos_vencidos(), manager.enlaces),
+                          crear_ritmo(max_fps, estadisticas), Visibilidad())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.stop()
+        print("Monitor cerrado.")
+
+class DashboardMulti:
+    """Una fila por secador; la tabla solo se rehace cuando aparece un secador nuevo"""
+
+    def __init__(self, estadisticas=False):
+        self.layout = generate_layout(estadisticas, columnas=False)
+        self.layout["header"].update(Panel(Align.center("[bold gold1]SISTEMA DE MONITOREO SECADORES IOT[/]"), style="bold white"))
+        self.estadisticas = PanelEstadisticas() if estadisticas else None
+        if estadisticas:
+            self.layout["stats"].update(self.estadisticas.panel)
+        self.footer_text = Text.from_markup("Presiona [bold red]Ctrl+C[/] para salir")
+        self.layout["footer"].update(Panel(Align.center(self.footer_text), style="dim"))
+        self.table = None
+        self._filas = {}  # secador -> {columna: Text}
+        self._cache = {}  # (secador, columna) -> último valor dibujado
+        self._versiones = {}
+
+    def _build_table(self, nombres):
+        self.table = Table(box=box.ROUNDED, title="Secadores", expand=True)
+        self.table.add_column("Secador", style="cyan")
+        for etiqueta, _, _, _, _ in FILAS_AMBIENTALES:
+            self.table.add_column(etiqueta, justify="right")
+        for columna in ("Termopar máx", "Masa", "Ventiladores", "MQTT", "Balanza", "msg/s"):
+            self.table.add_column(columna, justify="right")
+        self._filas = {}
+        for nombre in nombres:
+            celdas = {clave: Text() for clave in self._columnas()}
+            self.table.add_row(nombre, *celdas.values())
+            self._filas[nombre] = celdas
+        self._cache.clear()
+        self._versiones.clear()
+        self.layout["main"].update(Panel(self.table))
+
+    @staticmethod
+    def _columnas():
+        return [key for _, key, _, _, _ in FILAS_AMBIENTALES] + [
+            "termopar_max", "masa_g", "ventiladores", "mqtt", "serial", "tasa"]
+
+    def _poner(self, nombre, columna, valor, markup):
+        if self._cache.get((nombre, columna)) == valor:
+            return False
+        self._cache[(nombre, columna)] = valor
+        set_markup(self._filas[nombre][columna], markup)
+        return True
+
+    def update(self, dispositivos):
+        """Aplica el estado de todos los secadores; devuelve False si no hubo nada que redibujar"""
+        nombres = sorted(dispositivos)
+        cambio = False
+        if self.table is None or nombres != list(self._filas):
+            self._build_table(nombres)
+            cambio = True
+        for nombre in nombres:
+            disp = dispositivos[nombre]
+            data = disp.get_data()
+            vencidos = disp.campos_vencidos()
+            enlaces = disp.enlaces
+            if self._versiones.get(nombre) != (data.version, vencidos):
+                self._versiones[nombre] = (data.version, vencidos)
+                for _, key, unidad, _, _ in FILAS_AMBIENTALES:
+                    color = COLOR_VENCIDO if key in vencidos else "white"
+                    cambio |= self._poner(nombre, key, (data[key], color), f"[{color}]{data[key]} {unidad}[/]")
+                termopares = data.get("termopares_C", ())
+                maximo = max(termopares) if termopares else None
+                color = COLOR_VENCIDO if "termopares_C" in vencidos else "white"
+                texto = f"{maximo} °C" if maximo is not None else "-"
+                cambio |= self._poner(nombre, "termopar_max", (maximo, color), f"[{color}]{texto}[/]")
+                if "masa_g" in vencidos:
+                    color = COLOR_VENCIDO
+                else:
+                    color = "bold green" if data.get("masa_estable", True) else "bold yellow"
+                cambio |= self._poner(nombre, "masa_g", (data["masa_g"], color),
+                                      f"[{color}]{data['masa_g']:.2f} g[/]")
+                fans = tuple(data["ventiladores"])
+                viejo = "ventiladores" in vencidos
+                iconos = "".join(
+                    f"[{COLOR_VENCIDO}]{'●' if f else '○'}[/]" if viejo else ("[green]●[/]" if f else "[red]○[/]")
+                    for f in fans)
+                cambio |= self._poner(nombre, "ventiladores", (fans, viejo), iconos)
+            # Estado de enlaces y tasa: cambian aunque no lleguen datos
+            for columna in ("mqtt", "serial"):
+                enlace = enlaces[columna]
+                edad = enlace.edad()
+                vencido = enlace.vencido()
+                color = "green" if enlace.estado == "conectado" and not vencido else "red"
+                texto = f"{edad:.0f} s" if edad is not None else enlace.estado
+                cambio |= self._poner(nombre, columna, (color, texto), f"[{color}]{texto}[/]")
+            tasa = round(enlaces["mqtt"].tasa() + enlaces["serial"].tasa(), 1)
+            cambio |= self._poner(nombre, "tasa", tasa, f"{tasa:.1f}")
+        return cambio
 
+def run_monitor_multi(estadisticas=False, max_fps=MAX_FPS, ssh=False):
+    """Todos los secadores de secadores.py (tópico comodín y una balanza por secador)"""
+    manager = crear_multi()
+    suscripcion = manager.subscribe()
+    dashboard = DashboardMulti(estadisticas)
     try:
-        with Live(layout, refresh_per_second=4, screen=True):
-            while True:
-                data = manager.get_data()
-                
-                t_env, t_proc, p_fans = create_dashboard(data)
-                
-                layout["left"].update(Panel(t_env))
-                layout["right"].split(
-                    Layout(Panel(t_proc), ratio=2),
-                    Layout(p_fans, ratio=1)
-                )
-                time.sleep(0.25)
+        with abrir_pantalla(dashboard.layout, ssh) as live:
+            dashboard.update(manager.dispositivos)
+            live.refresh()
+            # Con decenas de secadores a 10 Hz llegan cientos de muestras por segundo:
+            # el tope de cuadros por segundo es lo que mantiene bajo el costo del render
+            bucle_monitor(dashboard, live, suscripcion, lambda: (manager.dispositivos,),
+                          crear_ritmo(max_fps, estadisticas), Visibilidad())
     except KeyboardInterrupt:
         pass
     finally:
         manager.stop()
         print("Monitor cerrado.")
 
+async def monitor_async(manager, estadisticas=False, max_fps=MAX_FPS, ssh=False):
+    """Dashboard como corrutina, para compartir el event loop con otros consumidores"""
+    suscripcion = manager.subscribe_async()
+    dashboard = Dashboard(estadisticas)
+    ritmo = crear_ritmo(max_fps, estadisticas)
+    visible = Visibilidad()
+    with abrir_pantalla(dashboard.layout, ssh) as live:
+        dashboard.update(manager.get_data(), manager.campos_vencidos(), manager.enlaces)
+        live.refresh()
+        while True:
+            try:
+                await asyncio.wait_for(suscripcion.__anext__(), ritmo.espera())
+                ritmo.dato()
+                await asyncio.sleep(ritmo.hasta_proximo_cuadro())
+            except asyncio.TimeoutError:
+                ritmo.inactivo()
+            except StopAsyncIteration:
+                break
+            if not visible():
+                continue
+            # Las muestras encoladas detrás de esta ya están en get_data(): update() las salta
+            cambio = actualizar(dashboard, manager.get_data(), manager.campos_vencidos(), manager.enlaces)
+            if dibujar(dashboard, live, cambio):
+                ritmo.dibujado()
+
+async def run_monitor_async(estadisticas=False, max_fps=MAX_FPS, ssh=False):
+    manager = AsyncSensorManager()
+    adquisicion = asyncio.create_task(manager.run())
+    try:
+        await monitor_async(manager, estadisticas, max_fps, ssh)
+    finally:
+        manager.stop()
+        await adquisicion
+
 if __name__ == "__main__":
-    run_monitor()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Monitor del secador")
+    parser.add_argument("--multi", action="store_true",
+                        help="Varios secadores: ver secadores.py (secadores.json para tópico y balanzas)")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Todo en un solo hilo: MQTT, balanza y dashboard sobre el mismo event loop")
+    parser.add_argument("--stats", action="store_true", help="Panel de estadísticas (instrumentacion.py)")
+    parser.add_argument("--fps", type=float, help=f"Máximo de cuadros por segundo (por defecto {MAX_FPS:g}, "
+                                                  f"{MAX_FPS_SSH:g} con --ssh)")
+    parser.add_argument("--ssh", action="store_true",
+                        help="Poco ancho de banda: solo las líneas que cambian, 16 colores")
+    args = parser.parse_args()
+    max_fps = args.fps or (MAX_FPS_SSH if args.ssh else MAX_FPS)
+    if en_ssh() and not args.ssh:
+        print("Sesión SSH detectada: con --ssh el monitor manda mucho menos a la terminal.")
+        time.sleep(1)
+    # El resumen de estadísticas se guarda al salir con o sin --stats
+    INSTRUMENTOS.volcar_al_salir("monitor")
+    if args.multi:
+        run_monitor_multi(args.stats, max_fps, args.ssh)
+    elif args.asyncio:
+        try:
+            asyncio.run(run_monitor_async(args.stats, max_fps, args.ssh))
+        except KeyboardInterrupt:
+            pass
+        print("Monitor cerrado.")
+    else:
+        run_monitor(estadisticas=args.stats, max_fps=max_fps, ssh=args.ssh)
@@ -0,0 +1,264 @@
+import json
+import struct
+from array import array
+from canales import CANALES, VALORES_INICIALES
+
+# Payloads que acepta el tópico MQTT del ESP:
+#   JSON             {"timestamp_ms": ..., "temp1_C": ..., "termopares_C": [...], ...}
+#   Binario compacto MAGIA + struct little-endian con los canales del registro (ver abajo)
+#   MessagePack/CBOR el mismo mapa que el JSON, si está instalado msgpack o cbor2
+# El formato se reconoce por el primer byte, así el firmware puede cambiar sin tocar nada aquí.
+#
+# Para JSON se usa orjson si está instalado (varias veces más rápido que json), si no ujson.
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        _json_loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        _json_loads = json.loads  # Acepta bytes directamente, sin decode()
+        JSON_BACKEND = "json"
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON_ERRORES = (ValueError, TypeError)  # orjson.JSONDecodeError y json.JSONDecodeError son ValueError
+
+# Binario compacto: 0xFF nunca empieza un JSON, un mapa CBOR ni un mapa MessagePack.
+# Después de la magia va la versión del formato y luego, en little-endian:
+#   uint32  timestamp_ms (millis() del ESP)
+#   int16   cada canal float del ESP en el orden de CANALES, en unidades de 1/ESCALA
+#   uint8   ventiladores como máscara de bits (bit 0 = V1)
+# Con enteros escalados los valores llegan exactos (40.1 y no 40.099998 como con float32).
+MAGIA = b"\xff\x01"
+ESCALA = 100  # Centésimas: ±327.67 cabe en int16
+ESCALA_CANAL = {"radiacion_W_m2": 10}  # Hasta 3276.7 W/m²
+
+
+def _canales_binarios():
+    floats = [c for c in CANALES if c.fuente == "mqtt" and c.tipo is float]
+    bits = [c for c in CANALES if c.fuente == "mqtt" and c.tipo is bool]
+    return floats, bits
+
+
+def _compilar_binario():
+    """(Struct, función tupla -> campos) del binario compacto, generados desde CANALES"""
+    floats, bits = _canales_binarios()
+    formato = "<I" + "h" * len(floats) + ("B" if bits else "")
+    # Igual que compilar_extractor: se genera el código del dict una sola vez
+    partes = ['"timestamp_ms": v[0]']
+    listas = {}
+    for i, canal in enumerate(floats, start=1):
+        expr = f"v[{i}] / {ESCALA_CANAL.get(canal.clave, ESCALA)}"
+        if canal.indice is None:
+            partes.append(f"{canal.clave!r}: {expr}")
+        else:
+            listas.setdefault(canal.clave, []).append(expr)
+    for clave, exprs in listas.items():
+        partes.append(f"{clave!r}: ({', '.join(exprs)},)")
+    if bits:
+        mascara = len(floats) + 1
+        por_clave = {}
+        for n, canal in enumerate(bits):
+            por_clave.setdefault(canal.clave, []).append(f"bool(v[{mascara}] & {1 << n})")
+        for clave, exprs in por_clave.items():
+            partes.append(f"{clave!r}: ({', '.join(exprs)},)")
+    return struct.Struct(formato), eval(f"lambda v: {{{', '.join(partes)}}}", {})
+
+
+_STRUCT, _campos_binarios = _compilar_binario()
+TAMANO_BINARIO = len(MAGIA) + _STRUCT.size
+
+
+def codificar_binario(campos):
+    """Arma el payload compacto a partir de un dict como el JSON del ESP (referencia para el firmware)"""
+    floats, bits = _canales_binarios()
+    valores = [int(campos.get("timestamp_ms", 0)) & 0xFFFFFFFF]
+    for canal in floats:
+        valor = campos.get(canal.clave, VALORES_INICIALES[canal.clave])
+        if canal.indice is not None:
+            valor = valor[canal.indice] if len(valor) > canal.indice else 0.0
+        valores.append(round(valor * ESCALA_CANAL.get(canal.clave, ESCALA)))
+    if bits:
+        mascara = 0
+        for n, canal in enumerate(bits):
+            lista = campos.get(canal.clave, ())
+            if len(lista) > canal.indice and lista[canal.indice]:
+                mascara |= 1 << n
+        valores.append(mascara)
+    return MAGIA + _STRUCT.pack(*valores)
+
+
+NAN = float("nan")
+_NUMEROS = (int, float)  # bool es int: true/false también pasan como número
+
+
+def _flotante(valor):
+    if isinstance(valor, _NUMEROS):
+        return valor
+    # ArduinoJson manda null cuando el sensor da NaN (DHT desconectado, termopar abierto)
+    if valor is None:
+        return NAN
+    raise TypeError(f"se esperaba un número: {valor!r}")
+
+
+def _booleano(valor):
+    if valor is None:
+        return False
+    if isinstance(valor, _NUMEROS):
+        return bool(valor)
+    raise TypeError(f"se esperaba true/false: {valor!r}")
+
+
+def _entero(valor):
+    if isinstance(valor, _NUMEROS) and not isinstance(valor, bool):
+        return valor
+    raise TypeError(f"se esperaba un entero: {valor!r}")
+
+
+def _lista(elemento):
+    def normalizar(valor):
+        if valor.__class__ is not list and not isinstance(valor, tuple):
+            raise TypeError(f"se esperaba una lista: {valor!r}")
+        try:
+            # Caso normal, todo en C: array('d') solo acepta números (y bool), falla con null o texto
+            array("d", valor)
+        except (TypeError, OverflowError):
+            return tuple(map(elemento, valor))
+        # Tupla, igual que en la Lectura: nadie puede mutarla después
+        return tuple(valor)
+    return normalizar
+
+
+def _del_tipo(tipo):
+    def normalizar(valor):
+        if not isinstance(valor, tipo):
+            raise TypeError(f"se esperaba {tipo.__name__}: {valor!r}")
+        return valor
+    return normalizar
+
+
+def _normalizadores():
+    """{clave: función que valida y convierte el valor}, según el registro de canales"""
+    por_tipo = {float: _flotante, bool: _booleano}
+    normalizar = {"timestamp_ms": _entero}
+    for canal in CANALES:
+        elemento = por_tipo[canal.tipo]
+        normalizar[canal.clave] = elemento if canal.indice is None else _lista(elemento)
+    for clave, inicial in VALORES_INICIALES.items():
+        normalizar.setdefault(clave, _del_tipo(type(inicial)))
+    return normalizar
+
+
+_NORMALIZAR = _normalizadores()
+# Campos numéricos escalares: si ya llegan como float o int no hace falta llamar a nada
+_ESCALARES = frozenset(clave for clave, funcion in _NORMALIZAR.items() if funcion in (_flotante, _entero))
+_DIRECTOS = (float, int)
+
+
+def _normalizar(payload):
+    # Solo quedan las claves conocidas, cada una con el tipo que espera la Lectura; un valor
+    # con otra forma ({"termopares_C": 5}) lanza TypeError y el mensaje entero se rechaza
+    salida = {}
+    for clave, valor in payload.items():
+        if clave in _ESCALARES and valor.__class__ in _DIRECTOS:
+            salida[clave] = valor
+        elif clave in _NORMALIZAR:
+            salida[clave] = _NORMALIZAR[clave](valor)
+    return salida
+
+
+class DecodificadorPayload:
+    """Convierte el payload crudo de un mensaje MQTT en los campos para la Lectura.
+
+    Es el único punto de entrada de los datos del ESP: cualquiera sea el formato, los
+    campos salen con los tipos del registro de canales (null -> NaN). Los mensajes que
+    no se pueden decodificar o traen un campo con otra forma se cuentan en `rechazados`
+    y se descartan, igual que las tramas inválidas de la balanza.
+    """
+
+    def __init__(self):
+        self.mensajes = 0
+        self.rechazados = 0
+        self.por_formato = {"json": 0, "binario": 0, "msgpack": 0, "cbor": 0}
+
+    def decodificar(self, raw):
+        """Devuelve el dict de campos, o None si el payload es inválido"""
+        formato, campos = self._decodificar(raw)
+        if campos is None:
+            self.rechazados += 1
+            return None
+        self.mensajes += 1
+        self.por_formato[formato] += 1
+        return campos
+
+    def _decodificar(self, raw):
+        if not raw:
+            return None, None
+        primero = raw[0]
+        if primero == 0xFF:
+            if len(raw) != TAMANO_BINARIO or raw[:2] != MAGIA:
+                return None, None  # Versión desconocida o mensaje cortado
+            return "binario", _campos_binarios(_STRUCT.unpack_from(raw, 2))
+        if 0x80 <= primero <= 0x8F or primero in (0xDE, 0xDF):
+            if msgpack is None:
+                return None, None
+            try:
+                payload = msgpack.unpackb(raw, raw=False)
+            except (ValueError, TypeError, msgpack.UnpackException):
+                return None, None
+            formato = "msgpack"
+        elif 0xA0 <= primero <= 0xBB or primero == 0xBF:
+            if cbor2 is None:
+                return None, None
+            try:
+                payload = cbor2.loads(raw)
+            except (ValueError, TypeError, cbor2.CBORDecodeError):
+                return None, None
+            formato = "cbor"
+        else:
+            try:
+                payload = _json_loads(raw)
+            except JSON_ERRORES:
+                return None, None
+            formato = "json"
+        if not isinstance(payload, dict):
+            return None, None
+        try:
+            return formato, _normalizar(payload)
+        except TypeError:
+            return None, None
+
+
+if __name__ == "__main__":
+    import timeit
+
+    ejemplo = {"timestamp_ms": 123456, "temp1_C": 40.1, "humedad1_RH": 30.5, "temperatura2_C": 38.2,
+               "humedad2_RH": 31.0, "radiacion_W_m2": 640.5,
+               "termopares_C": [45.25, 47.5, 50.0, 48.75, 46.0, 44.5], "ventiladores": [True, False, True]}
+    payloads = {"json": json.dumps(ejemplo).encode(), "binario": codificar_binario(ejemplo)}
+    if msgpack is not None:
+        payloads["msgpack"] = msgpack.packb(ejemplo)
+    if cbor2 is not None:
+        payloads["cbor"] = cbor2.dumps(ejemplo)
+    decodificador = DecodificadorPayload()
+    print(f"JSON con {JSON_BACKEND}")
+    referencia = json.loads(payloads["json"])
+    for formato, raw in payloads.items():
+        n = 20000
+        t = timeit.timeit(lambda: decodificador.decodificar(raw), number=n)
+        campos = decodificador.decodificar(raw)
+        iguales = {k: list(v) if isinstance(v, tuple) else v for k, v in campos.items()} == referencia
+        print(f"{formato:8} {len(raw):4d} bytes  {t / n * 1e6:6.2f} µs/mensaje  {'ok' if iguales else campos}")
@@ -0,0 +1,542 @@
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from canales import CANALES
+from sensor_core import SensorManager, MQTT_TOPIC, MQTT_BROKER
+from payload import JSON_BACKEND, codificar_binario
+
+# Banco de pruebas de rendimiento sin hardware.
+#
+# La balanza se simula con un pty (el SensorManager la abre como un puerto serie real)
+# y el ESP con un publicador en el mismo proceso que entrega los mensajes por el mismo
+# callback que usa paho (o, con --broker, publicando de verdad al broker local).
+# Los datos salen de las capturas de Recolecciones/ re-emitidas al ritmo pedido.
+#
+# Cada prueba devuelve un dict plano; el resultado completo es un JSON con la versión
+# del código, así se puede guardar con --salida y comparar después con --comparar:
+#   python rendimiento.py --salida base.json
+#   python rendimiento.py --comparar base.json     (sale con código 1 si algo empeoró)
+PRUEBAS = ("mensajes", "balanza", "latencia_csv", "escritura", "dashboard")
+CAPTURAS = "Recolecciones/*.csv"
+TOLERANCIA = 0.20  # Empeorar más que esto respecto de la base cuenta como regresión
+# Latencias que entran en --comparar: p99 y máximo dependen de una pausa del GC o del
+# sistema operativo y harían fallar la comparación sin que el código haya cambiado
+LATENCIAS_COMPARABLES = ("p50_ms", "p95_ms")
+TRAMA_BALANZA = "ST,GS,{:>10} g\r\n"
+
+
+def percentiles(valores_s):
+    """p50/p95/p99/máximo en milisegundos de una lista de duraciones en segundos"""
+    if not valores_s:
+        return {"n": 0}
+    ordenados = sorted(valores_s)
+    n = len(ordenados)
+
+    def p(q):
+        return round(ordenados[min(n - 1, int(q * n))] * 1000, 3)
+
+    return {"n": n, "p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99),
+            "max_ms": round(ordenados[-1] * 1000, 3)}
+
+
+class BalanzaPty:
+    """Balanza falsa: un pseudo-terminal cuyo extremo esclavo se abre como /dev/ttyUSB0"""
+
+    def __init__(self):
+        self._maestro, esclavo = os.openpty()
+        self.ruta = os.ttyname(esclavo)
+        self._esclavo = esclavo  # Abierto mientras dure la prueba para que el pty no se cierre
+
+    def enviar(self, texto):
+        os.write(self._maestro, texto.encode("ascii"))
+
+    def close(self):
+        os.close(self._maestro)
+        os.close(self._esclavo)
+
+
+class _Mensaje:
+    """Lo mínimo de un paho MQTTMessage que usa _mqtt_on_message"""
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class PublicadorESP:
+    """Hace de ESP: entrega payloads al manager sin broker, o los publica al broker con broker=True"""
+
+    def __init__(self, manager, broker=False, topico=MQTT_TOPIC):
+        self.manager = manager
+        self.topico = topico
+        self._cliente = None
+        if broker:
+            import paho.mqtt.client as mqtt
+            self._cliente = mqtt.Client()
+            self._cliente.connect(MQTT_BROKER, 1883, 60)
+            self._cliente.loop_start()
+
+    def publicar(self, payload):
+        if self._cliente is not None:
+            self._cliente.publish(self.topico, payload)
+        else:
+            self.manager._mqtt_on_message(None, None, _Mensaje(self.topico, payload))
+
+    def close(self):
+        if self._cliente is not None:
+            self._cliente.loop_stop()
+            self._cliente.disconnect()
+
+
+def cargar_repeticion(patron=CAPTURAS, limite=5000):
+    """Filas de capturas reales como (campos del ESP, texto de la balanza).
+
+    Si no hay capturas se generan filas sintéticas, así el banco corre en cualquier máquina.
+    """
+    filas = []
+    for ruta in sorted(glob.glob(patron)):
+        with open(ruta, newline="") as f:
+            for fila in csv.DictReader(f):
+                try:
+                    filas.append(_fila_a_campos(fila))
+                except (KeyError, ValueError, TypeError):
+                    continue  # Capturas viejas con otras columnas o filas cortadas
+                if len(filas) >= limite:
+                    return filas
+    return filas or _sinteticas(limite)
+
+
+def _fila_a_campos(fila):
+    campos = {"timestamp_ms": int(fila["Timestamp_MS"])}
+    for canal in CANALES:
+        if canal.fuente != "mqtt":
+            continue
+        texto = fila[canal.columna_csv]
+        valor = texto == "True" if canal.tipo is bool else float(texto)
+        if canal.indice is None:
+            campos[canal.clave] = valor
+        else:
+            campos.setdefault(canal.clave, []).append(valor)
+    return campos, fila["Masa_g"].split()[-1]
+
+
+def _sinteticas(n):
+    return [({"timestamp_ms": i * 1000, "temp1_C": 40.0 + i % 50 / 10, "humedad1_RH": 30.5,
+              "temperatura2_C": 38.2, "humedad2_RH": 31.0, "radiacion_W_m2": 640.0,
+              "termopares_C": [45.25, 47.5, 50.0, 48.75, 46.0, 44.5], "ventiladores": [True, False, True]},
+             f"{812.5 - i * 0.01:.2f}")
+            for i in range(n)]
+
+
+def _codificar(campos, binario):
+    return codificar_binario(campos) if binario else json.dumps(campos).encode()
+
+
+def _a_ritmo(n, hz):
+    """Índices 0..n-1 espaciados a `hz` (hz=0: lo más rápido posible)"""
+    periodo = 1.0 / hz if hz else 0.0
+    siguiente = time.perf_counter()
+    for i in range(n):
+        if periodo:
+            espera = siguiente - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            siguiente += periodo
+        yield i
+
+
+def prueba_mensajes(filas, n=20000, binario=False, consumidores=1, broker=False):
+    """Mensajes/s que el SensorManager absorbe desde MQTT con consumidores suscritos"""
+    manager = SensorManager(historial_horas=1)
+    if broker:
+        manager._start_mqtt()
+        time.sleep(1.0)
+    subs = [manager.subscribe(maxsize=4096) for _ in range(consumidores)]
+    recibidas = [0] * consumidores
+
+    def consumir(i, sub):
+        while sub.activa:
+            if sub.get(timeout=0.1) is not None:
+                recibidas[i] += 1 + len(sub.drain())
+
+    hilos = [threading.Thread(target=consumir, args=(i, sub), daemon=True) for i, sub in enumerate(subs)]
+    for hilo in hilos:
+        hilo.start()
+    payloads = [_codificar(campos, binario) for campos, _ in filas[:min(len(filas), 1024)]]
+    publicador = PublicadorESP(manager, broker)
+    t0 = time.perf_counter()
+    for i in range(n):
+        publicador.publicar(payloads[i % len(payloads)])
+    envio = time.perf_counter() - t0
+    if broker:
+        # Por el broker el envío es asíncrono: esperar a que llegue lo último
+        limite = time.monotonic() + 10
+        while manager.payload.mensajes < n and time.monotonic() < limite:
+            time.sleep(0.01)
+    total = time.perf_counter() - t0
+    time.sleep(0.2)
+    publicador.close()
+    manager.stop()
+    return {
+        "payload": "binario" if binario else "json",
+        "json_backend": JSON_BACKEND,
+        "via": "broker" if broker else "directo",
+        "mensajes": n,
+        "procesados": manager.payload.mensajes,
+        "mensajes_por_s": round(manager.payload.mensajes / total, 1),
+        "us_por_mensaje": round(envio / n * 1e6, 2),
+        "recibidas_por_consumidor": recibidas,
+        "descartadas_por_consumidor": [sub.descartadas for sub in subs],
+    }
+
+
+def prueba_balanza(hz=50.0, segundos=3.0):
+    """Tramas/s y latencia desde que la balanza escribe hasta que la Muestra llega al suscriptor"""
+    pty = BalanzaPty()
+    manager = SensorManager(historial_horas=1, puerto_serie=pty.ruta)
+    sub = manager.subscribe(maxsize=4096)
+    hilo = threading.Thread(target=manager._start_serial, daemon=True)
+    hilo.start()
+    limite = time.monotonic() + 5
+    while manager.enlaces["serial"].estado != "conectado" and time.monotonic() < limite:
+        time.sleep(0.01)
+    enviados = {}
+    latencias = []
+
+    def recibir():
+        while sub.activa:
+            muestra = sub.get(timeout=0.1)
+            if muestra is None:
+                continue
+            llegada = time.perf_counter()
+            envio = enviados.get(muestra.campos["masa_str"])
+            if envio is not None:
+                latencias.append(llegada - envio)
+
+    receptor = threading.Thread(target=recibir, daemon=True)
+    receptor.start()
+    n = int(hz * segundos)
+    t0 = time.perf_counter()
+    for i in _a_ritmo(n, hz):
+        # Cada trama lleva un valor único para emparejar envío y recepción
+        texto = f"{i}.00"
+        enviados[texto] = time.perf_counter()
+        pty.enviar(TRAMA_BALANZA.format(texto))
+    limite = time.monotonic() + 2
+    while manager.balanza.tramas + manager.balanza.rechazadas < n and time.monotonic() < limite:
+        time.sleep(0.005)
+    total = time.perf_counter() - t0
+    time.sleep(0.2)  # Que el receptor vacíe la cola
+    manager.running = False
+    sub.close()
+    hilo.join(timeout=2)
+    pty.close()
+    return {
+        "hz": hz,
+        "tramas": n,
+        "recibidas": manager.balanza.tramas,
+        "rechazadas": manager.balanza.rechazadas,
+        "tramas_por_s": round(manager.balanza.tramas / total, 1),
+        "latencia": percentiles(latencias),
+    }
+
+
+def prueba_latencia_csv(filas, hz=10.0, intervalo=0.1, segundos=5.0, modo="cambios", binario=False):
+    """Latencia desde que el ESP publica hasta que el dato queda en una fila del logger"""
+    from logger import SesionCaptura, RelojMuestreo
+
+    manager = SensorManager(historial_horas=1)
+    publicador = PublicadorESP(manager)
+    enviados = {}
+    parar = threading.Event()
+
+    def publicar():
+        for i in _a_ritmo(int(hz * segundos), hz):
+            if parar.is_set():
+                return
+            campos = dict(filas[i % len(filas)][0], timestamp_ms=i + 1)  # timestamp_ms como número de mensaje
+            enviados[i + 1] = time.perf_counter()
+            publicador.publicar(_codificar(campos, binario))
+
+    latencias = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        sesion = SesionCaptura(manager, "rendimiento", "banco", intervalo, segundos, binario, modo,
+                               carpeta=carpeta)
+        sesion.abrir()
+        hilo = threading.Thread(target=publicar, daemon=True)
+        hilo.start()
+        reloj = RelojMuestreo(intervalo)
+        vistos = set()
+        while hilo.is_alive():
+            d = manager.get_data()
+            if sesion.registrar(d):
+                escrito = time.perf_counter()
+                ts = d.timestamp_ms
+                if ts in enviados and ts not in vistos:
+                    vistos.add(ts)
+                    latencias.append(escrito - enviados[ts])
+            reloj.esperar()
+        parar.set()
+        sesion.cerrar()
+        filas_escritas = sesion.registros
+    manager.stop()
+    return {
+        "hz": hz,
+        "intervalo_s": intervalo,
+        "modo": modo,
+        "formato": "bin" if binario else "csv",
+        "publicados": len(enviados),
+        "filas": filas_escritas,
+        "tardios": reloj.tardios,
+        "latencia": percentiles(latencias),
+    }
+
+
+# (nombre, flush_cada_s, flush_cada_filas, fsync)
+POLITICAS = (
+    ("flush_cada_fila", 0.0, 1, False),
+    ("checkpoint", 2.0, 100, False),
+    ("checkpoint_fsync", 2.0, 100, True),
+    ("fsync_cada_fila", 0.0, 1, True),
+)
+
+
+def prueba_escritura(filas, n=20000, politicas=POLITICAS):
+    """Filas/s del logger (CSV y .secbin) con cada política de flush"""
+    from logger import EscritorCSV
+    from formato_binario import EscritorBinario, EXTENSION as EXTENSION_BINARIA
+
+    manager = SensorManager(historial_horas=1)
+    lecturas = []
+    for campos, masa in filas[:min(len(filas), 512)]:
+        manager._aplicar("mqtt", campos)
+        manager._aplicar("serial", {"masa_str": masa, "masa_g": float(masa)})
+        lecturas.append(manager.get_data())
+    manager.stop()
+    now = datetime.now()
+    resultado = {}
+    with tempfile.TemporaryDirectory() as carpeta:
+        for nombre, flush_s, flush_filas, fsync in politicas:
+            # fsync en cada fila es órdenes de magnitud más lento: menos filas para no eternizar la prueba
+            cantidad = n // 20 if fsync and flush_filas == 1 else n
+            for formato in ("csv", "bin"):
+                if formato == "csv":
+                    ruta = os.path.join(carpeta, f"{nombre}.csv")
+                    escritor = EscritorCSV(ruta, "rendimiento", "banco", flush_s, flush_filas, fsync)
+                else:
+                    ruta = os.path.join(carpeta, f"{nombre}{EXTENSION_BINARIA}")
+                    escritor = EscritorBinario(ruta, {"muestra": "rendimiento"}, flush_s, flush_filas, fsync)
+                t0 = time.perf_counter()
+                with escritor:
+                    for i in range(cantidad):
+                        escritor.escribir(now, lecturas[i % len(lecturas)])
+                total = time.perf_counter() - t0
+                resultado[f"{formato}_{nombre}"] = {
+                    "filas": cantidad,
+                    "filas_por_s": round(cantidad / total, 1),
+                    "bytes_por_fila": round(os.path.getsize(ruta) / cantidad, 1),
+                }
+    return resultado
+
+
+def prueba_dashboard(filas, n=300, ancho=120, alto=40):
+    """Tiempo por cuadro del monitor: create_dashboard completo y Dashboard.update incremental.
+
+    Las dos variantes dibujan la pantalla entera (el mismo layout de ancho x alto),
+    así la diferencia es solo el trabajo de armar las tablas.
+    """
+    from rich.align import Align
+    from rich.console import Console
+    from rich.layout import Layout
+    from rich.live import Live
+    from rich.panel import Panel
+    from monitor import Dashboard, create_dashboard, generate_layout
+    from terminal import TerminalDiferencial
+
+    manager = SensorManager(historial_horas=1)
+    lecturas = []
+    for campos, masa in filas[:n]:
+        manager._aplicar("mqtt", campos)
+        manager._aplicar("serial", {"masa_str": masa, "masa_g": float(masa)})
+        lecturas.append(manager.get_data())
+    manager.stop()
+    consola = Console(file=io.StringIO(), width=ancho, height=alto, force_terminal=True,
+                      color_system="truecolor")
+
+    def render(*partes):
+        consola.file.seek(0)
+        consola.file.truncate()
+        for parte in partes:
+            consola.print(parte)
+
+    # Lo que hacía el monitor antes del Dashboard incremental: tablas nuevas en cada cuadro
+    # colgadas del mismo layout con encabezado y pie
+    layout = generate_layout()
+    layout["header"].update(Panel(Align.center("[bold gold1]SISTEMA DE MONITOREO SECADOR IOT[/]"), style="bold white"))
+    layout["footer"].update(Panel(Align.center("Presiona [bold red]Ctrl+C[/] para salir"), style="dim"))
+    completo, armado = [], []
+    for d in lecturas:
+        t0 = time.perf_counter()
+        t_env, t_proc, p_fans = create_dashboard(d)
+        layout["left"].update(Panel(t_env))
+        layout["right"].split(Layout(Panel(t_proc), ratio=2), Layout(p_fans, ratio=1))
+        t1 = time.perf_counter()
+        render(layout)
+        completo.append(time.perf_counter() - t0)
+        armado.append(t1 - t0)
+
+    dashboard = Dashboard()
+    incremental, sin_cambios = [], []
+    for d in lecturas:
+        t0 = time.perf_counter()
+        if dashboard.update(d, frozenset(), manager.enlaces):
+            render(dashboard.layout)
+        incremental.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        dashboard.update(d, frozenset(), manager.enlaces)  # Misma versión: debe salir sin trabajo
+        sin_cambios.append(time.perf_counter() - t0)
+
+    # Bytes por cuadro hacia la terminal: Live redibuja la pantalla entera, la
+    # TerminalDiferencial (monitor --ssh) manda solo las líneas que cambiaron
+    bytes_cuadro = {}
+    for nombre in ("live", "diferencial"):
+        salida = io.StringIO()
+        consola_tty = Console(file=salida, width=ancho, height=alto, force_terminal=True,
+                              color_system="truecolor" if nombre == "live" else "standard")
+        dashboard = Dashboard()
+        dashboard.update(lecturas[0], frozenset(), manager.enlaces)
+        if nombre == "live":
+            pantalla = Live(dashboard.layout, console=consola_tty, auto_refresh=False, screen=True)
+        else:
+            pantalla = TerminalDiferencial(dashboard.layout, consola_tty)
+        with pantalla:
+            pantalla.refresh()
+            inicio = len(salida.getvalue().encode("utf-8"))
+            for d in lecturas[1:]:
+                dashboard.update(d, frozenset(), manager.enlaces)
+                pantalla.refresh()
+            total = len(salida.getvalue().encode("utf-8")) - inicio
+        bytes_cuadro[nombre] = round(total / max(1, len(lecturas) - 1))
+    return {
+        "cuadros": len(lecturas),
+        "terminal": f"{ancho}x{alto}",
+        "create_dashboard": percentiles(completo),
+        "create_dashboard_sin_render": percentiles(armado),
+        "update_incremental": percentiles(incremental),
+        "update_sin_cambios": percentiles(sin_cambios),
+        "bytes_por_cuadro": bytes_cuadro,
+    }
+
+
+def _version():
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                                text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return commit.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def correr(pruebas=PRUEBAS, patron=CAPTURAS, hz=10.0, segundos=5.0, binario=False, broker=False):
+    filas = cargar_repeticion(patron)
+    resultado = {
+        "version": _version(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "filas_repeticion": len(filas),
+        "pruebas": {},
+    }
+    for nombre in pruebas:
+        print(f"- {nombre}...", file=sys.stderr, flush=True)
+        if nombre == "mensajes":
+            salida = prueba_mensajes(filas, binario=binario, broker=broker)
+        elif nombre == "balanza":
+            salida = prueba_balanza(segundos=min(segundos, 3.0))
+        elif nombre == "latencia_csv":
+            salida = prueba_latencia_csv(filas, hz=hz, segundos=segundos, binario=binario)
+        elif nombre == "escritura":
+            salida = prueba_escritura(filas)
+        else:
+            salida = prueba_dashboard(filas)
+        resultado["pruebas"][nombre] = salida
+    return resultado
+
+
+def _metricas(resultado, prefijo=""):
+    """(ruta, valor, mayor_es_mejor) de cada métrica comparable"""
+    for clave, valor in resultado.items():
+        ruta = f"{prefijo}{clave}"
+        if isinstance(valor, dict):
+            yield from _metricas(valor, ruta + ".")
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            if clave.endswith("_por_s"):
+                yield ruta, valor, True
+            elif clave in LATENCIAS_COMPARABLES or clave.endswith("us_por_mensaje"):
+                yield ruta, valor, False
+
+
+def comparar(base, actual, tolerancia=TOLERANCIA):
+    """Métricas que empeoraron más que `tolerancia` respecto de la base"""
+    previas = {ruta: valor for ruta, valor, _ in _metricas(base["pruebas"])}
+    regresiones = []
+    for ruta, valor, mayor_mejor in _metricas(actual["pruebas"]):
+        antes = previas.get(ruta)
+        if not antes:
+            continue
+        cambio = (valor - antes) / antes
+        if (-cambio if mayor_mejor else cambio) > tolerancia:
+            regresiones.append((ruta, antes, valor, cambio))
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento sin hardware")
+    parser.add_argument("pruebas", nargs="*",
+                        help=f"Pruebas a correr (todas por defecto): {', '.join(PRUEBAS)}")
+    parser.add_argument("--capturas", default=CAPTURAS, help="Patrón de CSVs a re-emitir")
+    parser.add_argument("--hz", type=float, default=10.0, help="Ritmo del ESP simulado en latencia_csv")
+    parser.add_argument("--segundos", type=float, default=5.0)
+    parser.add_argument("--binario", action="store_true", help="Payload binario compacto en vez de JSON")
+    parser.add_argument("--broker", action="store_true", help=f"Publicar de verdad a {MQTT_BROKER}:1883")
+    parser.add_argument("--salida", help="Guardar el resultado en este JSON")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    args = parser.parse_args(argv)
+    desconocidas = set(args.pruebas) - set(PRUEBAS)
+    if desconocidas:
+        parser.error(f"pruebas desconocidas: {', '.join(sorted(desconocidas))}")
+
+    resultado = correr(args.pruebas or PRUEBAS, args.capturas, args.hz, args.segundos, args.binario, args.broker)
+    texto = json.dumps(resultado, indent=1, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    print(texto)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(base, resultado, args.tolerancia)
+        for ruta, antes, despues, cambio in regresiones:
+            print(f"REGRESIÓN {ruta}: {antes} -> {despues} ({cambio:+.0%})", file=sys.stderr)
+        if regresiones:
+            sys.exit(1)
+        print(f"Sin regresiones respecto de {base.get('version')} (tolerancia {args.tolerancia:.0%})",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+import paho.mqtt.client as mqtt
+from payload import DecodificadorPayload, codificar_binario
+from sensor_core import (
+    SensorManager, Suscripcion, EstadoEnlace, COLA_SUSCRIPCION,
+    MQTT_BROKER, RECONEXION_MIN_S, RECONEXION_MAX_S, VIGENCIA_S,
+)
+
+# Varios secadores en un solo proceso.
+#
+# Un cliente MQTT suscrito a un comodín (secador/+/datos) reparte cada mensaje al
+# Dispositivo del secador según el tópico; cada balanza tiene su propio hilo serie.
+# Cada Dispositivo es un SensorManager (Lectura, historial, enlaces, suscripciones)
+# sin conexiones propias, así el logger y el monitor lo usan como si fuera el único.
+MQTT_TOPIC_MULTI = "secador/+/datos"
+BALANZAS = {}  # secador -> puerto serie, p. ej. {"sec1": "/dev/ttyUSB0", "sec2": "/dev/ttyUSB1"}
+ARCHIVO_CONFIG = "secadores.json"  # Opcional: {"topico": "...", "balanzas": {...}}
+HISTORIAL_HORAS_DISPOSITIVO = 2  # Con decenas de secadores, 24 h por secador son cientos de MB
+CARPETA_SALIDA = "Recolecciones"
+
+
+def validar_filtro(filtro):
+    """Revisa que el filtro tenga un solo '+' ocupando un nivel entero; lanza ValueError si no.
+
+    El '+' es lo que identifica al secador: sin él (o con '#') no hay cómo repartir
+    los mensajes, y es mejor fallar al arrancar que en el hilo de paho.
+    """
+    niveles = filtro.split("/")
+    if niveles.count("+") != 1 or "#" in filtro or any("+" in nivel and nivel != "+" for nivel in niveles):
+        raise ValueError(f"Tópico inválido {filtro!r}: debe tener un único nivel '+' con el nombre "
+                         f"del secador y ningún '#', p. ej. {MQTT_TOPIC_MULTI!r}")
+    return filtro
+
+
+def dispositivo_de_topico(filtro, topico):
+    """Parte del tópico que ocupa el '+' del filtro ("secador/+/datos", "secador/sec2/datos" -> "sec2")"""
+    partes_filtro = filtro.split("/")
+    partes = topico.split("/")
+    if len(partes) != len(partes_filtro):
+        return None
+    return partes[partes_filtro.index("+")]
+
+
+def leer_config(ruta=ARCHIVO_CONFIG):
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Dispositivo(SensorManager):
+    """Estado de un secador dentro de un MultiSensorManager"""
+
+    def __init__(self, padre, nombre, puerto_serie=None, historial_horas=HISTORIAL_HORAS_DISPOSITIVO):
+        super().__init__(historial_horas, puerto_serie)
+        self.padre = padre
+        self.dispositivo = nombre
+        # El enlace MQTT es compartido: su estado de conexión lo marca el padre
+        self.enlaces.enlaces["mqtt"].estado = padre.enlace_mqtt.estado
+
+    def _publicar(self, muestra):
+        super()._publicar(muestra)
+        # Los consumidores de todos los secadores (monitor multi) reciben también la muestra
+        for sub in self.padre._suscripciones:
+            sub._entregar(muestra)
+
+    def start(self):
+        if self.puerto_serie:
+            threading.Thread(target=self._start_serial, daemon=True).start()
+
+    def stop(self):
+        # Solo corta la balanza y las suscripciones; el cliente MQTT es del padre
+        self.running = False
+        for sub in self._suscripciones:
+            sub.close()
+
+
+class MultiSensorManager:
+    """Un cliente MQTT con tópico comodín y una balanza por secador.
+
+    Los secadores que publican aparecen solos en `dispositivos` al primer mensaje;
+    los que tienen balanza se crean al arrancar.
+    """
+
+    def __init__(self, topico=MQTT_TOPIC_MULTI, balanzas=None, historial_horas=HISTORIAL_HORAS_DISPOSITIVO):
+        self.topico = validar_filtro(topico)
+        self.balanzas = dict(BALANZAS if balanzas is None else balanzas)
+        self.historial_horas = historial_horas
+        self.enlace_mqtt = EstadoEnlace("mqtt", VIGENCIA_S["mqtt"])
+        # Diccionario que se reemplaza completo al aparecer un secador: se lee sin lock
+        self.dispositivos = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.descartados = 0  # Mensajes con un tópico que no corresponde al filtro
+        self.payload = DecodificadorPayload()  # Uno solo para todos: corre en el hilo de paho
+        self._mqtt_client = None
+        self._suscripciones = ()
+
+    def dispositivo(self, nombre):
+        """Devuelve el Dispositivo, creándolo si es la primera vez que se lo ve"""
+        disp = self.dispositivos.get(nombre)
+        if disp is not None:
+            return disp
+        with self.lock:
+            disp = self.dispositivos.get(nombre)
+            if disp is None:
+                disp = Dispositivo(self, nombre, self.balanzas.get(nombre), self.historial_horas)
+                self.dispositivos = {**self.dispositivos, nombre: disp}
+                if self.running:
+                    disp.start()
+        return disp
+
+    def _mqtt_on_message(self, client, userdata, msg):
+        nombre = dispositivo_de_topico(self.topico, msg.topic)
+        if not nombre:
+            self.descartados += 1
+            return
+        campos = self.payload.decodificar(msg.payload)
+        if campos is None:
+            return  # Contado en self.payload.rechazados
+        self.enlace_mqtt.dato()
+        disp = self.dispositivo(nombre)
+        try:
+            disp._aplicar("mqtt", campos)
+        except Exception as e:
+            # Igual que SensorManager: se descarta el mensaje y el hilo de paho sigue vivo
+            self.payload.rechazados += 1
+            disp.enlaces["mqtt"].ultimo_error = f"mensaje descartado: {e!r}"
+
+    def _marcar_mqtt(self, metodo, *args):
+        getattr(self.enlace_mqtt, metodo)(*args)
+        for disp in self.dispositivos.values():
+            getattr(disp.enlaces["mqtt"], metodo)(*args)
+
+    def _mqtt_on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self._marcar_mqtt("fallo", mqtt.connack_string(rc))
+            return
+        self._marcar_mqtt("conectado")
+        client.subscribe(self.topico)
+
+    def _mqtt_on_disconnect(self, client, userdata, rc):
+        if rc != 0:
+            self._marcar_mqtt("fallo", mqtt.error_string(rc))
+
+    def _mqtt_on_connect_fail(self, client, userdata):
+        self._marcar_mqtt("fallo", "no se pudo conectar al broker")
+
+    def start(self):
+        self.running = True
+        for nombre in self.balanzas:
+            self.dispositivo(nombre)
+        for disp in self.dispositivos.values():
+            disp.start()
+        client = mqtt.Client()
+        client.on_message = self._mqtt_on_message
+        client.on_connect = self._mqtt_on_connect
+        client.on_disconnect = self._mqtt_on_disconnect
+        client.on_connect_fail = self._mqtt_on_connect_fail
+        client.reconnect_delay_set(min_delay=max(1, int(RECONEXION_MIN_S)), max_delay=int(RECONEXION_MAX_S))
+        self.enlace_mqtt.estado = "conectando"
+        client.connect_async(MQTT_BROKER, 1883, 60)
+        client.loop_start()
+        self._mqtt_client = client
+
+    def subscribe(self, maxsize=COLA_SUSCRIPCION, callback=None):
+        """Muestras de todos los secadores (Muestra.dispositivo dice de cuál)"""
+        sub = Suscripcion(self, maxsize, callback)
+        with self.lock:
+            self._suscripciones = self._suscripciones + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self._suscripciones = tuple(s for s in self._suscripciones if s is not sub)
+
+    def stop(self):
+        self.running = False
+        if self._mqtt_client is not None:
+            self._mqtt_client.loop_stop()
+            self._mqtt_client.disconnect()
+        for disp in self.dispositivos.values():
+            disp.stop()
+        for sub in self._suscripciones:
+            sub.close()
+
+
+def crear_multi(config=None):
+    """MultiSensorManager con la configuración de secadores.json (si existe), ya iniciado"""
+    config = leer_config() if config is None else config
+    manager = MultiSensorManager(config.get("topico", MQTT_TOPIC_MULTI), config.get("balanzas"))
+    manager.start()
+    return manager
+
+
+def capturar_todos(manager, nombre_muestra, recolector, intervalo=1.0, duracion_s=60,
+                   binario=False, modo="continuo", serie=False):
+    """Una captura por secador, cada una en Recolecciones/<secador>/, con un único reloj.
+
+    Los secadores que aparecen durante la captura se agregan en el tick siguiente.
+    """
+    from logger import SesionCaptura, RelojMuestreo  # logger importa adquisicion -> evitar ciclo al importar
+
+    sesiones = {}
+    reloj = RelojMuestreo(intervalo)
+    inicio = time.monotonic()
+    try:
+        while duracion_s == -1 or time.monotonic() - inicio < duracion_s:
+            for nombre, disp in manager.dispositivos.items():
+                sesion = sesiones.get(nombre)
+                if sesion is None:
+                    carpeta = os.path.join(CARPETA_SALIDA, nombre)
+                    os.makedirs(carpeta, exist_ok=True)
+                    restante = -1 if duracion_s == -1 else duracion_s - (time.monotonic() - inicio)
+                    sesion = SesionCaptura(disp, nombre_muestra, recolector, intervalo, restante,
+                                           binario, modo, serie, carpeta=carpeta)
+                    sesion.abrir()
+                    sesiones[nombre] = sesion
+                    print(f"[{datetime.now():%H:%M:%S}] {nombre}: {sesion.filepath}", flush=True)
+                sesion.registrar(disp.get_data())
+            reloj.esperar()
+    except KeyboardInterrupt:
+        print("\nCaptura detenida (Ctrl+C).")
+    finally:
+        for nombre, sesion in sesiones.items():
+            sesion.cerrar()
+            sesion.indexar()
+            print(f"{nombre}: {sesion.registros} registros en {sesion.filepath}")
+    return sesiones
+
+
+class _MensajeSintetico:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def medir(n_dispositivos=30, hz=10.0, segundos=5.0, consumidores=1, binario=False):
+    """Mide el despacho de mensajes MQTT a N secadores sin broker.
+
+    Genera los mensajes que mandarían n_dispositivos a `hz` y los pasa por
+    _mqtt_on_message como lo haría el hilo de paho. Devuelve un dict con la tasa
+    lograda, el tiempo por mensaje y cuántas muestras perdió cada consumidor.
+    """
+    manager = MultiSensorManager(balanzas={})
+    subs = [manager.subscribe(maxsize=4096) for _ in range(consumidores)]
+    recibidas = [0] * consumidores
+
+    def consumir(i, sub):
+        while sub.activa:
+            recibidas[i] += len(sub.drain()) + (sub.get(timeout=0.1) is not None)
+
+    hilos = [threading.Thread(target=consumir, args=(i, sub), daemon=True) for i, sub in enumerate(subs)]
+    for hilo in hilos:
+        hilo.start()
+    codificar = codificar_binario if binario else (lambda campos: json.dumps(campos).encode())
+    payloads = [
+        codificar({"timestamp_ms": i, "temp1_C": 40.0 + i % 7, "humedad1_RH": 30.5, "temperatura2_C": 38.2,
+                   "humedad2_RH": 31.0, "radiacion_W_m2": 640.0,
+                   "termopares_C": [45.25, 47.5, 50.0, 48.75, 46.0, 44.5],
+                   "ventiladores": [True, False, True]})
+        for i in range(64)
+    ]
+    topicos = [manager.topico.replace("+", f"sec{i + 1}") for i in range(n_dispositivos)]
+    periodo = 1.0 / hz
+    enviados = 0
+    ocupado = 0.0
+    t0 = time.perf_counter()
+    siguiente = t0
+    while time.perf_counter() - t0 < segundos:
+        inicio = time.perf_counter()
+        for topico in topicos:
+            manager._mqtt_on_message(None, None, _MensajeSintetico(topico, payloads[enviados % 64]))
+            enviados += 1
+        ocupado += time.perf_counter() - inicio
+        siguiente += periodo
+        espera = siguiente - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+    total = time.perf_counter() - t0
+    time.sleep(0.3)  # Que los consumidores vacíen sus colas
+    for sub in subs:
+        sub.close()
+    return {
+        "dispositivos": n_dispositivos,
+        "payload": "binario" if binario else "json",
+        "hz_por_dispositivo": hz,
+        "mensajes": enviados,
+        "mensajes_por_s": enviados / total,
+        "us_por_mensaje": ocupado / enviados * 1e6,
+        "carga_hilo_mqtt": ocupado / total,  # Fracción del tiempo que el hilo de paho estaría ocupado
+        "recibidas_por_consumidor": recibidas,
+        "descartadas_por_consumidor": [sub.descartadas for sub in subs],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Varios secadores en un proceso")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    capturar = sub.add_parser("capturar", help="Una captura por secador")
+    capturar.add_argument("--muestra", required=True)
+    capturar.add_argument("--recolector", default="Operador")
+    capturar.add_argument("--intervalo", type=float, default=1.0)
+    capturar.add_argument("--duracion", type=float, default=60, help="Segundos (-1: indefinido)")
+    capturar.add_argument("--formato", choices=("csv", "bin"), default="csv")
+    capturar.add_argument("--modo", default="continuo")
+    capturar.add_argument("--serie", action="store_true")
+
+    medicion = sub.add_parser("medir", help="Medir el despacho con N secadores sintéticos")
+    medicion.add_argument("--dispositivos", type=int, default=30)
+    medicion.add_argument("--hz", type=float, default=10.0)
+    medicion.add_argument("--segundos", type=float, default=5.0)
+    medicion.add_argument("--consumidores", type=int, default=1)
+    medicion.add_argument("--binario", action="store_true", help="Payload binario compacto en vez de JSON")
+    args = parser.parse_args(argv)
+
+    if args.comando == "medir":
+        resultado = medir(args.dispositivos, args.hz, args.segundos, args.consumidores, args.binario)
+        print(json.dumps(resultado, indent=1))
+        return
+
+    try:
+        manager = crear_multi()
+    except ValueError as e:
+        print(e)  # Tópico mal configurado en secadores.json
+        sys.exit(1)
+    print(f"Escuchando {manager.topico}; balanzas: {manager.balanzas or 'ninguna'}")
+    time.sleep(1)
+    try:
+        capturar_todos(manager, args.muestra.replace(" ", "_"), args.recolector.replace(" ", "_"),
+                       args.intervalo, args.duracion, args.formato == "bin", args.modo, args.serie)
+    finally:
+        manager.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,319 @@
+import csv
+import glob
+import json
+import os
+import socket
+import sys
+import time
+from datetime import datetime
+from canales import ENCABEZADOS_CSV
+import formato_binario
+
+# Capturas largas en segmentos con manifiesto.
+#
+#   Recolecciones/<base>.manifiesto.json     estado de la captura y lista de segmentos
+#   Recolecciones/<base>_parte001.csv        cada segmento es un CSV (o .secbin) completo
+#   Recolecciones/<base>_parte002.csv        con su propio encabezado
+#
+# Un segmento se cierra al llegar a SEGMENTO_MAX_S segundos o SEGMENTO_MAX_FILAS filas.
+# El manifiesto se reescribe de forma atómica (temporal + os.replace) al abrir y cerrar
+# cada segmento; si la PC se reinicia queda en estado "capturando" y el logger ofrece
+# reanudar la captura en un segmento nuevo con la misma muestra y recolector. Si el
+# operador no la reanuda pasa a "abandonada" y no se vuelve a ofrecer.
+SEGMENTO_MAX_S = 3600.0
+SEGMENTO_MAX_FILAS = 50000
+EXTENSION_MANIFIESTO = ".manifiesto.json"
+CAPTURANDO = "capturando"
+TERMINADA = "terminada"
+ABANDONADA = "abandonada"
+ARCHIVO_ARRANQUE = "/proc/sys/kernel/random/boot_id"  # Cambia en cada arranque del sistema
+
+
+def ruta_manifiesto(carpeta, base):
+    return os.path.join(carpeta, base + EXTENSION_MANIFIESTO)
+
+
+def leer_manifiesto(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _guardar_manifiesto(ruta, manifiesto):
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    # Nunca queda un manifiesto a medio escribir: o el viejo o el nuevo
+    os.replace(temporal, ruta)
+
+
+def _fsync_archivo(ruta):
+    with open(ruta, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def _id_arranque():
+    """Identificador del arranque actual del sistema (None fuera de Linux)"""
+    try:
+        with open(ARCHIVO_ARRANQUE) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _proceso_vivo(pid, host, arranque=None):
+    if host != socket.gethostname():
+        return False
+    # Tras un apagón y reinicio el pid guardado suele ser de otro proceso cualquiera:
+    # si el sistema arrancó de nuevo, el logger que escribía la captura ya no existe
+    if arranque is not None and arranque != _id_arranque():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _ultima_marca(ruta):
+    """(filas, fin) de un segmento leyendo solo el archivo; para segmentos que no se cerraron"""
+    if ruta.endswith(formato_binario.EXTENSION):
+        ultimo = None
+        filas = 0
+        for registro in formato_binario.iterar_registros(ruta):
+            ultimo = registro[0]
+            filas += 1
+        fin = datetime.fromtimestamp(ultimo / 1000).isoformat(timespec="seconds") if ultimo else None
+        return filas, fin
+    filas = 0
+    ultima = None
+    with open(ruta, newline="") as f:
+        lector = csv.reader(f)
+        next(lector, None)
+        for fila in lector:
+            # Una fila cortada por el apagón no cuenta
+            if len(fila) >= 2:
+                filas += 1
+                ultima = fila
+    fin = f"{ultima[0]}T{ultima[1]}" if ultima else None
+    return filas, fin
+
+
+def _duracion(segmento):
+    if not segmento.get("fin"):
+        return 0.0
+    try:
+        return (datetime.fromisoformat(segmento["fin"]) - datetime.fromisoformat(segmento["inicio"])).total_seconds()
+    except ValueError:
+        return 0.0
+
+
+def interrumpidas(carpeta):
+    """Manifiestos en estado "capturando" cuyo logger ya no existe (apagón, reinicio, kill)"""
+    salida = []
+    for ruta in sorted(glob.glob(os.path.join(carpeta, "*" + EXTENSION_MANIFIESTO))):
+        try:
+            manifiesto = leer_manifiesto(ruta)
+        except (OSError, ValueError):
+            continue
+        if manifiesto.get("estado") != CAPTURANDO:
+            continue
+        if _proceso_vivo(manifiesto.get("pid"), manifiesto.get("host"), manifiesto.get("arranque")):
+            continue  # Otro logger la está escribiendo ahora mismo
+        salida.append(ruta)
+    return salida
+
+
+def recuperar_segmentos(manifiesto, carpeta):
+    """Completa filas y fin de los segmentos que no se cerraron leyendo lo que quedó en disco.
+
+    Hay que llamarla antes de capturado_s() con el manifiesto de una captura interrumpida:
+    el segmento abierto todavía no tiene fin y contaría como 0 s.
+    """
+    for segmento in manifiesto["segmentos"]:
+        if segmento.get("cerrado"):
+            continue
+        ruta = os.path.join(carpeta, segmento["archivo"])
+        if os.path.exists(ruta):
+            segmento["filas"], segmento["fin"] = _ultima_marca(ruta)
+        else:
+            segmento["filas"], segmento["fin"] = 0, None
+        segmento["cerrado"] = True
+    return manifiesto
+
+
+def abandonar(ruta):
+    """Marca una captura interrumpida como abandonada: sus segmentos quedan cerrados tal como
+    están en disco y interrumpidas() deja de ofrecerla"""
+    manifiesto = recuperar_segmentos(leer_manifiesto(ruta), os.path.dirname(ruta))
+    manifiesto["estado"] = ABANDONADA
+    _guardar_manifiesto(ruta, manifiesto)
+    return manifiesto
+
+
+def capturado_s(manifiesto):
+    """Segundos ya capturados sumando los segmentos (ver recuperar_segmentos)"""
+    return sum(_duracion(segmento) for segmento in manifiesto["segmentos"])
+
+
+class EscritorSegmentado:
+    """Reparte las filas de una captura en segmentos; interfaz de EscritorCSV.
+
+    `abrir(ruta)` crea el escritor de cada segmento (EscritorCSV o EscritorBinario).
+    Si `ruta_manifiesto` ya existe, la captura se reanuda en un segmento nuevo.
+    """
+
+    def __init__(self, ruta_manifiesto, abrir, extension, metadatos=None,
+                 max_s=SEGMENTO_MAX_S, max_filas=SEGMENTO_MAX_FILAS):
+        self.ruta_manifiesto = ruta_manifiesto
+        self.carpeta = os.path.dirname(ruta_manifiesto)
+        self.base = os.path.basename(ruta_manifiesto)[:-len(EXTENSION_MANIFIESTO)]
+        self.abrir = abrir
+        self.extension = extension
+        self.max_s = max_s
+        self.max_filas = max_filas
+        if os.path.exists(ruta_manifiesto):
+            self.manifiesto = leer_manifiesto(ruta_manifiesto)
+            self._recuperar()
+            self.manifiesto["reanudaciones"] = self.manifiesto.get("reanudaciones", 0) + 1
+        else:
+            self.manifiesto = dict(metadatos or {}, segmentos=[], reanudaciones=0)
+        self.manifiesto.update(estado=CAPTURANDO, pid=os.getpid(), host=socket.gethostname(),
+                               arranque=_id_arranque())
+        self.writer = None
+        self.filas = 0
+        self.checkpoints = 0
+        self._ultimo = None  # Hora de la última fila escrita
+        self._abrir_segmento()
+
+    def _recuperar(self):
+        # El último segmento de una captura interrumpida no se cerró: contar lo que quedó en disco
+        recuperar_segmentos(self.manifiesto, self.carpeta)
+
+    @property
+    def ruta(self):
+        """Ruta del segmento actual"""
+        return os.path.join(self.carpeta, self.manifiesto["segmentos"][-1]["archivo"])
+
+    def segmentos(self):
+        return [os.path.join(self.carpeta, s["archivo"]) for s in self.manifiesto["segmentos"]]
+
+    def _abrir_segmento(self):
+        numero = len(self.manifiesto["segmentos"]) + 1
+        archivo = f"{self.base}_parte{numero:03d}{self.extension}"
+        self.manifiesto["segmentos"].append({
+            "archivo": archivo,
+            "inicio": datetime.now().isoformat(timespec="seconds"),
+            "fin": None,
+            "filas": 0,
+            "cerrado": False,
+        })
+        self.writer = self.abrir(os.path.join(self.carpeta, archivo))
+        self.filas = 0
+        self._inicio_segmento = time.monotonic()
+        _guardar_manifiesto(self.ruta_manifiesto, self.manifiesto)
+
+    def _cerrar_segmento(self, fin):
+        self.writer.close()
+        self.checkpoints += self.writer.checkpoints
+        # El segmento tiene que estar en disco antes de que el manifiesto diga que está cerrado
+        _fsync_archivo(self.ruta)
+        segmento = self.manifiesto["segmentos"][-1]
+        segmento.update(fin=fin, filas=self.filas, cerrado=True)
+        _guardar_manifiesto(self.ruta_manifiesto, self.manifiesto)
+
+    def escribir(self, now, d, vencidos=frozenset()):
+        if self.filas and (self.filas >= self.max_filas
+                           or time.monotonic() - self._inicio_segmento >= self.max_s):
+            self._cerrar_segmento(self._ultimo.isoformat(timespec="seconds"))
+            self._abrir_segmento()
+        if not self.filas:
+            # El segmento empieza con su primera fila, no al abrir el archivo
+            self.manifiesto["segmentos"][-1]["inicio"] = now.isoformat(timespec="seconds")
+        self.writer.escribir(now, d, vencidos)
+        self._ultimo = now
+        self.filas += 1
+
+    def checkpoint(self):
+        self.writer.checkpoint()
+
+    def checkpoint_si_vence(self):
+        self.writer.checkpoint_si_vence()
+
+    def close(self, terminada=True):
+        """terminada=False deja la captura reanudable (p. ej. si se cortó por un error)"""
+        if self.writer is None:
+            return
+        self._cerrar_segmento(self._ultimo.isoformat(timespec="seconds") if self._ultimo else None)
+        self.writer = None
+        if terminada:
+            self.manifiesto["estado"] = TERMINADA
+            _guardar_manifiesto(self.ruta_manifiesto, self.manifiesto)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        # Ctrl+C es un fin normal; cualquier otro error deja la captura reanudable
+        self.close(terminada=tipo is None or issubclass(tipo, KeyboardInterrupt))
+
+
+def iterar_filas(ruta_manifiesto):
+    """Filas de todos los segmentos en orden, como si fuera un solo CSV (sin encabezado)"""
+    carpeta = os.path.dirname(ruta_manifiesto)
+    for segmento in leer_manifiesto(ruta_manifiesto)["segmentos"]:
+        ruta = os.path.join(carpeta, segmento["archivo"])
+        if not os.path.exists(ruta):
+            continue
+        if ruta.endswith(formato_binario.EXTENSION):
+            yield from formato_binario.filas_csv(ruta)
+            continue
+        with open(ruta, newline="") as f:
+            lector = csv.reader(f)
+            next(lector, None)
+            yield from lector
+
+
+def rutas_segmentos(ruta_manifiesto):
+    carpeta = os.path.dirname(ruta_manifiesto)
+    return [os.path.join(carpeta, s["archivo"]) for s in leer_manifiesto(ruta_manifiesto)["segmentos"]]
+
+
+def archivos_segmentados(carpeta, nombres=None):
+    """Rutas de la carpeta que pertenecen a una captura segmentada (sus segmentos y el CSV
+    exportado junto al manifiesto); quien recorre capturas debe usar el manifiesto en su lugar"""
+    if nombres is None:
+        nombres = os.listdir(carpeta) if os.path.isdir(carpeta) else []
+    propios = set()
+    for nombre in nombres:
+        if not nombre.endswith(EXTENSION_MANIFIESTO):
+            continue
+        ruta = os.path.join(carpeta, nombre)
+        propios.add(os.path.normpath(ruta[:-len(EXTENSION_MANIFIESTO)] + ".csv"))
+        try:
+            propios.update(os.path.normpath(r) for r in rutas_segmentos(ruta))
+        except (OSError, ValueError, KeyError):
+            pass
+    return propios
+
+
+def exportar_csv(ruta_manifiesto, destino=None):
+    """Une todos los segmentos en un único CSV clásico; devuelve la ruta creada"""
+    if destino is None:
+        destino = ruta_manifiesto[:-len(EXTENSION_MANIFIESTO)] + ".csv"
+    with open(destino, mode="w", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(ENCABEZADOS_CSV)
+        writer.writerows(iterar_filas(ruta_manifiesto))
+    return destino
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Uso: python segmentos.py captura{EXTENSION_MANIFIESTO} [...]  (une los segmentos en un CSV)")
+        sys.exit(1)
+    for ruta in sys.argv[1:]:
+        print(f"{ruta} -> {exportar_csv(ruta)}")
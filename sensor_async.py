@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import serial
+import paho.mqtt.client as mqtt
+from balanza import MAX_TRAMA
+from sensor_core import (
+    SensorManager, COLA_SUSCRIPCION,
+    MQTT_BROKER, SERIAL_BAUD,
+)
+
+
+class SuscripcionAsync:
+    """Equivalente de Suscripcion para consumir con `async for`.
+
+    Misma política que la versión con hilos: cola acotada que descarta las
+    muestras más viejas si el consumidor se atrasa.
+    """
+
+    def __init__(self, manager, maxsize=COLA_SUSCRIPCION):
+        self._manager = manager
+        self._loop = asyncio.get_running_loop()
+        self._hilo_loop = threading.get_ident()
+        self._cola = asyncio.Queue(maxsize)
+        self.descartadas = 0
+        self.activa = True
+
+    def _entregar(self, muestra):
+        if threading.get_ident() == self._hilo_loop:
+            self._poner(muestra)
+        else:
+            # Productor en otro hilo (p. ej. SensorManager clásico): asyncio.Queue no es thread-safe
+            self._loop.call_soon_threadsafe(self._poner, muestra)
+
+    def _poner(self, muestra):
+        if self._cola.full():
+            self._cola.get_nowait()
+            self.descartadas += 1
+        self._cola.put_nowait(muestra)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.activa:
+            raise StopAsyncIteration
+        muestra = await self._cola.get()
+        if muestra is None:  # close() despierta a quien esté esperando
+            raise StopAsyncIteration
+        return muestra
+
+    def close(self):
+        if not self.activa:
+            return
+        self.activa = False
+        self._manager.unsubscribe(self)
+        try:
+            self._entregar(None)
+        except RuntimeError:
+            pass  # El loop ya se cerró; no hay nadie esperando
+
+
+class _PuenteMQTT:
+    """Conecta los sockets de paho al event loop en lugar de usar loop_start()"""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.cerrado = asyncio.Event()
+        self._misc = None
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.cerrado.clear()
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self._misc is not None:
+            self._misc.cancel()
+        self.cerrado.set()
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # Keepalive y reintentos de QoS; paho pide llamarlo aprox. una vez por segundo
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class AsyncSensorManager(SensorManager):
+    """SensorManager sobre un único event loop de asyncio.
+
+    MQTT y la balanza se leen sin bloquear en el mismo loop, así que no hay hilo
+    de paho ni hilo de serial. Mantiene toda la API de SensorManager (get_data,
+    historial, subscribe) y agrega subscribe_async() para consumidores async.
+
+    Se puede usar de dos formas:
+      - `await manager.run()` junto con otras corrutinas (monitor, exportadores...)
+      - `manager.start()` como el SensorManager clásico: corre el loop en un hilo propio
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop = None
+        self._parar = None
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        if not self.running:
+            return
+        tareas = [
+            asyncio.create_task(self._mqtt_task()),
+            asyncio.create_task(self._serial_task()),
+        ]
+        try:
+            await self._parar.wait()
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+
+    async def _mqtt_task(self):
+        client = mqtt.Client()
+        client.on_message = self._mqtt_on_message
+        # on_connect marca el enlace como conectado y se suscribe (también tras reconectar)
+        client.on_connect = self._mqtt_on_connect
+        puente = _PuenteMQTT(self._loop, client)
+        enlace = self.enlaces["mqtt"]
+        try:
+            while self.running:
+                enlace.estado = "conectando"
+                try:
+                    # connect() abre el socket en este hilo y dispara on_socket_open
+                    client.connect(MQTT_BROKER, 1883, 60)
+                except OSError as e:
+                    await asyncio.sleep(enlace.fallo(e))
+                    continue
+                await puente.cerrado.wait()
+                await asyncio.sleep(enlace.fallo("conexión con el broker cerrada"))
+        finally:
+            client.disconnect()
+
+    async def _serial_task(self):
+        enlace = self.enlaces["serial"]
+        while self.running:
+            enlace.estado = "conectando"
+            try:
+                ser = serial.Serial(self.puerto_serie, SERIAL_BAUD, timeout=0)
+            except (serial.SerialException, OSError) as e:
+                await asyncio.sleep(enlace.fallo(e))
+                continue
+            enlace.conectado()
+            cerrado = asyncio.Event()
+            buffer = bytearray()
+
+            def leer():
+                try:
+                    buffer.extend(ser.read(ser.in_waiting or 1))
+                except (serial.SerialException, OSError):
+                    self._loop.remove_reader(ser.fileno())
+                    cerrado.set()
+                    return
+                while True:
+                    fin = buffer.find(b"\n")
+                    if fin < 0:
+                        if len(buffer) > MAX_TRAMA:
+                            # Sin fin de línea a la vista: es basura, no esperar a que llegue uno
+                            self._procesar_linea_balanza(bytes(buffer))  # Cuenta como rechazada
+                            buffer.clear()
+                        return
+                    linea = bytes(buffer[:fin])
+                    del buffer[:fin + 1]
+                    self._procesar_linea_balanza(linea)
+
+            self._loop.add_reader(ser.fileno(), leer)
+            try:
+                await cerrado.wait()
+            finally:
+                if not cerrado.is_set():
+                    self._loop.remove_reader(ser.fileno())
+                ser.close()
+            await asyncio.sleep(enlace.fallo("puerto serie cerrado"))
+
+    def subscribe_async(self, maxsize=COLA_SUSCRIPCION):
+        """Suscripción consumible con `async for`; debe llamarse dentro del event loop"""
+        sub = SuscripcionAsync(self, maxsize)
+        with self.lock:
+            self._suscripciones = self._suscripciones + (sub,)
+        return sub
+
+    def start(self):
+        # Compatibilidad con el SensorManager clásico: el loop corre en un hilo propio
+        hilo = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        hilo.start()
+
+    def stop(self):
+        super().stop()
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._parar.set)
@@ -1,78 +1,495 @@
 import threading
-import json
+import queue
 import time
+import random
+from operator import attrgetter
+from array import array
 import serial
 import paho.mqtt.client as mqtt
+from balanza import ParserBalanza, MAX_TRAMA
+from payload import DecodificadorPayload
+from instrumentacion import contador, histograma
+from canales import VALORES_INICIALES, COLUMNAS_NUMERICAS, FUENTE_CAMPO, compilar_extractor
 
 # Configuración
 MQTT_BROKER = "localhost"
 MQTT_TOPIC = "secador/datos"
 SERIAL_PORT = "/dev/ttyUSB0"
 SERIAL_BAUD = 9600
+COLA_SUSCRIPCION = 256  # Muestras pendientes por consumidor antes de descartar las viejas
+
+# Los campos de la Lectura, el historial y las columnas del CSV salen del registro de canales
+CAMPOS = tuple(VALORES_INICIALES)
+COLUMNAS_HISTORIAL = COLUMNAS_NUMERICAS
+
+# Historial en memoria: una columna float64 por canal, preasignada
+HISTORIAL_HORAS = 24
+HISTORIAL_RESOLUCION_S = 1.0  # Actualizaciones más seguidas sobrescriben la última fila
+
+# Supervisión de enlaces: reintentos con espera exponencial y vigencia de los datos
+RECONEXION_MIN_S = 0.5
+RECONEXION_MAX_S = 30.0
+VIGENCIA_S = {"mqtt": 10.0, "serial": 5.0}  # Sin datos por más tiempo, sus campos se consideran viejos
+VENTANA_TASA_S = 10.0
+
+
+class Lectura:
+    """Foto inmutable de todos los sensores.
+
+    Nunca se modifica: cada actualización publica una Lectura nueva con la
+    versión incrementada, así los lectores la usan sin lock ni copias.
+    Admite acceso tipo diccionario (lectura["masa_g"]) por compatibilidad.
+    """
+    __slots__ = ("version",) + CAMPOS
+
+    def __init__(self, version, valores):
+        object.__setattr__(self, "version", version)
+        for campo in CAMPOS:
+            object.__setattr__(self, campo, valores[campo])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Lectura es inmutable")
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key):
+        if key not in VALORES_INICIALES:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in VALORES_INICIALES else default
+
+    def as_dict(self):
+        return dict(zip(CAMPOS, _valores_lectura(self)))
+
+    def actualizar(self, campos):
+        """Devuelve una Lectura nueva con los campos cambiados y la versión siguiente"""
+        valores = list(_valores_lectura(self))
+        for key, value in campos.items():
+            i = _INDICE_CAMPO.get(key)
+            if i is not None:
+                # Las listas del JSON se congelan para que nadie pueda mutarlas después
+                valores[i] = tuple(value) if isinstance(value, list) else value
+        # Sin pasar por __init__: los descriptores de los slots se llaman directo, sin dict intermedio
+        nueva = object.__new__(Lectura)
+        _poner_version(nueva, self.version + 1)
+        for poner, valor in zip(_PONER_CAMPO, valores):
+            poner(nueva, valor)
+        return nueva
+
+    def __repr__(self):
+        return f"Lectura(version={self.version}, {self.as_dict()!r})"
+
+
+_valores_lectura = attrgetter(*CAMPOS)  # Todos los campos de una Lectura en una sola llamada
+_INDICE_CAMPO = {campo: i for i, campo in enumerate(CAMPOS)}
+_poner_version = Lectura.version.__set__
+_PONER_CAMPO = tuple(getattr(Lectura, campo).__set__ for campo in CAMPOS)
+
+
+class Muestra:
+    """Actualización individual de un sensor (un mensaje MQTT o una línea de la balanza)"""
+    __slots__ = ("seq", "origen", "t", "campos", "dispositivo")
+
+    def __init__(self, seq, origen, t, campos, dispositivo=None):
+        self.seq = seq          # Versión de la Lectura que produjo esta actualización
+        self.origen = origen    # "mqtt" o "serial"
+        self.t = t              # time.time() al recibir el dato
+        self.campos = campos    # Solo las claves que cambiaron en esta actualización
+        self.dispositivo = dispositivo  # Secador de origen (secadores.py); None con un solo secador
+
+    def __repr__(self):
+        return f"Muestra(seq={self.seq}, origen={self.origen!r}, campos={self.campos!r})"
+
+
+class Suscripcion:
+    """Cola acotada de muestras para un consumidor.
+
+    Si el consumidor se atrasa se descartan las muestras más viejas, así el hilo
+    de MQTT o el de la balanza nunca se bloquean esperando a nadie.
+    """
+
+    def __init__(self, manager, maxsize=COLA_SUSCRIPCION, callback=None):
+        self._manager = manager
+        self._cola = queue.Queue(maxsize)
+        self.descartadas = 0
+        self.activa = True
+        self._hilo = None
+        if callback is not None:
+            # El callback corre en su propio hilo para no frenar al productor
+            self._hilo = threading.Thread(target=self._despachar, args=(callback,), daemon=True)
+            self._hilo.start()
+
+    def _entregar(self, muestra):
+        while True:
+            try:
+                self._cola.put_nowait(muestra)
+                return
+            except queue.Full:
+                try:
+                    self._cola.get_nowait()
+                    self.descartadas += 1
+                except queue.Empty:
+                    pass
+
+    def _despachar(self, callback):
+        while self.activa:
+            muestra = self.get(timeout=0.5)
+            if muestra is not None:
+                callback(muestra)
+
+    def get(self, timeout=None):
+        """Espera la siguiente muestra; devuelve None si se agota el timeout"""
+        try:
+            return self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        """Devuelve todas las muestras pendientes sin esperar"""
+        pendientes = []
+        while True:
+            try:
+                pendientes.append(self._cola.get_nowait())
+            except queue.Empty:
+                return pendientes
+
+    def __iter__(self):
+        while self.activa:
+            muestra = self.get(timeout=0.5)
+            if muestra is not None:
+                yield muestra
+
+    def close(self):
+        self.activa = False
+        self._manager.unsubscribe(self)
+
+
+# Valores numéricos de una Lectura en el orden de COLUMNAS_HISTORIAL
+valores_canales = compilar_extractor(numerico=True)
+
+
+class Historial:
+    """Buffer circular columnar de las últimas horas de cada canal.
+
+    Se reserva todo al crearlo (horas * 3600 / resolucion_s filas), así la
+    memoria no crece aunque el secado dure días. agregar() es O(1) y
+    ventana() devuelve memoryviews sobre los arrays, sin copiar.
+
+    Las filas se espacian y se buscan sobre time.monotonic() (columna "mono"):
+    la Raspberry no tiene RTC y el reloj de pared salta cuando sincroniza NTP.
+    La columna "t" (time.time()) queda solo como etiqueta de cada fila.
+    """
+
+    def __init__(self, horas=HISTORIAL_HORAS, resolucion_s=HISTORIAL_RESOLUCION_S):
+        self.resolucion_s = resolucion_s
+        self.capacidad = max(1, int(horas * 3600 / resolucion_s))
+        self.t = array('d', [0.0]) * self.capacidad
+        self.mono = array('d', [0.0]) * self.capacidad
+        self.columnas = {nombre: array('d', [0.0]) * self.capacidad for nombre in COLUMNAS_HISTORIAL}
+        self._orden = [self.columnas[nombre] for nombre in COLUMNAS_HISTORIAL]
+        self.columnas["t"] = self.t
+        self.columnas["mono"] = self.mono
+        self._total = 0  # Filas agregadas desde el inicio (no se reinicia al dar la vuelta)
+
+    def __len__(self):
+        return min(self._total, self.capacidad)
+
+    def agregar(self, lectura, t, fila=None, mono=None):
+        """Guarda una Lectura; lo llama un solo escritor a la vez (SensorManager.lock).
+
+        `t` es la hora de pared (etiqueta), `mono` el time.monotonic() del dato y
+        `fila` los valores_canales(lectura) ya calculados fuera del lock.
+        """
+        if mono is None:
+            mono = time.monotonic()
+        if self._total and mono - self.mono[(self._total - 1) % self.capacidad] < self.resolucion_s:
+            i = (self._total - 1) % self.capacidad  # Dentro de la resolución: pisa la última fila
+        else:
+            i = self._total % self.capacidad
+            self._total += 1
+            self.mono[i] = mono
+        self.t[i] = t
+        for columna, valor in zip(self._orden, fila or valores_canales(lectura)):
+            columna[i] = valor
+
+    def _inicio_desde(self, mono_min):
+        # Búsqueda binaria sobre el orden lógico (más vieja -> más nueva) del anillo;
+        # el reloj monótono nunca retrocede, así el arreglo siempre está ordenado
+        n = len(self)
+        base = self._total - n
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.mono[(base + mid) % self.capacidad] < mono_min:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def ventana(self, canal, segundos=None):
+        """Tramos (memoryview) del canal en orden cronológico; uno o dos si el anillo dio la vuelta.
+
+        Con segundos se limita a las filas de los últimos `segundos`. Usa canal "t"
+        para la hora de pared (time.time()) de cada fila y "mono" para calcular duraciones.
+        """
+        n = len(self)
+        if segundos is not None and n:
+            ultimo = self.mono[(self._total - 1) % self.capacidad]
+            desde = self._inicio_desde(ultimo - segundos)
+        else:
+            desde = 0
+        inicio = (self._total - n + desde) % self.capacidad
+        cantidad = n - desde
+        vista = memoryview(self.columnas[canal])
+        if inicio + cantidad <= self.capacidad:
+            return (vista[inicio:inicio + cantidad],)
+        return (vista[inicio:], vista[:inicio + cantidad - self.capacidad])
+
+    def ultimo(self, canal):
+        if not self._total:
+            return None
+        return self.columnas[canal][(self._total - 1) % self.capacidad]
+
+    def tasa_por_minuto(self, canal, segundos=60.0):
+        """Cambio del canal por minuto en la ventana (p. ej. pérdida de masa en g/min)"""
+        tramos_t = self.ventana("mono", segundos)
+        tramos_v = self.ventana(canal, segundos)
+        if sum(len(tr) for tr in tramos_t) < 2:
+            return 0.0
+        t0, t1 = tramos_t[0][0], tramos_t[-1][-1]
+        if t1 <= t0:
+            return 0.0
+        return (tramos_v[-1][-1] - tramos_v[0][0]) / (t1 - t0) * 60.0
+
+
+class EstadoEnlace:
+    """Ciclo de vida y salud de un enlace (MQTT o balanza)"""
+
+    def __init__(self, nombre, vigencia_s):
+        self.nombre = nombre
+        self.vigencia_s = vigencia_s
+        self.estado = "desconectado"
+        self.mensajes = 0
+        self.errores = 0
+        self.reconexiones = 0
+        self.ultimo_error = ""
+        self.ultimo_dato = None  # time.monotonic() del último dato recibido
+        self._espera = RECONEXION_MIN_S
+        self._t_ventana = time.monotonic()
+        self._n_ventana = 0
+
+    def conectado(self):
+        if self.estado != "conectado":
+            self.reconexiones += 1
+        self.estado = "conectado"
+        self._espera = RECONEXION_MIN_S
+
+    def fallo(self, error=""):
+        """Registra una caída o un intento fallido; devuelve cuánto esperar antes de reintentar"""
+        self.estado = "desconectado"
+        self.errores += 1
+        self.ultimo_error = str(error)
+        espera = self._espera
+        self._espera = min(self._espera * 2, RECONEXION_MAX_S)
+        # Algo de jitter para no reintentar todos al mismo tiempo tras un corte
+        return espera * random.uniform(0.8, 1.2)
+
+    def dato(self):
+        self.mensajes += 1
+        self.ultimo_dato = time.monotonic()
+
+    def edad(self):
+        """Segundos desde el último dato (None si nunca llegó nada)"""
+        if self.ultimo_dato is None:
+            return None
+        return time.monotonic() - self.ultimo_dato
+
+    def vencido(self):
+        edad = self.edad()
+        return edad is None or edad > self.vigencia_s
+
+    def tasa(self):
+        """Mensajes por segundo en la ventana actual"""
+        ahora = time.monotonic()
+        dt = ahora - self._t_ventana
+        tasa = (self.mensajes - self._n_ventana) / dt if dt > 0 else 0.0
+        if dt >= VENTANA_TASA_S:
+            self._t_ventana, self._n_ventana = ahora, self.mensajes
+        return tasa
+
+    def __repr__(self):
+        return (f"EstadoEnlace({self.nombre!r}, {self.estado}, mensajes={self.mensajes}, "
+                f"errores={self.errores}, edad={self.edad()})")
+
+
+class SupervisorEnlaces:
+    """Agrupa los enlaces del SensorManager y sabe qué campo viene de cuál"""
 
-class SensorManager:
     def __init__(self):
-        # Se actualizaron las claves para coincidir con el nuevo JSON del MQTT
-        self.data = {
-            "timestamp_ms": 0,
-            "temp1_C": 0.0,             # Antes temperatura1_C
-            "humedad1_RH": 0.0,
-            "temperatura2_C": 0.0,
-            "humedad2_RH": 0.0,
-            "radiacion_W_m2": 0.0,
-            "termopares_C": [0.0, 0.0, 0.0, 0.0, 0.0, 0.0], # Lista en lugar de variables sueltas
-            "ventiladores": [False, False, False],
-            "masa_g": 0.0,      # Mantenemos esto para el Serial (numérico)
-            "masa_str": "0.00"  # Mantenemos esto para el Serial (texto exacto)
-        }
+        self.enlaces = {nombre: EstadoEnlace(nombre, vigencia) for nombre, vigencia in VIGENCIA_S.items()}
+
+    def __getitem__(self, nombre):
+        return self.enlaces[nombre]
+
+    def dato(self, origen):
+        enlace = self.enlaces.get(origen)
+        if enlace is not None:  # Orígenes sin enlace propio (p. ej. el estado inicial del demonio)
+            enlace.dato()
+
+    def fuente(self, campo):
+        return FUENTE_CAMPO[campo]
+
+    def campos_vencidos(self):
+        """Campos cuyo enlace lleva más de su vigencia sin datos"""
+        callados = {nombre for nombre, enlace in self.enlaces.items() if enlace.vencido()}
+        if not callados:
+            return frozenset()
+        return frozenset(campo for campo, fuente in FUENTE_CAMPO.items() if fuente in callados)
+
+
+# Instrumentos del camino caliente (ver instrumentacion.py); compartidos por todos los managers
+_MQTT_RECHAZADOS = contador("mqtt.rechazados")
+_MQTT_DECODIFICAR = histograma("mqtt.decodificar")  # Su cuenta y tasa son las de los mensajes MQTT
+_LOCK_ESPERA = histograma("lock.espera")
+_SERIAL_LINEAS = contador("serial.lineas")
+_SERIAL_RECHAZADAS = contador("serial.rechazadas")
+_SERIAL_PARSEO = histograma("serial.parseo")
+
+
+class SensorManager:
+    dispositivo = None  # Identificador del secador cuando hay varios (secadores.Dispositivo)
+
+    def __init__(self, historial_horas=HISTORIAL_HORAS, puerto_serie=SERIAL_PORT):
+        # Lectura publicada; solo los escritores toman el lock para reemplazarla
+        self._lectura = Lectura(0, VALORES_INICIALES)
+        self.historial = Historial(historial_horas)
+        self.puerto_serie = puerto_serie
+        self.balanza = ParserBalanza()  # También lleva la cuenta de tramas válidas y rechazadas
+        self.payload = DecodificadorPayload()  # JSON, binario compacto, MessagePack o CBOR del ESP
+        self.enlaces = SupervisorEnlaces()
+        self._mqtt_client = None
         self.running = True
         self.lock = threading.Lock()
+        # Tupla que se reemplaza completa al (des)suscribir, así los productores la recorren sin lock
+        self._suscripciones = ()
 
     def _mqtt_on_message(self, client, userdata, msg):
+        # Solo quedan las claves que existen en nuestro diccionario de datos
+        t0 = time.perf_counter_ns()
+        campos = self.payload.decodificar(msg.payload)
+        _MQTT_DECODIFICAR.registrar_ns(time.perf_counter_ns() - t0)
+        if campos is None:
+            _MQTT_RECHAZADOS.sumar()
+            return
         try:
-            payload = json.loads(msg.payload.decode())
-            with self.lock:
-                # Actualiza solo si la clave existe en nuestro diccionario de datos
-                for key, value in payload.items():
-                    if key in self.data:
-                        self.data[key] = value
-        except json.JSONDecodeError:
-            pass
+            self._aplicar("mqtt", campos)
+        except Exception as e:
+            # Un mensaje raro no puede matar el hilo de paho (corre sin suppress_exceptions):
+            # se descarta y la adquisición sigue con el siguiente
+            self._rechazar_mensaje(e)
+
+    def _rechazar_mensaje(self, error):
+        self.payload.rechazados += 1
+        _MQTT_RECHAZADOS.sumar()
+        self.enlaces["mqtt"].ultimo_error = f"mensaje descartado: {error!r}"
+
+    def _aplicar(self, origen, campos):
+        # La Lectura nueva y su fila del historial se arman fuera del lock; el lock solo
+        # serializa a los escritores (hilo de paho y de la balanza) para el reemplazo final,
+        # que es atómico para los lectores
+        t = time.time()
+        self.enlaces.dato(origen)
+        base = self._lectura
+        lectura = base.actualizar(campos)
+        fila = valores_canales(lectura)
+        t0 = time.perf_counter_ns()
+        with self.lock:
+            _LOCK_ESPERA.registrar_ns(time.perf_counter_ns() - t0)
+            if self._lectura is not base:
+                # El otro escritor publicó mientras tanto: rehacer sobre la suya para no pisarla
+                lectura = self._lectura.actualizar(campos)
+                fila = valores_canales(lectura)
+            self._lectura = lectura
+            self.historial.agregar(lectura, t, fila)
+        # Fuera del lock: entregar nunca bloquea, a lo sumo descarta en la cola del consumidor
+        self._publicar(Muestra(lectura.version, origen, t, campos, self.dispositivo))
+
+    def _publicar(self, muestra):
+        for sub in self._suscripciones:
+            sub._entregar(muestra)
+
+    def _mqtt_on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self.enlaces["mqtt"].fallo(mqtt.connack_string(rc))
+            return
+        self.enlaces["mqtt"].conectado()
+        # Suscribirse aquí para que también aplique tras cada reconexión
+        client.subscribe(MQTT_TOPIC)
+
+    def _mqtt_on_disconnect(self, client, userdata, rc):
+        if rc != 0:
+            self.enlaces["mqtt"].fallo(mqtt.error_string(rc))
+
+    def _mqtt_on_connect_fail(self, client, userdata):
+        self.enlaces["mqtt"].fallo("no se pudo conectar al broker")
 
     def _start_mqtt(self):
         client = mqtt.Client()
         client.on_message = self._mqtt_on_message
-        try:
-            client.connect(MQTT_BROKER, 1883, 60)
-            client.subscribe(MQTT_TOPIC)
-            client.loop_start()
-        except Exception:
-            pass
+        client.on_connect = self._mqtt_on_connect
+        client.on_disconnect = self._mqtt_on_disconnect
+        client.on_connect_fail = self._mqtt_on_connect_fail
+        # connect_async + loop_start: el hilo de paho reintenta solo, aunque el broker
+        # no esté arriba al arrancar, con espera exponencial entre intentos
+        client.reconnect_delay_set(min_delay=max(1, int(RECONEXION_MIN_S)), max_delay=int(RECONEXION_MAX_S))
+        self.enlaces["mqtt"].estado = "conectando"
+        client.connect_async(MQTT_BROKER, 1883, 60)
+        client.loop_start()
+        self._mqtt_client = client
 
     def _start_serial(self):
         while self.running:
+            enlace = self.enlaces["serial"]
             try:
-                with serial.Serial(SERIAL_PORT, SERIAL_BAUD, timeout=1) as ser:
+                enlace.estado = "conectando"
+                with serial.Serial(self.puerto_serie, SERIAL_BAUD, timeout=1) as ser:
+                    enlace.conectado()
+                    pendiente = b""
                     while self.running:
-                        # Leemos la línea tal cual
-                        raw_line = ser.readline().decode('utf-8', errors='ignore').strip()
-                        if raw_line:
-                            # Limpiamos solo la unidad 'g' o espacios, pero mantenemos el punto decimal
-                            val_str = raw_line.lower().replace('g', '').strip()
-                            
-                            with self.lock:
-                                # 1. Guardamos la versión EXACTA como texto para el CSV
-                                self.data["masa_str"] = val_str
-                                
-                                # 2. Intentamos convertir a float solo para el monitor (gráficas)
-                                try:
-                                    # Reemplazamos coma por punto por si la balanza envía comas
-                                    val_float = float(val_str.replace(',', '.'))
-                                    self.data["masa_g"] = val_float
-                                except ValueError:
-                                    pass # Si falla la conversión, mantenemos el último valor válido
-            except Exception:
-                time.sleep(1)
+                        raw = ser.readline()
+                        if not raw.endswith(b"\n"):
+                            # Se venció el timeout a mitad de línea: completarla en la próxima lectura
+                            # en vez de procesar un pedazo (origen de valores como ".98   0.799")
+                            pendiente += raw
+                            if len(pendiente) > MAX_TRAMA:
+                                self.balanza.parsear(pendiente)  # Cuenta como rechazada
+                                _SERIAL_RECHAZADAS.sumar()
+                                pendiente = b""
+                            continue
+                        self._procesar_linea_balanza(pendiente + raw)
+                        pendiente = b""
+            except Exception as e:
+                time.sleep(enlace.fallo(e))
+
+    def _procesar_linea_balanza(self, raw):
+        # Todo el parseo ocurre fuera del lock; _aplicar solo lo toma para publicar
+        rechazadas = self.balanza.rechazadas
+        t0 = time.perf_counter_ns()
+        lectura = self.balanza.parsear(raw)
+        _SERIAL_PARSEO.registrar_ns(time.perf_counter_ns() - t0)
+        _SERIAL_LINEAS.sumar()
+        if lectura is None:
+            if self.balanza.rechazadas != rechazadas:
+                _SERIAL_RECHAZADAS.sumar()
+            return  # Línea vacía o trama inválida: se mantiene el último valor válido
+        self._aplicar("serial", {
+            "masa_str": lectura.texto,   # Versión EXACTA como texto para el CSV
+            "masa_g": lectura.valor,     # Numérica para el monitor (gráficas)
+            "masa_estable": lectura.estable,
+            "masa_unidad": lectura.unidad,
+        })
 
     def start(self):
         self._start_mqtt()
@@ -80,9 +497,36 @@ class SensorManager:
         serial_thread.start()
 
     def get_data(self):
+        # Sin lock ni copia: la Lectura publicada es inmutable
+        return self._lectura
+
+    def campos_vencidos(self):
+        """Campos cuyo enlace dejó de mandar datos; su valor en get_data() está congelado"""
+        return self.enlaces.campos_vencidos()
+
+    def get_version(self):
+        """Versión de la última Lectura; sirve para saltar trabajo si nada cambió"""
+        return self._lectura.version
+
+    def subscribe(self, maxsize=COLA_SUSCRIPCION, callback=None):
+        """Registra un consumidor de muestras.
+
+        Sin callback se consume con get()/drain() o iterando la suscripción;
+        con callback, éste se llama desde un hilo propio por cada muestra.
+        """
+        sub = Suscripcion(self, maxsize, callback)
+        with self.lock:
+            self._suscripciones = self._suscripciones + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
         with self.lock:
-            # Devuelve una copia para evitar condiciones de carrera al leer
-            return self.data.copy()
+            self._suscripciones = tuple(s for s in self._suscripciones if s is not sub)
 
     def stop(self):
         self.running = False
+        if self._mqtt_client is not None:
+            self._mqtt_client.loop_stop()
+            self._mqtt_client.disconnect()
+        for sub in self._suscripciones:
+            sub.close()
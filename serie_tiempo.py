@@ -0,0 +1,272 @@
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from canales import CANALES, compilar_extractor
+
+# Almacén de series de tiempo para capturas largas (SQLite, un archivo por captura).
+#
+# Además de las muestras crudas mantiene resúmenes min/media/max por canal cada
+# 10 s, 1 min y 10 min, actualizados mientras se escribe. Una consulta por rango
+# elige la resolución más fina que no pase de `max_puntos` filas, así que
+# graficar una semana lee unos cientos de filas de resumen en lugar de todo lo crudo.
+EXTENSION = ".serie.sqlite"
+NIVELES = (("10s", 10), ("1min", 60), ("10min", 600))  # (nombre, segundos por cubeta)
+MAX_PUNTOS = 2000
+CRUDO = "crudo"
+
+CANALES_SERIE = tuple(canal.nombre for canal in CANALES)
+_valores = compilar_extractor(numerico=True)
+_CLAVES = tuple(canal.clave for canal in CANALES)
+
+
+def _tabla(nivel):
+    return CRUDO if nivel == CRUDO else f"resumen_{nivel}"
+
+
+class _Cubeta:
+    """Acumulador min/suma/max de todos los canales para una cubeta abierta"""
+    __slots__ = ("inicio_ms", "n", "minimos", "maximos", "sumas", "cuentas")
+
+    def __init__(self, inicio_ms):
+        k = len(CANALES_SERIE)
+        self.inicio_ms = inicio_ms
+        self.n = 0
+        self.minimos = [math.inf] * k
+        self.maximos = [-math.inf] * k
+        self.sumas = [0.0] * k
+        self.cuentas = [0] * k
+
+    def agregar(self, valores):
+        self.n += 1
+        for i, v in enumerate(valores):
+            if v is None:
+                continue
+            if v < self.minimos[i]:
+                self.minimos[i] = v
+            if v > self.maximos[i]:
+                self.maximos[i] = v
+            self.sumas[i] += v
+            self.cuentas[i] += 1
+
+    def fila(self):
+        fila = [self.inicio_ms, self.n]
+        for i in range(len(CANALES_SERIE)):
+            if self.cuentas[i]:
+                fila += [self.minimos[i], self.sumas[i] / self.cuentas[i], self.maximos[i]]
+            else:
+                fila += [None, None, None]
+        return fila
+
+
+def _conectar(ruta):
+    db = sqlite3.connect(ruta)
+    # WAL: un lector (p. ej. un gráfico) puede consultar mientras el logger escribe
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class AlmacenSerie:
+    """Escritor del almacén; misma interfaz que EscritorCSV/EscritorBinario (escribir/checkpoint/close)"""
+
+    def __init__(self, ruta, metadatos, flush_cada_s=2.0, flush_cada_filas=100):
+        self.flush_cada_s = flush_cada_s
+        self.flush_cada_filas = flush_cada_filas
+        self.db = _conectar(ruta)
+        columnas = ", ".join(f"{c} REAL" for c in CANALES_SERIE)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {CRUDO} (t_ms INTEGER PRIMARY KEY, {columnas})")
+        for nivel, _ in NIVELES:
+            columnas = ", ".join(f"{c}_min REAL, {c}_media REAL, {c}_max REAL" for c in CANALES_SERIE)
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {_tabla(nivel)} (t_ms INTEGER PRIMARY KEY, n INTEGER, {columnas})")
+        self.db.execute("CREATE TABLE IF NOT EXISTS metadatos (clave TEXT PRIMARY KEY, valor TEXT)")
+        self.db.executemany("INSERT OR REPLACE INTO metadatos VALUES (?, ?)",
+                            [(k, str(v)) for k, v in metadatos.items()])
+        self.db.commit()
+        marcas = ", ".join("?" * (len(CANALES_SERIE) + 1))
+        self._sql_crudo = f"INSERT OR REPLACE INTO {CRUDO} VALUES ({marcas})"
+        marcas = ", ".join("?" * (3 * len(CANALES_SERIE) + 2))
+        self._sql_resumen = {nivel: f"INSERT OR REPLACE INTO {_tabla(nivel)} VALUES ({marcas})"
+                             for nivel, _ in NIVELES}
+        self._sql_cubeta = f"SELECT {', '.join(CANALES_SERIE)} FROM {CRUDO} WHERE t_ms >= ? AND t_ms < ?"
+        self._abiertas = {nivel: None for nivel, _ in NIVELES}
+        self._crudas = []
+        self._cerradas = {nivel: [] for nivel, _ in NIVELES}
+        self.pendientes = 0
+        self.checkpoints = 0
+        self._ultimo_checkpoint = time.monotonic()
+
+    def escribir(self, now, d, vencidos=frozenset()):
+        t_ms = int(now.timestamp() * 1000)
+        valores = _valores(d)
+        if vencidos:
+            # Enlace caído: hueco (NULL) en lugar del último valor congelado
+            valores = tuple(None if clave in vencidos else v for clave, v in zip(_CLAVES, valores))
+        self._crudas.append((t_ms, *valores))
+        for nivel, paso in NIVELES:
+            inicio = t_ms - t_ms % (paso * 1000)
+            cubeta = self._abiertas[nivel]
+            if cubeta is None or cubeta.inicio_ms != inicio:
+                if cubeta is not None:
+                    self._cerradas[nivel].append(cubeta.fila())
+                    cubeta = _Cubeta(inicio)
+                else:
+                    cubeta = self._primera_cubeta(inicio, paso)
+                self._abiertas[nivel] = cubeta
+            cubeta.agregar(valores)
+        self.pendientes += 1
+        self.checkpoint_si_vence()
+
+    def _primera_cubeta(self, inicio, paso):
+        """Primera cubeta de la sesión. Al reanudar una captura puede tener muestras de antes
+        del corte: se rearma desde lo crudo guardado para que al reemplazar la fila del resumen
+        no se pierdan (lo crudo y los resúmenes se guardan en el mismo checkpoint)"""
+        cubeta = _Cubeta(inicio)
+        for valores in self.db.execute(self._sql_cubeta, (inicio, inicio + paso * 1000)):
+            cubeta.agregar(valores)
+        return cubeta
+
+    def checkpoint_si_vence(self):
+        if self.pendientes and (self.pendientes >= self.flush_cada_filas
+                                or time.monotonic() - self._ultimo_checkpoint >= self.flush_cada_s):
+            self.checkpoint()
+
+    def checkpoint(self):
+        with self.db:
+            self.db.executemany(self._sql_crudo, self._crudas)
+            for nivel, _ in NIVELES:
+                filas = self._cerradas[nivel]
+                # La cubeta abierta también se guarda (parcial): se reemplaza al cerrarse
+                if self._abiertas[nivel] is not None:
+                    filas.append(self._abiertas[nivel].fila())
+                self.db.executemany(self._sql_resumen[nivel], filas)
+                filas.clear()
+        self._crudas.clear()
+        self.pendientes = 0
+        self.checkpoints += 1
+        self._ultimo_checkpoint = time.monotonic()
+
+    def close(self):
+        if self.db is None:
+            return
+        self.checkpoint()
+        self.db.close()
+        self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LectorSerie:
+    """Consultas por rango sobre un almacén (se puede abrir mientras el logger escribe)"""
+
+    def __init__(self, ruta):
+        self.db = _conectar(ruta)
+        self.metadatos = dict(self.db.execute("SELECT clave, valor FROM metadatos"))
+        try:
+            self.intervalo_s = float(self.metadatos.get("intervalo_s", 1.0))
+        except ValueError:
+            self.intervalo_s = 1.0
+
+    def extremos(self):
+        """(primer t_ms, último t_ms) de las muestras crudas, o (None, None)"""
+        # Dos consultas separadas: juntas, SQLite recorre toda la tabla en lugar de usar la clave
+        primero = self.db.execute(f"SELECT MIN(t_ms) FROM {CRUDO}").fetchone()[0]
+        ultimo = self.db.execute(f"SELECT MAX(t_ms) FROM {CRUDO}").fetchone()[0]
+        return primero, ultimo
+
+    def resolucion(self, desde_ms, hasta_ms, max_puntos=MAX_PUNTOS):
+        """Nivel más fino que devuelve como mucho max_puntos filas para el rango"""
+        rango_s = max(hasta_ms - desde_ms, 0) / 1000
+        if rango_s / self.intervalo_s <= max_puntos:
+            return CRUDO
+        for nivel, paso in NIVELES:
+            if rango_s / paso <= max_puntos:
+                return nivel
+        return NIVELES[-1][0]
+
+    def consultar(self, desde_ms=None, hasta_ms=None, canales=None, max_puntos=MAX_PUNTOS, nivel=None):
+        """Devuelve (nivel, columnas, filas) del rango [desde_ms, hasta_ms].
+
+        En crudo las columnas son t_ms y cada canal; en un resumen, t_ms (inicio de
+        la cubeta), n y <canal>_min/_media/_max.
+        """
+        primero, ultimo = self.extremos()
+        if primero is None:
+            return CRUDO, ["t_ms"], []
+        desde_ms = primero if desde_ms is None else desde_ms
+        hasta_ms = ultimo if hasta_ms is None else hasta_ms
+        canales = CANALES_SERIE if canales is None else tuple(canales)
+        for canal in canales:
+            if canal not in CANALES_SERIE:
+                raise ValueError(f"Canal desconocido: {canal!r}")
+        if nivel is None:
+            nivel = self.resolucion(desde_ms, hasta_ms, max_puntos)
+        if nivel == CRUDO:
+            columnas = ["t_ms", *canales]
+            inicio = desde_ms
+        else:
+            columnas = ["t_ms", "n", *(f"{c}_{s}" for c in canales for s in ("min", "media", "max"))]
+            # Incluye la cubeta que contiene a desde_ms
+            paso_ms = dict(NIVELES)[nivel] * 1000
+            inicio = desde_ms - desde_ms % paso_ms
+        filas = self.db.execute(
+            f"SELECT {', '.join(columnas)} FROM {_tabla(nivel)} WHERE t_ms BETWEEN ? AND ? ORDER BY t_ms",
+            (inicio, hasta_ms),
+        ).fetchall()
+        return nivel, columnas, filas
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _a_ms(texto):
+    return int(datetime.fromisoformat(texto).timestamp() * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"Consulta de un almacén {EXTENSION}")
+    parser.add_argument("archivo")
+    parser.add_argument("--desde", help="Inicio, ej. '2026-01-13 12:00'")
+    parser.add_argument("--hasta", help="Fin, ej. '2026-01-14'")
+    parser.add_argument("--canal", action="append", help="Canal a mostrar (repetible; por defecto todos)")
+    parser.add_argument("--puntos", type=int, default=MAX_PUNTOS, help="Máximo de filas a devolver")
+    parser.add_argument("--nivel", choices=[CRUDO, *(n for n, _ in NIVELES)], help="Forzar una resolución")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.archivo):
+        print(f"No existe {args.archivo}")
+        sys.exit(1)
+    with LectorSerie(args.archivo) as lector:
+        t0 = time.perf_counter()
+        try:
+            nivel, columnas, filas = lector.consultar(
+                _a_ms(args.desde) if args.desde else None,
+                _a_ms(args.hasta) if args.hasta else None,
+                args.canal, args.puntos, args.nivel,
+            )
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        ms = (time.perf_counter() - t0) * 1000
+    print(",".join(["fecha", *columnas[1:]]))
+    for t_ms, *resto in filas:
+        fecha = datetime.fromtimestamp(t_ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
+        print(",".join([fecha, *("" if v is None else f"{v:.6g}" for v in resto)]))
+    print(f"# {len(filas)} filas, nivel {nivel}, {ms:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
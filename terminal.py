@@ -0,0 +1,192 @@
+import os
+import subprocess
+import sys
+import time
+from rich.color import ColorSystem
+from rich.console import Console
+from instrumentacion import contador
+
+# Control del redibujado del monitor.
+#
+# RitmoDibujo decide cuándo dibujar: enseguida al llegar datos pero nunca más de
+# max_fps cuadros por segundo, y sin datos despierta cada vez menos (1 s, 2 s, 4 s...)
+# hasta ESPERA_MAX_S, que sigue siendo menos que la vigencia de los enlaces.
+#
+# TerminalDiferencial es un reemplazo de rich.live.Live para SSH por Wi-Fi débil:
+# guarda el cuadro anterior y de cada línea manda solo el tramo que cambió, con 16 colores.
+MAX_FPS = 4.0
+MAX_FPS_SSH = 1.0
+ESPERA_MIN_S = 1.0
+ESPERA_MAX_S = 4.0
+SALTO_MAX = 12  # Bytes iguales que conviene reenviar en vez de reposicionar el cursor (~8 bytes)
+VISIBILIDAD_CADA_S = 5.0  # Consultar a tmux cuesta un proceso: no más seguido que esto
+
+_BYTES = contador("monitor.bytes")  # Lo que se manda a la terminal (con TerminalDiferencial)
+
+
+class RitmoDibujo:
+    """Cuánto esperar datos y cuándo se puede dibujar el próximo cuadro"""
+
+    def __init__(self, max_fps=MAX_FPS, espera_min=ESPERA_MIN_S, espera_max=ESPERA_MAX_S):
+        self.periodo = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.espera_min = espera_min
+        self.espera_max = max(espera_min, espera_max)
+        self._espera = espera_min
+        self._ultimo = 0.0
+
+    def espera(self):
+        """Timeout para esperar la próxima muestra"""
+        return self._espera
+
+    def dato(self):
+        self._espera = self.espera_min
+
+    def inactivo(self):
+        # Sin datos: despertar cada vez menos, solo para notar enlaces que se callaron
+        self._espera = min(self._espera * 2, self.espera_max)
+
+    def hasta_proximo_cuadro(self):
+        """Segundos que faltan para respetar max_fps (0 si ya se puede dibujar)"""
+        return max(0.0, self._ultimo + self.periodo - time.monotonic())
+
+    def dibujado(self):
+        self._ultimo = time.monotonic()
+
+
+class Visibilidad:
+    """¿Alguien está mirando? Falso si el monitor quedó en segundo plano (Ctrl+Z, bg)
+    o en una sesión de tmux sin clientes conectados."""
+
+    def __init__(self, archivo=None):
+        archivo = archivo or sys.stdout
+        self._fd = archivo.fileno() if archivo.isatty() else None
+        self._tmux = bool(os.environ.get("TMUX"))
+        self._visible = True
+        self._ultima = 0.0
+
+    def _tmux_conectado(self):
+        try:
+            salida = subprocess.run(["tmux", "display-message", "-p", "#{session_attached}"],
+                                    capture_output=True, text=True, timeout=1)
+        except (OSError, subprocess.SubprocessError):
+            self._tmux = False  # tmux no responde: no volver a preguntar
+            return True
+        return salida.stdout.strip() not in ("0", "")
+
+    def __call__(self):
+        if self._fd is None:
+            return True
+        try:
+            if os.tcgetpgrp(self._fd) != os.getpgrp():
+                return False
+        except OSError:
+            return True
+        if self._tmux:
+            ahora = time.monotonic()
+            if ahora - self._ultima >= VISIBILIDAD_CADA_S:
+                self._ultima = ahora
+                self._visible = self._tmux_conectado()
+            return self._visible
+        return True
+
+
+def en_ssh():
+    return bool(os.environ.get("SSH_CONNECTION") or os.environ.get("SSH_TTY"))
+
+
+class TerminalDiferencial:
+    """Como Live(auto_refresh=False, screen=True), pero refresh() solo manda las líneas que cambiaron"""
+
+    def __init__(self, renderable, console=None, color_system=ColorSystem.STANDARD):
+        self.renderable = renderable
+        self.console = console or Console()
+        self.color_system = color_system
+        self._previas = []
+        self._tamano = None
+
+    def __enter__(self):
+        self._escribir("\x1b[?1049h\x1b[?25l\x1b[2J")  # Pantalla alternativa, sin cursor
+        return self
+
+    def __exit__(self, *exc):
+        self._escribir("\x1b[0m\x1b[?25h\x1b[?1049l")
+
+    def _escribir(self, texto):
+        datos = texto.encode("utf-8")
+        _BYTES.sumar(len(datos))
+        archivo = self.console.file
+        if hasattr(archivo, "buffer"):
+            archivo.buffer.write(datos)
+        else:
+            archivo.write(texto)
+        archivo.flush()
+
+    def _linea(self, segmentos):
+        # Tupla de (texto con sus códigos de color, columnas que ocupa) por tramo de igual estilo
+        partes = []
+        for segmento in segmentos:
+            if segmento.control:
+                continue
+            if segmento.style:
+                texto = segmento.style.render(segmento.text, color_system=self.color_system)
+            else:
+                texto = segmento.text
+            partes.append((texto, segmento.cell_length))
+        return tuple(partes)
+
+    def render(self):
+        """Líneas del cuadro actual, cada una como tupla de tramos (texto con color, ancho)"""
+        ancho, alto = self.console.size
+        opciones = self.console.options.update_dimensions(ancho, alto)
+        return [self._linea(linea) for linea in self.console.render_lines(self.renderable, opciones, pad=True)]
+
+    def _tramos(self, fila, linea, previa):
+        """Secuencias para pasar de `previa` a `linea` mandando solo los segmentos distintos"""
+        if previa is None or len(previa) != len(linea):
+            # Otra cantidad de segmentos (p. ej. cambió el ancho de una columna): la línea entera
+            return [f"\x1b[{fila};1H{''.join(texto for texto, _ in linea)}\x1b[0m"]
+        tramos = []
+        columna = 1
+        inicio = None  # Columna donde empieza el tramo abierto
+        partes = []
+        pendiente = []  # Segmentos iguales después de un tramo: se mandan solo si hay otro cambio cerca
+        for actual, anterior in zip(linea, previa):
+            texto, ancho = actual
+            if actual != anterior:
+                if inicio is None:
+                    inicio = columna
+                else:
+                    partes.extend(pendiente)
+                pendiente = []
+                partes.append(texto)
+            elif inicio is not None:
+                pendiente.append(texto)
+                # Un hueco largo sale más caro que mover el cursor: cerrar el tramo
+                if sum(map(len, pendiente)) > SALTO_MAX:
+                    tramos.append(f"\x1b[{fila};{inicio}H{''.join(partes)}\x1b[0m")
+                    inicio, partes, pendiente = None, [], []
+            columna += ancho
+        if inicio is not None:
+            tramos.append(f"\x1b[{fila};{inicio}H{''.join(partes)}\x1b[0m")
+        return tramos
+
+    def invalidar(self):
+        """El próximo refresh() redibuja todo (p. ej. al volver a primer plano)"""
+        self._tamano = None
+
+    def refresh(self):
+        tamano = self.console.size
+        lineas = self.render()
+        salida = []
+        if tamano != self._tamano:
+            # Cambió el tamaño de la terminal: todo de nuevo
+            salida.append("\x1b[2J")
+            self._previas = []
+            self._tamano = tamano
+        for i, linea in enumerate(lineas):
+            previa = self._previas[i] if i < len(self._previas) else None
+            if previa != linea:
+                salida.extend(self._tramos(i + 1, linea, previa))
+        self._previas = lineas
+        if salida:
+            self._escribir("".join(salida))